@@ -2,16 +2,18 @@
 from flask_restful import Resource
 from flask import request, jsonify
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
-import os
+from config import Config
 from datetime import datetime, timedelta
-from supabase_client import supabase
+from data_access import execute, table, create_user
 import re
+import uuid
+import auth_cache
+import metrics
+from revocation import get_revocation_store, token_id
+from passwords import PoolSaturated, hash_password, verify_password, needs_rehash
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
-
-TOKEN_BLACKLIST = set()
+JWT_SECRET_KEY = Config.JWT_SECRET_KEY
+JWT_ALGORITHM = Config.JWT_ALGORITHM
 
 # <local-part>@<domain>.<TLD>
 EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -36,24 +38,21 @@ class Register(Resource):
         if not re.match(EMAIL_REGEX, email):
             return {"error": "Invalid email format"}, 400
 
-        # Check if user exists
-        existing_username = supabase.table("users").select("*").eq("username", username).execute()
-        existing_email = supabase.table("users").select("*").eq("email", email).execute()
-        if existing_username.data:
+        # Hash the password before storing it
+        try:
+            with metrics.stage("password_hash"):
+                hashed_password = hash_password(password)
+        except PoolSaturated:
+            return {"error": "Server is busy, please try again shortly"}, 503, {"Retry-After": "1"}
+
+        # Insert new user into Supabase; the unique constraints catch existing users
+        with metrics.stage("metadata_insert"):
+            new_user, taken = create_user(username, email, hashed_password)
+        if "username" in taken:
             return {"error": "Username already exists"}, 409
-        if existing_email.data:
+        if "email" in taken:
             return {"error": "Email already exists"}, 409
 
-        # Hash the password before storing it
-        hashed_password = generate_password_hash(password)
-
-        # Insert new user into Supabase
-        new_user = supabase.table("users").insert({
-            "username": username,
-            "email": email,
-            "password": hashed_password
-        }).execute()
-
         return {"message": "User registered successfully"}, 201
 
 class Login(Resource):
@@ -67,21 +66,34 @@ class Login(Resource):
             return {"error": "Missing required fields"}, 400
 
         #Get user from db
-        user = supabase.table("users").select("*").eq("email", email).execute()
+        with metrics.stage("user_lookup"):
+            user = execute(table("users").select("id, username, email, password").eq("email", email))
         if not user.data:
             return {"error": "User doesn't exist"}, 404
         user = user.data[0]
 
         #Check password
-        if not check_password_hash(user["password"], password):
-            return {"error": "Invalid password"}, 401
+        try:
+            with metrics.stage("password_verify"):
+                verified = verify_password(user["password"], password)
+            if not verified:
+                return {"error": "Invalid password"}, 401
+
+            # Upgrade hashes made with an older method or work factor
+            if needs_rehash(user["password"]):
+                with metrics.stage("password_rehash"):
+                    execute(table("users").update({"password": hash_password(password)}).eq("id", user["id"]))
+        except PoolSaturated:
+            return {"error": "Server is busy, please try again shortly"}, 503, {"Retry-After": "1"}
         
         #Generate token
         payload = {
             "user_id": user["id"],
+            "jti": uuid.uuid4().hex,  # Lets the token be revoked on logout
             "exp": datetime.utcnow() + timedelta(hours=1) #Token expires in 1 hour
         }
-        token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+        with metrics.stage("token_encode"):
+            token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
         return {"token": token, "id": user["id"], "username": user["username"], "email": user["email"]}, 200
 
 
@@ -97,15 +109,18 @@ class Logout(Resource):
         except IndexError:
             return {"error": "Invalid token format"}, 400
         
-        # Decode the token to validate it (optional)
+        # Decode the token to validate it
         try:
-            jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+            with metrics.stage("token_decode"):
+                decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         except jwt.ExpiredSignatureError:
             return {"error": "Token has already expired"}, 401
         except jwt.InvalidTokenError:
             return {"error": "Invalid token"}, 401
 
-        # Add the token to the blacklist
-        TOKEN_BLACKLIST.add(token)
+        # Revoke the token until it would have expired anyway
+        get_revocation_store().revoke(token_id(decoded, token), decoded.get("exp", 0))
+        auth_cache.invalidate_token(token)
+        auth_cache.invalidate_token(auth_header)
 
         return {"message": "Logged out successfully"}, 200
\ No newline at end of file
@@ -1,41 +1,89 @@
 from flask_restful import Resource
-from flask import request, jsonify
+from flask import request, jsonify, redirect, send_file
+from werkzeug.wrappers import Response
+import mimetypes
 import jwt
 from werkzeug.utils import secure_filename
-import os
-import uuid
-from datetime import datetime
-from supabase_client import supabase
-from dotenv import load_dotenv
+import time
+from datetime import datetime, timezone
+from data_access import execute, table
+import sql_reads
+from storage import ObjectReader, StorageError, get_storage
+from blobs import blob_path, file_url, public_url, store_blob, release_blob
+import compression
+import admission
+import auth_cache
+import metrics
+from revocation import get_revocation_store, token_id
+from purge import soft_delete_file
+from usage import QuotaExceeded, check_quota
+import namespace
+from pagination import page_size
+from search import search_files
+from streaming import HashingStream, UploadTooLarge, MalformedUpload, open_upload_stream
+from config import Config
 
-load_dotenv()
-
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
-UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER")
+JWT_SECRET_KEY = Config.JWT_SECRET_KEY
+JWT_ALGORITHM = Config.JWT_ALGORITHM
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit for file uploads
+ALLOWED_EXTENSIONS = {'txt', 'doc', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'csv', 'svg', 'mp4'}
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Ensure the upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def authenticate_token(token):
-    try:
-        decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        user_id = decoded.get("user_id")
-        if not user_id:
-            raise ValueError("Token is missing 'user_id'")
-        return user_id
-    except jwt.ExpiredSignatureError:
-        raise ValueError("Token has expired")
-    except jwt.InvalidTokenError:
-        raise ValueError("Invalid token")
+    with metrics.stage("token_decode"):
+        cached = auth_cache.token_cache.get(token)
+        if cached is not None:
+            user_id, jti = cached
+        else:
+            try:
+                decoded = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+            except jwt.ExpiredSignatureError:
+                raise ValueError("Token has expired")
+            except jwt.InvalidTokenError:
+                raise ValueError("Invalid token")
+            user_id = decoded.get("user_id")
+            if not user_id:
+                raise ValueError("Token is missing 'user_id'")
+            jti = token_id(decoded, token)
+            auth_cache.cache_token(token, (user_id, jti), decoded.get("exp"))
+
+    # Checked on every request, since other workers may have revoked the token
+    with metrics.stage("revocation_check"):
+        revoked = get_revocation_store().is_revoked(jti)
+    if revoked:
+        raise ValueError("Token has been revoked")
+    return user_id
 
 def check_user_permission(user_id):
-    # Check if user_id exists in the 'users' table or any other relevant table
-    result = supabase.table('users').select('id').eq('id', user_id).execute()
-    if result.data:
-        return True
-    return False
+    with metrics.stage("permission_check"):
+        cached = auth_cache.get_cached_user(user_id)
+        if cached is not None:
+            return cached
+        # Check if user_id exists in the 'users' table or any other relevant table
+        if sql_reads.enabled():
+            exists = sql_reads.user_exists(user_id)
+        else:
+            exists = bool(execute(table('users').select('id').eq('id', user_id)).data)
+        auth_cache.cache_user(user_id, exists)
+        return exists
+
+def authenticate_request():
+    """Return the user_id for the request's token.
+
+    Raises ValueError for a missing or invalid token and PermissionError for
+    an unknown user.
+    """
+    token = request.headers.get("Authorization")
+    if not token:
+        raise ValueError("Unauthorized, please provide a token")
+    user_id = authenticate_token(token)
+    if not check_user_permission(user_id):
+        raise PermissionError("User does not have permission to access files")
+    return user_id
 
 class UploadFile(Resource):
     def post(self):
@@ -47,84 +95,260 @@ class UploadFile(Resource):
         try:
             # Authenticate and get the user_id from the token
             user_id = authenticate_token(token)
-            print(f"Authenticated user ID: {user_id}")  # Debug log for user ID
 
             # Check if the user has permission to upload
             if not check_user_permission(user_id):
                 return {"error": "User does not have permission to upload files"}, 403
 
-            # Check if the file part is in the request
-            if 'file' not in request.files:
-                return {"error": "No file part in the request"}, 400
-            
-            file = request.files['file']
-            if file.filename == '':
-                return {"error": "No selected file"}, 400
-            
-            # File size validation
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)  # Reset file pointer after checking size
-            if file_size > MAX_FILE_SIZE:
-                return {"error": f"File size exceeds the {MAX_FILE_SIZE // 1024 // 1024}MB limit"}, 400
-
-            print(f"File size: {file_size} bytes")  # Debug log for file size
-
-            # Save the file locally before uploading to Supabase
-            filename = secure_filename(file.filename)
-            local_file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(local_file_path)
-
-            # Generate a unique file path for Supabase
-            storage_bucket = supabase.storage.from_('uploaded_files')
-            file_path_supabase = f"files/{str(uuid.uuid4())}/{filename}"
-
-            # Upload to Supabase
-            with open(local_file_path, 'rb') as f:
-                upload_response = storage_bucket.upload(file_path_supabase, f)
-                print(f"Upload Response: {upload_response}")  # Debugging the response
-
-                # Check if the upload was successful
-                if hasattr(upload_response, 'status_code') and upload_response.status_code != 200:
-                    return {"error": "Failed to upload file to Supabase"}, 500
+            # One counter lookup, before any bytes are read. A multipart body is
+            # larger than the file it carries, so only a raw body's length counts
+            incoming = None if request.mimetype.startswith("multipart/") else request.content_length
+            try:
+                with metrics.stage("quota_check"):
+                    remaining = check_quota(user_id, incoming)
+            except QuotaExceeded as e:
+                return {"error": str(e)}, 413
+            max_size = MAX_FILE_SIZE if remaining is None else min(MAX_FILE_SIZE, remaining)
+
+            # Turned away before any of the body is read when this worker or the user is over budget
+            try:
+                ticket = admission.uploads.admit(user_id, admission.reservation(request, max_size))
+            except admission.Rejected as e:
+                return {"error": str(e)}, e.status, e.headers()
+
+            with ticket:
+                # Stream the file part straight from the request body
+                upload = open_upload_stream(request)
+                if upload is None:
+                    return {"error": "No file part in the request"}, 400
 
-                if not hasattr(upload_response, 'path'):
+                filename, content_type, chunks = upload
+                filename = secure_filename(filename or '')
+                if filename == '':
+                    return {"error": "No selected file"}, 400
+                if not allowed_file(filename):
+                    return {"error": "Invalid file type"}, 400
+
+                # Size and checksum are computed while the bytes go to Supabase,
+                # and the transfer is aborted as soon as the limit is crossed.
+                # Content already stored by anyone is shared instead of duplicated
+                body = HashingStream(chunks, max_size=max_size)
+                start = time.perf_counter()
+                try:
+                    blob = store_blob(body, content_type, filename)
+                except UploadTooLarge:
+                    if max_size < MAX_FILE_SIZE:
+                        return {"error": "Storage quota exceeded"}, 413
+                    return {"error": f"File size exceeds the {MAX_FILE_SIZE // 1024 // 1024}MB limit"}, 400
+                except MalformedUpload as e:
+                    return {"error": f"Malformed upload: {str(e)}"}, 400
+                except StorageError:
                     return {"error": "Failed to upload file to Supabase"}, 500
+                finally:
+                    # Receiving and sending interleave chunk by chunk; time not
+                    # spent waiting on the client is charged to storage
+                    metrics.observe_stage("body_receive", body.receive_seconds)
+                    metrics.observe_stage("storage_transfer", time.perf_counter() - start - body.receive_seconds)
+                    metrics.count_bytes("in", body.size)
 
-            # Get the public URL of the uploaded file
-            file_url = storage_bucket.get_public_url(file_path_supabase)
-            if not file_url:
-                return {"error": "Failed to retrieve file URL from Supabase"}, 500
+                file_size = body.size
 
-            # Convert datetime objects to ISO 8601 string format
-            current_time = datetime.utcnow().isoformat()
+                # Get the public URL of the uploaded file (none when it is served through the API)
+                storage_path = public_url(blob)
 
-            # Store metadata in the Supabase 'files' table
-            file_metadata = {
-                "file_name": filename,
-                "file_size": file_size,
-                "storage_path": file_url,
-                "user_id": user_id,
-                "folder_id": None,
-                "uploaded_at": current_time,
-                "updated_at": current_time, 
-                "deleted_at": None
-            }
+                # Convert datetime objects to ISO 8601 string format
+                current_time = datetime.utcnow().isoformat()
 
-            # Insert metadata
-            response = supabase.table("files").insert(file_metadata).execute()
-            print(f"Insert Response: {response}")  # Debugging to check the response structure
+                # Store metadata in the Supabase 'files' table
+                file_metadata = {
+                    "file_name": filename,
+                    "file_size": file_size,
+                    "checksum": body.checksum,
+                    "storage_path": storage_path,
+                    "encoding": blob.encoding,
+                    "stored_size": blob.stored_size,
+                    "user_id": user_id,
+                    "folder_id": None,
+                    "uploaded_at": current_time,
+                    "updated_at": current_time, 
+                    "deleted_at": None
+                }
 
-            # Ensure that the response contains 'data' indicating successful insertion
-            if not response or not hasattr(response, 'data') or not response.data:
-                return {"error": "Failed to save metadata to Supabase"}, 500
+                # Insert metadata
+                with metrics.stage("metadata_insert"):
+                    response = execute(table("files").insert(file_metadata))
 
-            # Clean up the local file
-            os.remove(local_file_path)
+                # Ensure that the response contains 'data' indicating successful insertion
+                if not response or not hasattr(response, 'data') or not response.data:
+                    release_blob(body.checksum)
+                    return {"error": "Failed to save metadata to Supabase"}, 500
 
-            return {"message": "File uploaded successfully", "file_url": file_url}, 200
+                file_id = response.data[0].get("id")
+                return {"message": "File uploaded successfully", "id": file_id, "file_url": file_url(file_id, storage_path),
+                        "checksum": body.checksum, "deduplicated": blob.deduplicated,
+                        "stored_size": blob.stored_size}, 200
 
         except ValueError as e:
             return {"error": str(e)}, 401
         except Exception as e:
-            return {"error": f"An error occurred: {str(e)}"}, 500
\ No newline at end of file
+            return {"error": f"An error occurred: {str(e)}"}, 500
+
+class FileItem(Resource):
+    def patch(self, file_id):
+        """Rename a file and/or move it to folder_id (null for the top level); only metadata changes."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        data = request.get_json(silent=True) or {}
+        file_name = data.get("file_name")
+        if file_name is not None:
+            file_name = secure_filename(file_name)
+            if not file_name or not allowed_file(file_name):
+                return {"error": "Invalid file name or type"}, 400
+
+        try:
+            file = namespace.update_file(user_id, file_id, name=file_name, folder_id=data.get("folder_id", namespace.KEEP))
+        except (TypeError, ValueError):
+            return {"error": "Invalid folder id"}, 400
+        except namespace.NotFound as e:
+            return {"error": str(e)}, 404
+        except namespace.NamespaceError as e:
+            return {"error": str(e)}, 400
+        return {"message": "File updated successfully", "file": file}, 200
+
+    def delete(self, file_id):
+        """Soft-delete a file; its storage is reclaimed by the purge worker."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        if not soft_delete_file(user_id, file_id):
+            return {"error": "File not found"}, 404
+        return {"message": "File deleted successfully"}, 202
+
+
+class FileSearch(Resource):
+    def get(self):
+        """Ranked, paginated search of the user's file names (?q=, mode=prefix|substring, folder_id=)."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        try:
+            limit = page_size(request.args.get("limit"))
+        except ValueError:
+            return {"error": "Invalid limit"}, 400
+        try:
+            files, next_cursor = search_files(
+                user_id,
+                request.args.get("q"),
+                mode=request.args.get("mode", "substring"),
+                cursor=request.args.get("cursor"),
+                limit=limit,
+                folder_id=request.args.get("folder_id", type=int),
+            )
+        except KeyError:
+            return {"error": "Invalid cursor"}, 400
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"files": files, "next_cursor": next_cursor}, 200
+
+
+DOWNLOAD_COLUMNS = "id, file_name, file_size, checksum, storage_path, encoding, stored_size, uploaded_at"
+
+
+def _last_modified(value):
+    if not value:
+        return None
+    moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class FileDownload(Resource):
+    def get(self, file_id):
+        """Serve a file's bytes with Range, ETag and conditional GET support."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        with metrics.stage("metadata_query"):
+            if sql_reads.enabled():
+                file = sql_reads.get_file(user_id, file_id, DOWNLOAD_COLUMNS)
+            else:
+                rows = execute(
+                    table("files").select(DOWNLOAD_COLUMNS).eq("id", file_id).eq("user_id", user_id).is_("deleted_at", "null")
+                ).data
+                file = rows[0] if rows else None
+        if not file:
+            return {"error": "File not found"}, 404
+        if not file.get("checksum"):
+            # Uploaded before content addressing, so only the stored URL is known
+            return redirect(file["storage_path"])
+
+        # Blobs are immutable, so the content hash is a strong validator
+        storage = get_storage()
+        encoding = file.get("encoding")
+        key = blob_path(file["checksum"], encoding)
+        mimetype = mimetypes.guess_type(file["file_name"])[0] or "application/octet-stream"
+        as_attachment = request.args.get("download", "").lower() in ("1", "true")
+        last_modified = _last_modified(file.get("uploaded_at"))
+
+        # Gzipped blobs go out as they are stored when the client accepts gzip
+        decode = encoding is not None and not request.accept_encodings[encoding]
+        if decode:
+            # Decompressed as it streams; offsets into the original aren't
+            # known without inflating, so ranges aren't offered
+            response = Response(compression.decode(storage.open(key), encoding), mimetype=mimetype,
+                                direct_passthrough=True)
+            response.content_length = int(file["file_size"])
+            response.set_etag(file["checksum"])
+            response.last_modified = last_modified
+            response.headers.set("Content-Disposition", "attachment" if as_attachment else "inline",
+                                 filename=file["file_name"])
+            response = response.make_conditional(request.environ)
+        else:
+            # Each stored representation has its own ETag, and ranges apply to it
+            etag = f"{file['checksum']}-{encoding}" if encoding else file["checksum"]
+            local_path = storage.local_path(key)
+            if local_path:
+                # The open file goes to the server's wsgi.file_wrapper (sendfile), or
+                # to the front proxy when USE_X_SENDFILE is set, not through Python
+                response = send_file(local_path, mimetype=mimetype, as_attachment=as_attachment,
+                                     download_name=file["file_name"], conditional=True,
+                                     etag=etag, last_modified=last_modified)
+            else:
+                size = int(file["stored_size"] if encoding else file["file_size"])
+                response = Response(ObjectReader(storage, key), mimetype=mimetype, direct_passthrough=True)
+                response.content_length = size
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers.set("Content-Disposition", "attachment" if as_attachment else "inline",
+                                     filename=file["file_name"])
+                response = response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+            if encoding:
+                response.content_encoding = encoding
+                if response.status_code == 200:
+                    compression.record_sent(int(file["file_size"]), response.content_length)
+
+        if encoding:
+            response.vary.add("Accept-Encoding")
+        if response.status_code in (200, 206):
+            metrics.count_bytes("out", response.content_length)
+        # Advertised on full responses too, so players know they can seek
+        response.accept_ranges = "none" if decode else "bytes"
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
@@ -1,258 +1,290 @@
-from flask import Flask, request, jsonify
-import os
-import hashlib
-import time
-from flask_restful import Resource, Api
+from flask import Response, request, jsonify
+from flask_restful import Resource
 from werkzeug.utils import secure_filename
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import current_user, login_required
-from datetime import datetime
-from supabase_client import supabase
+from data_access import execute, table
+import sql_reads
+from Resources.files import authenticate_token, authenticate_request, check_user_permission, allowed_file, MAX_FILE_SIZE
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, page_size
+from batch_upload import validate_files, upload_batch
+from purge import soft_delete_folder
+import admission
+import changes
+import namespace
+import metrics
+from export import folder_entries, stream_zip
+from usage import QuotaExceeded, check_quota, get_folder_usage
+
+# Whole multipart body of a /upload batch
+MAX_BATCH_UPLOAD_SIZE = 25 * 1024 * 1024
 
-app = Flask(__name__)
-api = Api(app)
 
-
-UPLOAD_FOLDER = 'upload/'
-ALLOWED_EXTENSIONS = {'txt', 'doc', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'csv', 'svg', 'mp4'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
-
-STORAGE_DIR = os.path.join(os.getcwd(), 'uploads')
-
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def get_unique_filename(filename):
-    hash_object = hashlib.sha256(filename.encode())
-    timestamp = str(int(time.time()))  # Optional: Append timestamp to ensure uniqueness
-    return f"{timestamp}_{hash_object.hexdigest()}_{filename}"
-
-@app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    
-    files = request.files.getlist('file')
+    """Upload a batch of files sent as multipart 'file' parts."""
+    # Only this endpoint is capped here; resumable parts may be larger
+    request.max_content_length = MAX_BATCH_UPLOAD_SIZE
+    token = request.headers.get("Authorization")
+    if not token:
+        return jsonify({"error": "Unauthorized, please provide a token"}), 401
+    try:
+        user_id = authenticate_token(token)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 401
+    if not check_user_permission(user_id):
+        return jsonify({"error": "User does not have permission to upload files"}), 403
+    try:
+        with metrics.stage("quota_check"):
+            check_quota(user_id)
+    except QuotaExceeded as e:
+        return jsonify({"error": str(e)}), 413
 
-    if not files:
-        return jsonify({"error": "No file selected"}), 400
+    # Turned away before any of the body is read when this worker or the user is over budget
+    try:
+        ticket = admission.uploads.admit(user_id, admission.reservation(request, MAX_BATCH_UPLOAD_SIZE))
+    except admission.Rejected as e:
+        return jsonify({"error": str(e)}), e.status, e.headers()
+
+    with ticket:
+        # Werkzeug parses (and spools) the whole multipart body on first access
+        with metrics.stage("body_receive"):
+            has_files = 'file' in request.files
+        if not has_files:
+            return jsonify({"error": "No file part"}), 400
     
-    filenames = []
+        files = request.files.getlist('file')
 
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-
-    for file in files:
-        if file and allowed_file(file.filename):
-            filename = get_unique_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            file.save(file_path)
-            
-            file_size = os.path.getsize(file_path)
+        if not files:
+            return jsonify({"error": "No file selected"}), 400
 
+        folder_id = request.form.get('folder_id') or None
+        if folder_id is not None:
             try:
-                response = supabase.table('files').insert({
-                    "file_name": filename,
-                    "user_id": current_user.id,
-                    "file_size": file_size,
-                    "storage_path": file_path,
-                    "folder_id": None
-                }).execute()
-
-                if response.status_code == 201:
-                    filenames.append(filename)
-                else:
-                    raise Exception(f"Error inserting file record: {response.error_message}")
-
-            except Exception as e:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return jsonify({"error": f"An error occurred while saving the file: {str(e)}"}), 500
-        else:
-            return jsonify({"error": "Invalid file type or missing file"}), 400
+                folder_id = int(folder_id)
+                namespace.get_folder_row(user_id, folder_id, 'id')
+            except ValueError:
+                return jsonify({"error": "Invalid folder id"}), 400
+            except namespace.NotFound as e:
+                return jsonify({"error": str(e)}), 404
+
+        # Validate everything up front, then transfer concurrently and insert in bulk
+        accepted, rejected = validate_files(files, allowed_file, MAX_FILE_SIZE)
+        metrics.count_bytes("in", sum(size for _, _, _, size in accepted))
+        try:
+            check_quota(user_id, sum(size for _, _, _, size in accepted))
+        except QuotaExceeded as e:
+            return jsonify({"error": str(e)}), 413
+        results = sorted(rejected + upload_batch(accepted, user_id, folder_id, MAX_FILE_SIZE),
+                         key=lambda result: result["index"])
+
+        uploaded = [result for result in results if result["success"]]
+        if len(uploaded) == len(results):
+            return jsonify({"message": "Files uploaded successfully", "files": results}), 200
+        if uploaded:
+            return jsonify({"message": "Some files failed to upload", "files": results}), 207
+        return jsonify({"error": "No files were uploaded", "files": results}), 400
 
-    return jsonify({"message": "Files uploaded successfully", "filenames": filenames}), 200
 
-
-@app.errorhandler(413)
 def file_too_large(error):
     return jsonify({"error": "File is too large, please upload files smaller than 25MB."}), 413
 
 
-if not os.path.exists(STORAGE_DIR):
-    os.makedirs(STORAGE_DIR)
-
-def get_folders():
-    """Returns a list of all folder names."""
-    if not os.path.exists(STORAGE_DIR):
-        return []  
-
-    return [folder for folder in os.listdir(STORAGE_DIR) if os.path.isdir(os.path.join(STORAGE_DIR, folder))]
+FOLDER_COLUMNS = 'id, folder_name, parent_id, created_at, updated_at'
 
-def create_folder(folder_name, user_id=None):
-    """Create a new folder for the user and add it to the Supabase database."""
-    if user_id is None:
-        user_id = current_user.id
+def get_folders(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE, include_counts=False, parent=None):
+    """Return (folders, next_cursor) for one page of the user's folders.
 
-    user_folder_path = os.path.join(STORAGE_DIR, str(user_id), folder_name)
-    
-    if os.path.exists(user_folder_path):
-        return {"success": False, "message": "Folder already exists"}
-
-    try:
-        user_specific_dir = os.path.join(STORAGE_DIR, str(user_id))
-        if not os.path.exists(user_specific_dir):
-            os.makedirs(user_specific_dir) 
-
-        os.makedirs(user_folder_path)
-
-        folder_data = {
-            "folder_name": folder_name,
-            "user_id": user_id,
-            "created_at": datetime.now()
-        }
-
-        response = supabase.table('folders').insert(folder_data).execute()
-
-        if response.status_code == 201:
-            return {"success": True, "message": "Folder created successfully and added to the database"}
+    Keyset pagination on id keeps every page a single indexed range scan, no
+    matter how many folders exist overall. parent limits the page to the
+    children of one folder ('root' for top-level folders).
+    """
+    after = decode_cursor(cursor)['id'] if cursor else None
+    # Fetch one extra row to learn whether another page exists
+    with metrics.stage("metadata_query"):
+        if sql_reads.enabled():
+            folders = sql_reads.list_folders(user_id, FOLDER_COLUMNS, after, limit + 1, parent)
         else:
-            return {"success": False, "message": "Failed to add folder to database"}
-        
-    except OSError as e:
-        return {"success": False, "message": f"Failed to create folder: {str(e)}"}
-    
-
-def update_folder(old_name, new_name):
-    old_path = os.path.join(STORAGE_DIR, old_name)
-    new_path = os.path.join(STORAGE_DIR, new_name)
-
-    if not os.path.exists(old_path):
-        return {"success": False, "message": "Folder not found"}
-    if os.path.exists(new_path):
-        return {"success": False, "message": "New folder name already exists"}
-
+            query = table('folders').select(FOLDER_COLUMNS).eq('user_id', user_id).is_('deleted_at', 'null')
+            if parent == 'root':
+                query = query.is_('parent_id', 'null')
+            elif parent is not None:
+                query = query.eq('parent_id', int(parent))
+            if after is not None:
+                query = query.gt('id', after)
+            folders = execute(query.order('id').limit(limit + 1)).data or []
+
+    next_cursor = None
+    if len(folders) > limit:
+        folders = folders[:limit]
+        next_cursor = encode_cursor({"id": folders[-1]['id']})
+
+    if include_counts and folders:
+        # Maintained counters, so this is one lookup per page rather than a files scan
+        with metrics.stage("usage_query"):
+            usage = get_folder_usage([folder['id'] for folder in folders])
+        for folder in folders:
+            folder['file_count'] = usage[folder['id']]['file_count']
+            folder['bytes_used'] = usage[folder['id']]['bytes_used']
+
+    return folders, next_cursor
+
+def get_folder(user_id, folder_id):
+    if sql_reads.enabled():
+        return sql_reads.get_folder(user_id, int(folder_id), FOLDER_COLUMNS)
+    result = execute(
+        table('folders').select(FOLDER_COLUMNS).eq('id', folder_id).eq('user_id', user_id).is_('deleted_at', 'null')
+    )
+    return result.data[0] if result.data else None
+
+def create_folder(folder_name, user_id, parent_id=None):
+    """Create a folder for the user, optionally inside another of their folders."""
     try:
-        os.rename(old_path, new_path)
-        return {"success": True, "message": "Folder name updated successfully"}
-    except OSError as e:
-        return {"success": False, "message": f"Error renaming folder: {str(e)}"}
-
-def delete_folder(folder_name):
-    """Deletes a folder and its contents."""
-    folder_path = os.path.join(STORAGE_DIR, folder_name)
-
-    if not os.path.exists(folder_path):
-        return {"success": False, "message": "Folder not found"}
-
-    try:
-        for root, dirs, files in os.walk(folder_path, topdown=False):
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-        os.rmdir(folder_path)
-        return {"success": True, "message": "Folder deleted successfully"}
-    except OSError as e:
-        return {"success": False, "message": f"Error deleting folder: {str(e)}"}
-
+        folder = namespace.create_folder(user_id, folder_name, parent_id)
+    except (TypeError, ValueError):
+        return {"success": False, "message": "Invalid parent id", "status": 400}
+    except namespace.NamespaceError as e:
+        body, status = _namespace_error(e)
+        return {"success": False, "message": body['error'], "status": status}
+    return {"success": True, "message": "Folder created successfully", "folder": folder}
+
+
+def _namespace_error(e):
+    if isinstance(e, namespace.NotFound):
+        return {'error': str(e)}, 404
+    if isinstance(e, namespace.NameConflict):
+        return {'error': str(e)}, 409
+    return {'error': str(e)}, 400
 
 class Folder(Resource):
     def get(self, folder_id=None):
-        """Get all folders or a specific folder by folder_id."""
-        if folder_id is None:
-            folders = get_folders()
-            return jsonify({'folders': folders})
+        """Get a page of the user's folders or a specific folder by folder_id."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {'error': str(e)}, 401
+        except PermissionError as e:
+            return {'error': str(e)}, 403
 
-        folder_path = os.path.join(STORAGE_DIR, folder_id)
-        if os.path.exists(folder_path):
-            return jsonify({'folder': folder_id}), 200
+        if folder_id is None:
+            parent = request.args.get('parent')
+            if parent not in (None, 'root'):
+                try:
+                    parent = int(parent)
+                except ValueError:
+                    return {'error': 'Invalid parent id'}, 400
+            try:
+                limit = page_size(request.args.get('limit'))
+                folders, next_cursor = get_folders(
+                    user_id,
+                    cursor=request.args.get('cursor'),
+                    limit=limit,
+                    include_counts=request.args.get('include_counts', '').lower() in ('1', 'true'),
+                    parent=parent,
+                )
+            except (ValueError, KeyError):
+                return {'error': 'Invalid cursor or limit'}, 400
+            return {'folders': folders, 'next_cursor': next_cursor}, 200
+
+        try:
+            folder = get_folder(user_id, int(folder_id))
+        except ValueError:
+            return {'error': 'Invalid folder id'}, 400
+        if folder:
+            return {'folder': folder}, 200
         else:
-            return jsonify({'error': 'Folder not found'}), 404
+            return {'error': 'Folder not found'}, 404
 
     def patch(self, folder_id):
-        """Update folder name."""
-        new_name = request.json.get('new_name')
-        if not new_name:
-            return jsonify({'error': 'New folder name is required'}), 400
-
-        result = update_folder(folder_id, new_name)
-        if result['success']:
-            return jsonify({'message': result['message'], 'new_name': new_name}), 200
-        else:
-            return jsonify({'error': result['message']}), 400
+        """Rename a folder and/or move it, with everything inside it, under parent_id (null for the top level)."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {'error': str(e)}, 401
+        except PermissionError as e:
+            return {'error': str(e)}, 403
+
+        data = request.get_json(silent=True) or {}
+        new_name = data.get('new_name')
+        parent_id = data.get('parent_id', namespace.KEEP)
+        if new_name is None and parent_id is namespace.KEEP:
+            return {'error': 'new_name or parent_id is required'}, 400
+        if new_name is not None and not str(new_name).strip():
+            return {'error': 'New folder name is required'}, 400
+
+        try:
+            folder = namespace.update_folder(user_id, folder_id, name=new_name, parent_id=parent_id)
+        except (TypeError, ValueError):
+            return {'error': 'Invalid folder id'}, 400
+        except namespace.NamespaceError as e:
+            return _namespace_error(e)
+        return {'message': 'Folder updated successfully', 'folder': folder}, 200
 
     def delete(self, folder_id):
-        """Delete a folder."""
-        result = delete_folder(folder_id)
-        if result['success']:
-            return jsonify({'message': result['message']}), 200
-        else:
-            return jsonify({'error': result['message']}), 404
-
-api.add_resource(Folder, '/folders', '/folders/<string:folder_id>')
-
-def add_file_to_folder(file_id, folder_id):
-    """Move a file into a folder."""
-    file = supabase.table('files').select("*").eq("id", file_id).execute()
-
-    if not file or len(file['data']) == 0:
-        return jsonify({'error': 'File not found'}), 404
-
-    file = file['data'][0]
-    old_path = file['storage_path']
-    new_path = os.path.join(STORAGE_DIR, folder_id, file['file_name'])
-
-    if not os.path.exists(os.path.join(STORAGE_DIR, folder_id)):
-        os.makedirs(os.path.join(STORAGE_DIR, folder_id))
-
-    try:
-        os.rename(old_path, new_path)
-        
-        response = supabase.table('files').update({"folder_id": folder_id, "storage_path": new_path}).eq("id", file_id).execute()
-
-        return jsonify({"message": "File moved to folder", "file_name": file['file_name']}), 200
-
-    except OSError as e:
-        return jsonify({'error': f"Error moving file: {str(e)}"}), 500
-    
-def remove_file_from_folder(file_id):
-    """Remove a file from a folder by setting folder_id to None in the database."""
-    
-    file = supabase.table('files').select("*").eq("id", file_id).execute()
-
-    if not file or len(file['data']) == 0:
-        return jsonify({'error': 'File not found'}), 404
-
-    file = file['data'][0]
-    old_folder_id = file['folder_id']
-    file_name = file['file_name']
-    old_storage_path = file['storage_path']
-
-    if old_folder_id is None:
-        return jsonify({'message': 'File is already not associated with any folder'}), 400
-
-    try:
-        response = supabase.table('files').update({
-            "folder_id": None, 
-        }).eq("id", file_id).execute()
-
-        if response.status_code == 200:
-            new_storage_path = os.path.join(STORAGE_DIR, file_name)
-            
-            if old_storage_path != new_storage_path:
-                os.rename(old_storage_path, new_storage_path)
-
-            return jsonify({"message": "File removed from folder", "file_name": file_name}), 200
+        """Soft-delete a folder and its files; storage is reclaimed by the purge worker."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {'error': str(e)}, 401
+        except PermissionError as e:
+            return {'error': str(e)}, 403
+
+        try:
+            folder_id = int(folder_id)
+        except ValueError:
+            return {'error': 'Invalid folder id'}, 400
+
+        if soft_delete_folder(user_id, folder_id):
+            return {'message': 'Folder deleted successfully'}, 202
         else:
-            return jsonify({'error': 'Failed to update the file in the database'}), 500
-
-    except Exception as e:
-        return jsonify({'error': f"Error removing file from folder: {str(e)}"}), 500
-
-
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+            return {'error': 'Folder not found'}, 404
+
+
+class FolderExport(Resource):
+    def get(self, folder_id):
+        """Download a folder and everything under it as a ZIP, streamed as it is built."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {'error': str(e)}, 401
+        except PermissionError as e:
+            return {'error': str(e)}, 403
+
+        try:
+            folder, entries = folder_entries(user_id, int(folder_id))
+        except ValueError:
+            return {'error': 'Invalid folder id'}, 400
+        except namespace.NotFound as e:
+            return {'error': str(e)}, 404
+
+        response = Response(stream_zip(entries), mimetype='application/zip', direct_passthrough=True)
+        response.headers.set('Content-Disposition', 'attachment', filename=f"{secure_filename(folder['folder_name']) or 'folder'}.zip")
+        response.cache_control.no_store = True
+        return response
+
+
+class Changes(Resource):
+    def get(self):
+        """Files and folders created, updated, moved or deleted after ?cursor=, oldest first.
+
+        Without a cursor, returns no changes and a cursor for the user's
+        current state; take it before the initial full listing.
+        """
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {'error': str(e)}, 401
+        except PermissionError as e:
+            return {'error': str(e)}, 403
+
+        cursor = request.args.get('cursor')
+        if not cursor:
+            return {'changes': [], 'next_cursor': changes.head(user_id), 'has_more': False}, 200
+        try:
+            limit = page_size(request.args.get('limit'))
+        except ValueError:
+            return {'error': 'Invalid limit'}, 400
+        try:
+            items, next_cursor, has_more = changes.list_changes(user_id, cursor, limit)
+        except changes.CursorExpired as e:
+            return {'error': str(e)}, 410
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return {'changes': items, 'next_cursor': next_cursor, 'has_more': has_more}, 200
@@ -0,0 +1,257 @@
+from flask_restful import Resource
+from flask import request
+from werkzeug.utils import secure_filename
+import json
+import os
+import uuid
+from datetime import datetime
+from itertools import chain
+from data_access import execute, table
+from storage import StorageError, ObjectNotFound, get_storage
+from blobs import file_url, public_url, store_blob, release_blob
+from streaming import HashingStream, UploadTooLarge, iter_chunks
+from Resources.files import allowed_file, authenticate_request
+import namespace
+from usage import QuotaExceeded, check_quota
+
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 5 * 1024 * 1024 * 1024))  # 5GB per session
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+MAX_PARTS = 10000
+
+SESSION_PREFIX = "uploads"
+MANIFEST_NAME = "session.json"
+
+
+def _session_dir(upload_id):
+    return f"{SESSION_PREFIX}/{upload_id}"
+
+
+def _part_name(part_number):
+    return f"part-{part_number:05d}"
+
+
+def _load_session(upload_id, user_id):
+    """Read the session manifest, returning None if missing or not owned by the user."""
+    try:
+        uuid.UUID(upload_id)
+        raw = b''.join(get_storage().open(f"{_session_dir(upload_id)}/{MANIFEST_NAME}"))
+    except (ValueError, ObjectNotFound):
+        return None
+    session = json.loads(raw)
+    if str(session["user_id"]) != str(user_id):
+        return None
+    return session
+
+
+def _list_parts(upload_id):
+    """Return {part_number: size} for every part stored so far."""
+    parts = {}
+    for entry in get_storage().list(_session_dir(upload_id)):
+        if entry["name"].startswith("part-"):
+            parts[int(entry["name"][len("part-"):])] = entry["size"]
+    return parts
+
+
+class UploadSessions(Resource):
+    def post(self):
+        """Initiate an upload session."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        data = request.get_json() or {}
+        filename = secure_filename(data.get("file_name") or '')
+        if filename == '' or not allowed_file(filename):
+            return {"error": "Invalid file type or missing file name"}, 400
+
+        try:
+            part_size = int(data.get("part_size") or DEFAULT_PART_SIZE)
+            file_size = None if data.get("file_size") is None else int(data["file_size"])
+        except (TypeError, ValueError):
+            return {"error": "part_size and file_size must be whole numbers of bytes"}, 400
+        if not MIN_PART_SIZE <= part_size <= MAX_PART_SIZE:
+            return {"error": f"part_size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes"}, 400
+
+        if file_size is not None and file_size > MAX_UPLOAD_SIZE:
+            return {"error": f"File size exceeds the {MAX_UPLOAD_SIZE // 1024 // 1024}MB limit"}, 400
+
+        # The folder is checked now, since completion inserts into it without looking again
+        folder_id = data.get("folder_id")
+        if folder_id is not None:
+            try:
+                folder_id = int(folder_id)
+                namespace.get_folder_row(user_id, folder_id, 'id')
+            except (TypeError, ValueError):
+                return {"error": "Invalid folder id"}, 400
+            except namespace.NotFound as e:
+                return {"error": str(e)}, 404
+
+        try:
+            check_quota(user_id, file_size)
+        except QuotaExceeded as e:
+            return {"error": str(e)}, 413
+
+        upload_id = str(uuid.uuid4())
+        session = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "file_name": filename,
+            "content_type": data.get("content_type") or "application/octet-stream",
+            "folder_id": folder_id,
+            "part_size": part_size,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        try:
+            get_storage().upload(f"{_session_dir(upload_id)}/{MANIFEST_NAME}", [json.dumps(session).encode()], "application/json")
+        except StorageError as e:
+            return {"error": f"Failed to create upload session: {str(e)}"}, 500
+
+        return {"upload_id": upload_id, "part_size": part_size, "max_parts": MAX_PARTS}, 201
+
+
+class UploadSession(Resource):
+    def get(self, upload_id):
+        """Report which parts have arrived, so a client can resume."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        session = _load_session(upload_id, user_id)
+        if session is None:
+            return {"error": "Upload session not found"}, 404
+
+        parts = _list_parts(upload_id)
+        return {
+            "upload_id": upload_id,
+            "file_name": session["file_name"],
+            "part_size": session["part_size"],
+            "parts": [{"part_number": n, "size": parts[n]} for n in sorted(parts)],
+        }, 200
+
+    def delete(self, upload_id):
+        """Abort the session and discard its parts."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        if _load_session(upload_id, user_id) is None:
+            return {"error": "Upload session not found"}, 404
+
+        session_dir = _session_dir(upload_id)
+        get_storage().delete(
+            [f"{session_dir}/{_part_name(n)}" for n in _list_parts(upload_id)] + [f"{session_dir}/{MANIFEST_NAME}"]
+        )
+        return {"message": "Upload session aborted"}, 200
+
+
+class UploadPart(Resource):
+    def put(self, upload_id, part_number):
+        """Store one numbered part. Parts may arrive in any order and in parallel."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        if not 1 <= part_number <= MAX_PARTS:
+            return {"error": f"part_number must be between 1 and {MAX_PARTS}"}, 400
+
+        session = _load_session(upload_id, user_id)
+        if session is None:
+            return {"error": "Upload session not found"}, 404
+
+        # An empty part is turned away before anything is stored under its number
+        chunks = iter_chunks(request.stream)
+        first = next(chunks, None)
+        if first is None:
+            return {"error": "Empty part"}, 400
+
+        body = HashingStream(chain([first], chunks), max_size=session["part_size"])
+        try:
+            get_storage().upload(f"{_session_dir(upload_id)}/{_part_name(part_number)}", body)
+        except UploadTooLarge:
+            return {"error": f"Part exceeds the session part_size of {session['part_size']} bytes"}, 400
+        except StorageError as e:
+            return {"error": f"Failed to store part: {str(e)}"}, 500
+
+        return {"part_number": part_number, "size": body.size, "checksum": body.checksum}, 200
+
+
+class CompleteUpload(Resource):
+    def post(self, upload_id):
+        """Assemble the parts into the final object and record its metadata."""
+        try:
+            user_id = authenticate_request()
+        except ValueError as e:
+            return {"error": str(e)}, 401
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+
+        session = _load_session(upload_id, user_id)
+        if session is None:
+            return {"error": "Upload session not found"}, 404
+
+        parts = _list_parts(upload_id)
+        if not parts:
+            return {"error": "No parts uploaded"}, 400
+        expected = list(range(1, max(parts) + 1))
+        missing = [n for n in expected if n not in parts]
+        if missing:
+            return {"error": "Missing parts", "missing_parts": missing}, 400
+        empty = [n for n in expected if not parts[n]]
+        if empty:
+            return {"error": "Empty parts", "empty_parts": empty}, 400
+        if sum(parts.values()) > MAX_UPLOAD_SIZE:
+            return {"error": f"File size exceeds the {MAX_UPLOAD_SIZE // 1024 // 1024}MB limit"}, 400
+        try:
+            check_quota(user_id, sum(parts.values()))
+        except QuotaExceeded as e:
+            return {"error": str(e)}, 413
+
+        # Parts are streamed one after another into the final object, so only
+        # a single chunk is held in memory during assembly
+        storage = get_storage()
+        session_dir = _session_dir(upload_id)
+        part_paths = [f"{session_dir}/{_part_name(n)}" for n in expected]
+        body = HashingStream(chain.from_iterable(storage.open(path) for path in part_paths))
+        try:
+            blob = store_blob(body, session["content_type"], session["file_name"])
+        except StorageError as e:
+            return {"error": f"Failed to assemble upload: {str(e)}"}, 500
+
+        storage_path = public_url(blob)
+        current_time = datetime.utcnow().isoformat()
+        file_metadata = {
+            "file_name": session["file_name"],
+            "file_size": body.size,
+            "checksum": body.checksum,
+            "storage_path": storage_path,
+            "encoding": blob.encoding,
+            "stored_size": blob.stored_size,
+            "user_id": user_id,
+            "folder_id": session["folder_id"],
+            "uploaded_at": current_time,
+            "updated_at": current_time,
+            "deleted_at": None
+        }
+        response = execute(table("files").insert(file_metadata))
+        if not response or not hasattr(response, 'data') or not response.data:
+            release_blob(body.checksum)
+            return {"error": "Failed to save metadata to Supabase"}, 500
+
+        storage.delete(part_paths + [f"{session_dir}/{MANIFEST_NAME}"])
+
+        return {"message": "File uploaded successfully", "id": response.data[0].get("id"),
+                "file_url": file_url(response.data[0].get("id"), storage_path), "file_size": body.size, "checksum": body.checksum, "deduplicated": blob.deduplicated, "stored_size": blob.stored_size}, 200
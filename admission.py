@@ -0,0 +1,172 @@
+# admission.py
+"""Admission control for uploads.
+
+Every upload must fit in two per-worker budgets before its body is read: a
+cap on concurrent uploads and a cap on the bytes those uploads may have in
+flight (each reserves its Content-Length, or the largest size it could be
+when that is unknown). A user also spends a token from their own bucket per
+upload, refilled at UPLOAD_RATE per second up to UPLOAD_BURST.
+
+Requests that don't fit are turned away at once with Retry-After: 429 when
+the user is over their rate, 503 when the worker is full. UPLOAD_ADMISSION_WAIT
+lets a request wait briefly for capacity first, but never in an unbounded
+queue.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", 16))
+UPLOAD_BYTE_BUDGET = int(os.getenv("UPLOAD_BYTE_BUDGET", 256 * 1024 * 1024))
+UPLOAD_ADMISSION_WAIT = float(os.getenv("UPLOAD_ADMISSION_WAIT", 0))  # seconds
+UPLOAD_RATE = float(os.getenv("UPLOAD_RATE", 2))  # uploads per second per user, 0 disables
+UPLOAD_BURST = float(os.getenv("UPLOAD_BURST", 20))
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", 1))
+MAX_TRACKED_USERS = int(os.getenv("MAX_TRACKED_USERS", 10000))
+
+rejections = metrics.Counter("cloudnest_upload_rejections_total", "Uploads turned away by admission control.",
+                             ("reason",))
+metrics.REGISTRY.append(rejections)
+
+
+class Rejected(Exception):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)}
+
+
+class TokenBuckets:
+    """One token bucket per user, least recently used dropped past maxsize.
+
+    A dropped bucket comes back full, which only ever errs towards admitting.
+    """
+
+    def __init__(self, rate, burst, maxsize=MAX_TRACKED_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # user -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, user, cost=1):
+        """Spend cost tokens, or return the seconds until that many are available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(user, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0 if tokens >= cost else (cost - tokens) / self.rate
+            if not wait:
+                tokens -= cost
+            self._buckets[user] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Admission:
+    def __init__(self, max_uploads=MAX_CONCURRENT_UPLOADS, byte_budget=UPLOAD_BYTE_BUDGET,
+                 rate=UPLOAD_RATE, burst=UPLOAD_BURST, wait=UPLOAD_ADMISSION_WAIT):
+        self.max_uploads = max_uploads
+        self.byte_budget = byte_budget
+        self.wait = wait
+        self.buckets = TokenBuckets(rate, burst) if rate else None
+        self.uploads = 0
+        self.bytes = 0
+        self.admitted = 0
+        self.rejected = {"rate": 0, "concurrency": 0, "bytes": 0}
+        self._capacity = threading.Condition()
+
+    def _reject(self, reason, message, status, retry_after):
+        with self._capacity:
+            self.rejected[reason] += 1
+        rejections.inc(reason=reason)
+        return Rejected(message, status, retry_after)
+
+    def _full(self, size):
+        if self.uploads >= self.max_uploads:
+            return "concurrency"
+        # A single upload larger than the whole budget may run alone
+        if self.bytes and self.bytes + size > self.byte_budget:
+            return "bytes"
+        return None
+
+    def admit(self, user, size):
+        """Reserve a slot and size bytes for one upload. Raises Rejected.
+
+        Returns a Ticket; release it (or use it as a context manager) when
+        the upload finishes.
+        """
+        if self.buckets is not None:
+            wait = self.buckets.take(str(user))
+            if wait:
+                raise self._reject("rate", "Too many uploads, please slow down", 429, math.ceil(wait))
+
+        deadline = time.monotonic() + self.wait
+        with self._capacity:
+            reason = self._full(size)
+            while reason and deadline > time.monotonic():
+                self._capacity.wait(deadline - time.monotonic())
+                reason = self._full(size)
+            if reason is None:
+                self.uploads += 1
+                self.bytes += size
+                self.admitted += 1
+                return Ticket(self, size)
+        raise self._reject(reason, "Server is busy with other uploads, please try again shortly", 503,
+                           UPLOAD_RETRY_AFTER)
+
+    def _release(self, size):
+        with self._capacity:
+            self.uploads -= 1
+            self.bytes -= size
+            self._capacity.notify_all()
+
+    def stats(self):
+        with self._capacity:
+            return {
+                "uploads_in_flight": self.uploads,
+                "max_uploads": self.max_uploads,
+                "bytes_in_flight": self.bytes,
+                "byte_budget": self.byte_budget,
+                "utilization": max(self.uploads / max(self.max_uploads, 1), self.bytes / max(self.byte_budget, 1)),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "users_tracked": len(self.buckets) if self.buckets is not None else 0,
+            }
+
+
+class Ticket:
+    def __init__(self, admission, size):
+        self._admission = admission
+        self._size = size
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._admission._release(self._size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+uploads = Admission()
+
+
+def reservation(request, max_size):
+    """Bytes to reserve for a request: its Content-Length, capped at max_size."""
+    length = request.content_length
+    return max_size if length is None else min(length, max_size)
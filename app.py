@@ -1,41 +1,165 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_restful import Api
 from Resources.auth import Register, Login, Logout
-from Resources.files import UploadFile
-from Resources.files_folders import Folder, create_folder
-from flask_login import current_user, login_require
+from Resources.files import UploadFile, FileItem, FileDownload, FileSearch, authenticate_request
+from Resources.uploads import UploadSessions, UploadSession, UploadPart, CompleteUpload
+from Resources.files_folders import Folder, FolderExport, Changes, create_folder, upload_file, file_too_large
+from config import Config
+import admission
+import auth_cache
+import compression
+import data_access
+import metrics
+import purge
+import usage
+from storage import get_storage
+import time
 
 
-app = Flask(__name__)
-api = Api(app)
+def start_request():
+    data_access.reset_round_trips()
+    metrics.set_endpoint(request.endpoint)
+    g.started_at = time.perf_counter()
+    g.profile = metrics.start_profile()
+
+
+def finish_request(response):
+    # Lets tests and clients see how many PostgREST calls a request made
+    trips = data_access.round_trips()
+    response.headers['X-Round-Trips'] = str(trips)
+    if 'started_at' in g:
+        metrics.finish_request(request.endpoint or '', request.method, response.status_code,
+                               time.perf_counter() - g.started_at, trips, g.profile)
+    return response
+
+
+def start_purge_worker():
+    # On the first request rather than at import, so a preloading master
+    # never starts a thread its forked workers would lose
+    purge.start_purge_worker()
+
 
-app.route('/')
 def index():
     return "<h1>Welcome to CloudNest</h1>"
 
-@app.route('/create-folder', methods=["POST"])
+
 def create_folder_route():
-    """Create a folder for the logged-in user."""
-    folder_name = request.json.get('folder_name')
+    """Create a folder for the logged-in user, optionally inside parent_id."""
+    try:
+        user_id = authenticate_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 401
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+    data = request.get_json(silent=True) or {}
+    folder_name = data.get('folder_name')
     
     if not folder_name:
         return jsonify({'error': 'Folder name is required'}), 400
 
-    result = create_folder(folder_name, current_user.id)
+    result = create_folder(folder_name, user_id, data.get('parent_id'))
     
     if result['success']:
-        return jsonify({'message': result['message'], 'folder_name': folder_name}), 201
+        return jsonify({'message': result['message'], 'folder_name': folder_name, 'folder': result['folder']}), 201
     else:
-        return jsonify({'error': result['message']}), 400
-    
+        return jsonify({'error': result['message']}), result['status']
+
+
+def usage_route():
+    """Bytes and files stored by the logged-in user, against their quota."""
+    try:
+        user_id = authenticate_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 401
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+
+    return jsonify({**usage.get_usage(user_id), 'quota_bytes': usage.USER_QUOTA_BYTES or None})
+
+
+def purge_status():
+    """Soft-deleted items still waiting to be purged, and this worker's purge progress."""
+    return jsonify(purge.status())
+
+
+def storage_cache_stats():
+    """Hit ratio and evictions for this worker's hot-object cache."""
+    storage = get_storage()
+    if not hasattr(storage, 'stats'):
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **storage.stats()})
+
 
-api.add_resource(Register, '/register')
-api.add_resource(Login, '/login')
-api.add_resource(Folder, '/folders')
-api.add_resource(Logout, '/logout')
-api.add_resource(UploadFile, '/upload_file')
+def metrics_route():
+    """Stage timings, round trips and bytes transferred for this worker, in Prometheus format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def upload_admission_stats():
+    """Uploads and bytes in flight in this worker against its limits, and how many were turned away."""
+    return jsonify(admission.uploads.stats())
+
+
+def compression_stats():
+    """Bytes this worker has kept out of storage and off the wire by storing text gzipped."""
+    return jsonify(compression.stats())
+
+
+def auth_cache_stats():
+    """Hit/miss counters for this worker's token and user caches."""
+    return jsonify(auth_cache.stats())
+
+
+def create_app(config=Config):
+    """Build the app. Clients and connection pools are created on first use, not here."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    if app.config['PURGE_WORKER']:
+        app.before_request(start_purge_worker)
+    app.register_error_handler(413, file_too_large)
+
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/create-folder', view_func=create_folder_route, methods=['POST'])
+    app.add_url_rule('/upload', view_func=upload_file, methods=['POST'])
+    app.add_url_rule('/usage', view_func=usage_route)
+    app.add_url_rule('/purge/status', view_func=purge_status)
+    app.add_url_rule('/stats/storage-cache', view_func=storage_cache_stats)
+    app.add_url_rule('/metrics', view_func=metrics_route)
+    app.add_url_rule('/stats/uploads', view_func=upload_admission_stats)
+    app.add_url_rule('/stats/compression', view_func=compression_stats)
+    app.add_url_rule('/stats/auth-cache', view_func=auth_cache_stats)
+
+    api = Api(app)
+    api.add_resource(Register, '/register')
+    api.add_resource(Login, '/login')
+    api.add_resource(Folder, '/folders', '/folders/<string:folder_id>')
+    api.add_resource(FolderExport, '/folders/<string:folder_id>/export')
+    api.add_resource(Changes, '/changes')
+    api.add_resource(Logout, '/logout')
+    api.add_resource(UploadFile, '/upload_file')
+    api.add_resource(FileSearch, '/files/search')
+    api.add_resource(FileItem, '/files/<int:file_id>')
+    api.add_resource(FileDownload, '/files/<int:file_id>/download')
+    api.add_resource(UploadSessions, '/uploads')
+    api.add_resource(UploadSession, '/uploads/<string:upload_id>')
+    api.add_resource(UploadPart, '/uploads/<string:upload_id>/parts/<int:part_number>')
+    api.add_resource(CompleteUpload, '/uploads/<string:upload_id>/complete')
+
+    if app.config.get('SQLALCHEMY_DATABASE_URI'):
+        # Only migrations and the benchmarks use the ORM; nothing connects until asked
+        from models import db, migrate
+        db.init_app(app)
+        migrate.init_app(app, db)
+
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
-
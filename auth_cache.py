@@ -0,0 +1,104 @@
+# auth_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))  # never longer than the token's exp
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after a TTL.
+
+    Each gunicorn worker holds its own instance; counters are per worker too.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# token -> user_id for tokens that decoded successfully
+token_cache = TTLCache(AUTH_CACHE_SIZE, TOKEN_CACHE_TTL)
+# user_id -> whether the user exists
+user_cache = TTLCache(AUTH_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def cache_token(token, user_id, exp=None):
+    """Remember a decoded token until its exp (or the cache TTL, whichever is sooner)."""
+    ttl = None if exp is None else exp - time.time()
+    token_cache.set(token, user_id, ttl)
+
+
+def invalidate_token(token):
+    token_cache.invalidate(token)
+
+
+def invalidate_user(user_id):
+    """Forget a user, e.g. after deletion, so the next request checks the database."""
+    user_cache.invalidate(str(user_id))
+
+
+def get_cached_user(user_id):
+    """Return True/False if the user's existence is cached, otherwise None."""
+    return user_cache.get(str(user_id))
+
+
+def cache_user(user_id, exists):
+    user_cache.set(str(user_id), exists)
+
+
+def stats():
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
@@ -0,0 +1,119 @@
+# batch_upload.py
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.utils import secure_filename
+from blobs import file_url, public_url, store_blob, release_blob
+from data_access import insert_many
+import metrics
+from streaming import HashingStream, UploadTooLarge, iter_chunks
+
+# Storage transfers running at once per worker, shared by all batch requests
+UPLOAD_PARALLELISM = int(os.getenv("UPLOAD_PARALLELISM", 4))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_PARALLELISM, thread_name_prefix="batch-upload")
+        return _executor
+
+
+def validate_files(files, allowed, max_size):
+    """Split uploaded files into (accepted, rejected) before any transfer starts.
+
+    accepted holds (index, filename, file, size); rejected holds per-file results.
+    """
+    accepted, rejected = [], []
+    for index, file in enumerate(files):
+        filename = secure_filename(file.filename or '')
+        if not filename or not allowed(filename):
+            rejected.append({"index": index, "file_name": file.filename, "success": False, "error": "Invalid file type or missing file"})
+            continue
+        file.stream.seek(0, os.SEEK_END)
+        size = file.stream.tell()
+        file.stream.seek(0)
+        if size > max_size:
+            rejected.append({"index": index, "file_name": filename, "success": False,
+                             "error": f"File size exceeds the {max_size // 1024 // 1024}MB limit"})
+            continue
+        accepted.append((index, filename, file, size))
+    return accepted, rejected
+
+
+def _transfer(filename, file, max_size):
+    body = HashingStream(iter_chunks(file.stream), max_size=max_size)
+    blob = store_blob(body, file.mimetype or "application/octet-stream", filename)
+    return {
+        "file_name": filename,
+        "storage_path": public_url(blob),
+        "file_size": body.size,
+        "checksum": body.checksum,
+        "encoding": blob.encoding,
+        "stored_size": blob.stored_size,
+        "deduplicated": blob.deduplicated,
+    }
+
+
+def upload_batch(accepted, user_id, folder_id=None, max_size=None):
+    """Transfer accepted files concurrently, then record them in one bulk insert.
+
+    Returns a result per file; a failure of one file does not affect the others.
+    """
+    executor = _get_executor()
+    futures = [
+        (index, filename, executor.submit(contextvars.copy_context().run, _transfer, filename, file, max_size))
+        for index, filename, file, _ in accepted
+    ]
+
+    results, stored = [], []
+    with metrics.stage("storage_transfer"):
+        for index, filename, future in futures:
+            try:
+                stored.append((index, future.result()))
+            except UploadTooLarge:
+                results.append({"index": index, "file_name": filename, "success": False, "error": "File is too large"})
+            except Exception as e:
+                results.append({"index": index, "file_name": filename, "success": False, "error": f"Failed to store file: {str(e)}"})
+
+    if stored:
+        current_time = datetime.utcnow().isoformat()
+        rows = [{
+            "file_name": item["file_name"],
+            "file_size": item["file_size"],
+            "checksum": item["checksum"],
+            "storage_path": item["storage_path"],
+            "encoding": item["encoding"],
+            "stored_size": item["stored_size"],
+            "user_id": user_id,
+            "folder_id": folder_id,
+            "uploaded_at": current_time,
+            "updated_at": current_time,
+            "deleted_at": None
+        } for _, item in stored]
+        try:
+            with metrics.stage("metadata_insert"):
+                created = insert_many('files', rows)
+        except Exception as e:
+            for _, item in stored:
+                release_blob(item["checksum"])
+            created = None
+            error = str(e)
+
+        for position, (index, item) in enumerate(stored):
+            if created is None:
+                results.append({"index": index, "file_name": item["file_name"], "success": False,
+                                "error": f"Failed to save metadata: {error}"})
+                continue
+            row = created[position] if position < len(created) else {}
+            results.append({"index": index, "success": True, "id": row.get("id"), "file_name": item["file_name"],
+                            "file_url": file_url(row.get("id"), item["storage_path"]), "file_size": item["file_size"],
+                            "stored_size": item["stored_size"], "deduplicated": item["deduplicated"]})
+
+    return sorted(results, key=lambda result: result["index"])
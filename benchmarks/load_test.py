@@ -0,0 +1,321 @@
+"""Offline load test of the whole app against the local Supabase stand-in.
+
+Starts local_supabase.py and the app as separate processes (so the app's
+memory is measured on its own), then drives register, login, single uploads
+(small and large), multi-file uploads, folder listing and deletes at a fixed
+concurrency. Each scenario reports p50/p95/p99 latency and requests per
+second; the app's peak RSS is sampled throughout. Results are written as
+JSON, one file per commit by default, and two runs can be compared:
+
+    python benchmarks/load_test.py --concurrency 16 --requests 200
+    python benchmarks/load_test.py --compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ["register", "login", "upload_small", "upload_large", "upload_multi", "list_folders", "delete"]
+# Compared between runs; a later value is better for rps and worse for the rest
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "rps"]
+FOLDERS_PER_USER = 20
+PASSWORD = "correct horse battery staple"
+STARTUP_TIMEOUT = 30
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not start within {STARTUP_TIMEOUT}s")
+
+
+def _rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return children
+
+
+class RSSSampler:
+    """Peak resident memory of a process and its direct children (e.g. gunicorn workers)."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss(self.pid) + sum(_rss(child) for child in _children(self.pid)))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of sorted samples."""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))]
+
+
+def run_scenario(client, jobs, concurrency):
+    """Send every job (a callable returning a response) and summarise the latencies."""
+    def timed(job):
+        start = time.perf_counter()
+        try:
+            ok = job(client).is_success
+        except httpx.HTTPError:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, jobs))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "rps": len(results) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def _auth(token):
+    return {"Authorization": token}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    supabase_port, app_port = _free_port(), _free_port()
+    supabase_url = f"http://127.0.0.1:{supabase_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = dict(
+        os.environ,
+        SUPABASE_URL=supabase_url,
+        SUPABASE_KEY="eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.local",
+        JWT_SECRET_KEY="load-test-secret",
+        JWT_ALGORITHM="HS256",
+        STORAGE_CACHE_DIR=os.path.join(workdir, "storage_cache"),
+        REVOCATION_DB=os.path.join(workdir, "revoked_tokens.db"),
+        USER_QUOTA_BYTES="0",
+        # A few users send every request, so per-user rate limits would dominate the numbers
+        UPLOAD_RATE="0",
+    )
+    if args.hash_method:
+        env["PASSWORD_HASH_METHOD"] = args.hash_method
+
+    supabase = subprocess.Popen(
+        [sys.executable, "local_supabase.py", "--port", str(supabase_port), "--latency", str(args.latency),
+         "--storage-root", os.path.join(workdir, "supabase_storage")],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+                   "-b", f"127.0.0.1:{app_port}", "app:app"] + (["--preload"] if args.preload else [])
+    else:
+        command = [sys.executable, "-c",
+                   f"from werkzeug.serving import run_simple; from app import app; "
+                   f"run_simple('127.0.0.1', {app_port}, app, threaded=True)"]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        _wait_for(supabase_url, supabase)
+        _wait_for(app_url, server)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=app_url, timeout=300, limits=limits) as client, RSSSampler(server.pid) as rss:
+            scenarios = drive(client, args)
+        return {
+            "commit": _git_commit(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "config": {key: getattr(args, key) for key in (
+                "concurrency", "requests", "small_size", "large_size", "batch", "latency", "server", "workers",
+                "threads", "preload", "hash_method")},
+            "peak_rss_bytes": rss.peak,
+            "scenarios": scenarios,
+        }
+    finally:
+        for process in (server, supabase):
+            process.terminate()
+            process.wait()
+
+
+def drive(client, args):
+    n, concurrency = args.requests, args.concurrency
+    run_id = uuid.uuid4().hex[:8]
+    results = {}
+
+    def register(i):
+        name = f"load-{run_id}-{i}"
+        return lambda c: c.post("/register", json={"username": name, "email": f"{name}@example.com",
+                                                   "password": PASSWORD, "confirm_password": PASSWORD})
+
+    results["register"] = run_scenario(client, [register(i) for i in range(n)], concurrency)
+
+    users = [f"load-{run_id}-{i}@example.com" for i in range(min(n, concurrency))]
+    results["login"] = run_scenario(
+        client, [lambda c, email=users[i % len(users)]: c.post("/login", json={"email": email, "password": PASSWORD})
+                 for i in range(n)], concurrency)
+    tokens = [client.post("/login", json={"email": email, "password": PASSWORD}).json()["token"] for email in users]
+
+    # Unique content per request, so deduplication doesn't turn uploads into metadata writes
+    created = []
+    created_lock = threading.Lock()
+
+    def upload(i, size):
+        def job(c):
+            response = c.post("/upload_file", content=os.urandom(size), headers={
+                **_auth(tokens[i % len(tokens)]), "X-File-Name": f"file-{i}.txt",
+                "Content-Type": "application/octet-stream"})
+            if response.is_success and size == args.small_size:
+                with created_lock:
+                    created.append((tokens[i % len(tokens)], response.json().get("id")))
+            return response
+        return job
+
+    results["upload_small"] = run_scenario(client, [upload(i, args.small_size) for i in range(n)], concurrency)
+    results["upload_large"] = run_scenario(client, [upload(i, args.large_size) for i in range(max(1, n // 10))],
+                                           concurrency)
+
+    def upload_multi(i):
+        return lambda c: c.post("/upload", headers=_auth(tokens[i % len(tokens)]), files=[
+            ("file", (f"batch-{i}-{j}.txt", os.urandom(args.small_size), "text/plain")) for j in range(args.batch)])
+
+    results["upload_multi"] = run_scenario(client, [upload_multi(i) for i in range(n)], concurrency)
+
+    for token in tokens:
+        for j in range(FOLDERS_PER_USER):
+            client.post("/create-folder", json={"folder_name": f"folder-{j}"}, headers=_auth(token))
+    results["list_folders"] = run_scenario(
+        client, [lambda c, token=tokens[i % len(tokens)]: c.get("/folders", headers=_auth(token)) for i in range(n)],
+        concurrency)
+
+    results["delete"] = run_scenario(
+        client, [lambda c, token=token, file_id=file_id: c.delete(f"/files/{file_id}", headers=_auth(token))
+                 for token, file_id in created if file_id is not None], concurrency)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report):
+    print(f"commit {report['commit']}  peak RSS {report['peak_rss_bytes'] / 1024 / 1024:.1f}MB")
+    print(f"{'scenario':<14} {'reqs':>6} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in SCENARIOS:
+        s = report["scenarios"].get(name)
+        if s and s["requests"]:
+            print(f"{name:<14} {s['requests']:>6} {s['errors']:>6} {s['rps']:>8.1f} "
+                  f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{base['commit']} -> {new['commit']}")
+    print(f"{'scenario':<14} " + " ".join(f"{metric:>18}" for metric in METRICS))
+    for name in SCENARIOS:
+        old_s, new_s = base["scenarios"].get(name), new["scenarios"].get(name)
+        if not old_s or not new_s:
+            continue
+        cells = []
+        for metric in METRICS:
+            old_v, new_v = old_s.get(metric), new_s.get(metric)
+            change = f"{(new_v - old_v) / old_v * 100:+.0f}%" if old_v and new_v is not None else "n/a"
+            cells.append(f"{new_v or 0:>10.1f} {change:>7}")
+        print(f"{name:<14} " + " ".join(cells))
+    rss_change = (new["peak_rss_bytes"] - base["peak_rss_bytes"]) / 1024 / 1024
+    print(f"peak RSS {new['peak_rss_bytes'] / 1024 / 1024:.1f}MB ({rss_change:+.1f}MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario (large uploads run a tenth)")
+    parser.add_argument("--small-size", type=int, default=16 * 1024)
+    parser.add_argument("--large-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--batch", type=int, default=5, help="files per multi-file upload")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every stand-in request")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--preload", action="store_true", help="import the app once and fork gunicorn workers")
+    parser.add_argument("--hash-method", default=None, help="PASSWORD_HASH_METHOD for the app")
+    parser.add_argument("--output", default=None, help="defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two saved results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    print_report(report)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Latency of the hot metadata reads over PostgREST versus direct pooled SQL.
+
+Seeds the same users, folders and files into the local Supabase stand-in and
+into a SQL database built from models.py (a throwaway SQLite file unless
+--database-url points at an empty local Postgres), then times each read on
+both paths.
+
+Usage: python benchmarks/metadata_reads.py [--users N] [--files N] [--latency MS]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import local_supabase  # noqa: E402
+from sqlalchemy import DateTime  # noqa: E402
+
+
+def seed_rows(users, folders_per_user, files_per_user):
+    user_rows, folder_rows, file_rows = [], [], []
+    for user_id in range(1, users + 1):
+        user_rows.append({"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+                          "password": "x"})
+        first = len(folder_rows) + 1
+        for n in range(folders_per_user):
+            folder_rows.append({"id": len(folder_rows) + 1, "folder_name": f"folder {n}", "user_id": user_id,
+                                "parent_id": None, "created_at": "2024-01-01T00:00:00",
+                                "updated_at": "2024-01-01T00:00:00", "deleted_at": None})
+        for n in range(files_per_user):
+            file_rows.append({"id": len(file_rows) + 1, "file_name": f"file{n}.txt", "user_id": user_id,
+                              "file_size": 1024, "checksum": f"{len(file_rows):064x}", "storage_path": "",
+                              "folder_id": first + n % max(folders_per_user, 1) if folders_per_user else None,
+                              "uploaded_at": "2024-01-01T00:00:00", "updated_at": "2024-01-01T00:00:00",
+                              "deleted_at": None})
+    return {"users": user_rows, "folders": folder_rows, "files": file_rows}
+
+
+def _sql_value(column, value):
+    # The stand-in takes the ISO strings PostgREST returns; SQLAlchemy wants datetimes
+    if isinstance(value, str) and isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def seed_sql(app, models, rows):
+    with app.app_context():
+        models.db.create_all()
+        users = [{"id": r["id"], "username": r["username"], "email": r["email"], "password_hash": r["password"]}
+                 for r in rows["users"]]
+        models.db.session.execute(models.User.__table__.insert(), users)
+        for name, model in (("folders", models.Folder), ("files", models.File)):
+            table = model.__table__
+            models.db.session.execute(table.insert(), [
+                {key: _sql_value(table.c[key], value) for key, value in row.items()
+                 if key in table.c and value is not None}
+                for row in rows[name]
+            ])
+        models.db.session.commit()
+
+
+def measure(fn, repeat):
+    fn()  # warm the connection pools
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--folders", type=int, default=20, help="folders per user")
+    parser.add_argument("--files", type=int, default=200, help="files per user")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every PostgREST request")
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    server, base_url = local_supabase.serve(latency=args.latency / 1000)
+    workdir = tempfile.mkdtemp(prefix="metadata_reads_")
+    # Everything below reads its settings from the environment at import
+    os.environ["SUPABASE_URL"] = base_url
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.local")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'metadata.db')}"
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["LOCAL_STORAGE_DIR"] = os.path.join(workdir, "storage")
+
+    import auth_cache
+    import data_access
+    import models
+    import sql_reads
+    import usage
+    from app import create_app
+    from Resources.files import DOWNLOAD_COLUMNS, check_user_permission
+    from Resources.files_folders import get_folder, get_folders
+
+    rows = seed_rows(args.users, args.folders, args.files)
+    for name in ("users", "folders", "files"):
+        for start in range(0, len(rows[name]), 1000):
+            data_access.insert_many(name, rows[name][start:start + 1000])
+    seed_sql(create_app(), models, rows)
+
+    user_id = args.users // 2 or 1
+    folder_id = next(r["id"] for r in rows["folders"] if r["user_id"] == user_id) if args.folders else 1
+    file_id = next(r["id"] for r in rows["files"] if r["user_id"] == user_id) if args.files else 1
+
+    def user_check():
+        auth_cache.user_cache.clear()
+        check_user_permission(user_id)
+
+    def file_lookup():
+        if sql_reads.enabled():
+            sql_reads.get_file(user_id, file_id, DOWNLOAD_COLUMNS)
+        else:
+            data_access.execute(data_access.table("files").select(DOWNLOAD_COLUMNS).eq("id", file_id)
+                                .eq("user_id", user_id).is_("deleted_at", "null"))
+
+    reads = [
+        ("user check", user_check),
+        ("folder page", lambda: get_folders(user_id, limit=50)),
+        ("folder by id", lambda: get_folder(user_id, folder_id)),
+        ("download lookup", file_lookup),
+        ("usage", lambda: usage.get_usage(user_id)),
+    ]
+
+    print(f"{len(rows['files'])} files, {len(rows['folders'])} folders; SQL on {sql_reads.get_engine().url.drivername}")
+    print(f"{'read':<16} {'path':<5} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, fn in reads:
+        for path in ("rest", "sql"):
+            sql_reads.METADATA_READS = path
+            p50, p95, mean = measure(fn, args.repeat)
+            print(f"{name:<16} {path:<5} {p50:>8.2f} {p95:>8.2f} {mean:>8.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
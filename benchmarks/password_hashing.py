@@ -0,0 +1,52 @@
+# benchmarks/password_hashing.py
+"""Logins per second per core for each password hash work factor.
+
+Usage: python benchmarks/password_hashing.py [--logins N] [method ...]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import _verify  # noqa: E402
+
+DEFAULT_METHODS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+]
+
+
+def run(method, logins, workers):
+    pwhash = generate_password_hash("correct horse battery staple", method=method)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Warm the workers up so process start-up is not measured
+        list(pool.map(_verify, [pwhash] * workers, ["correct horse battery staple"] * workers))
+        start = time.perf_counter()
+        list(pool.map(_verify, [pwhash] * logins, ["correct horse battery staple"] * logins))
+        elapsed = time.perf_counter() - start
+    rate = logins / elapsed
+    return rate, rate / workers, elapsed / logins * workers * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("methods", nargs="*", default=DEFAULT_METHODS)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{'method':<24} {'logins/s':>10} {'logins/s/core':>14} {'ms/login':>10}")
+    for method in args.methods:
+        rate, per_core, latency = run(method, args.logins, args.workers)
+        print(f"{method:<24} {rate:>10.1f} {per_core:>14.1f} {latency:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Cold-start time and per-worker memory of the app.
+
+Each run starts a fresh interpreter, so nothing is cached between runs:
+
+  cold     import the app (which builds it with create_app()) and serve a
+           first request through the test client; reports import time,
+           time to first response and peak RSS.
+  preload  import the app once, fork --workers children the way
+           `gunicorn --preload` does, and have each serve a first request;
+           reports what each worker holds privately versus shares with the
+           parent (from /proc/self/smaps_rollup, so Linux only).
+
+Usage: python benchmarks/startup.py [--runs N] [--workers N] [--path /metrics]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(
+    SUPABASE_URL="http://127.0.0.1:9",
+    SUPABASE_KEY="eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.local",
+    JWT_SECRET_KEY="startup-benchmark",
+    JWT_ALGORITHM="HS256",
+    STORAGE_BACKEND="local",
+)
+
+COLD = """
+import json, resource, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "first_response_seconds": served - start,
+    "status": response.status_code,
+    "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+}}))
+"""
+
+PRELOAD = """
+import json, os
+from app import app
+
+def smaps():
+    values = {{}}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return values
+
+children = []
+for _ in range({workers}):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        app.test_client().get({path!r})
+        values = smaps()
+        os.write(write_fd, json.dumps({{
+            "rss_bytes": values["Rss"],
+            "pss_bytes": values["Pss"],
+            "private_bytes": values["Private_Clean"] + values["Private_Dirty"],
+            "shared_bytes": values["Shared_Clean"] + values["Shared_Dirty"],
+        }}).encode())
+        os._exit(0)
+    os.close(write_fd)
+    children.append((pid, read_fd))
+
+workers = []
+for pid, read_fd in children:
+    with os.fdopen(read_fd) as f:
+        workers.append(json.loads(f.read()))
+    os.waitpid(pid, 0)
+print(json.dumps({{"parent_rss_bytes": smaps()["Rss"], "workers": workers}}))
+"""
+
+
+def _run(code):
+    env = {**os.environ, **ENV}
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _mb(value):
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--path", default="/metrics", help="first request each process serves")
+    args = parser.parse_args()
+
+    runs = [_run(COLD.format(path=args.path)) for _ in range(args.runs)]
+    print(f"cold start, median of {args.runs} runs:")
+    print(f"  import + create_app  {statistics.median(r['import_seconds'] for r in runs) * 1000:8.1f} ms")
+    print(f"  first response       {statistics.median(r['first_response_seconds'] for r in runs) * 1000:8.1f} ms")
+    print(f"  peak RSS             {_mb(statistics.median(r['peak_rss_bytes'] for r in runs)):>11}")
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("preload: skipped, /proc/self/smaps_rollup is not available here")
+        return
+    result = _run(PRELOAD.format(path=args.path, workers=args.workers))
+    workers = result["workers"]
+    print(f"preload + fork, {args.workers} workers (parent RSS {_mb(result['parent_rss_bytes'])}):")
+    for key in ("rss_bytes", "pss_bytes", "private_bytes", "shared_bytes"):
+        print(f"  {key[:-6]:<8} per worker {_mb(statistics.mean(w[key] for w in workers)):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# blobs.py
+import time
+import uuid
+from collections import namedtuple
+from postgrest.exceptions import APIError
+import compression
+from data_access import chunked, execute, table
+from storage import get_storage
+
+BLOB_PREFIX = "blobs"
+STAGING_PREFIX = "tmp"
+GC_TOMBSTONE = -1  # ref_count while a blob is being garbage-collected
+UNIQUE_VIOLATION = "23505"
+MAX_RETRIES = 50
+RETRY_DELAY = 0.05
+ENCODING_SUFFIXES = {compression.GZIP: ".gz"}
+
+# What a files row needs to know about the blob holding its content
+StoredBlob = namedtuple('StoredBlob', 'path deduplicated encoding stored_size')
+
+
+def blob_path(sha256, encoding=None):
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256}{ENCODING_SUFFIXES.get(encoding, '')}"
+
+
+def public_url(blob):
+    """The public URL to record for a StoredBlob, or None if it has to go through the API.
+
+    Public URLs serve the stored bytes with no Content-Encoding, so an encoded
+    blob is only readable through the download endpoint, as is every blob in
+    a backend without public URLs.
+    """
+    return None if blob.encoding else get_storage().public_url(blob.path)
+
+
+def file_url(file_id, storage_path):
+    """Where a client should fetch a file from."""
+    return storage_path or f"/files/{file_id}/download"
+
+
+def _get_blob(sha256):
+    result = execute(
+        table('blobs').select('sha256, storage_path, ref_count, size, encoding, stored_size').eq('sha256', sha256)
+    )
+    return result.data[0] if result.data else None
+
+
+def _compare_and_set(sha256, expected, new):
+    """Atomically move ref_count from expected to new. Returns False if it changed underneath us."""
+    result = execute(table('blobs').update({"ref_count": new}).eq('sha256', sha256).eq('ref_count', expected))
+    return bool(result.data)
+
+
+def store_blob(body, content_type="application/octet-stream", filename=None):
+    """Stream body (a HashingStream) into content-addressed storage.
+
+    The content is staged under a temporary key because its hash is only known
+    once the last chunk has gone through. Compressible content is gzipped on
+    the way (see compression.py). If a blob with the same SHA-256 is already
+    registered, the staged copy is dropped and the existing blob, stored
+    however it was, gains a reference. Returns a StoredBlob.
+    """
+    storage = get_storage()
+    staging = f"{STAGING_PREFIX}/{uuid.uuid4()}"
+    encoding, stream = compression.encode(body, filename, content_type)
+    storage.upload(staging, stream, content_type)
+    stored_size = stream.size if encoding else body.size
+    try:
+        blob = _acquire(storage, staging, body.checksum, body.size, encoding, stored_size)
+    except Exception:
+        storage.delete([staging])
+        raise
+    if encoding and not blob.deduplicated:
+        compression.record_stored(body.size, stored_size)
+    return blob
+
+
+def _acquire(storage, staging, sha256, size, encoding=None, stored_size=None):
+    moved = None
+    for _ in range(MAX_RETRIES):
+        blob = _get_blob(sha256)
+        if blob is not None:
+            if blob["ref_count"] == GC_TOMBSTONE:
+                # Being collected right now; wait for the row to go away
+                time.sleep(RETRY_DELAY)
+                continue
+            if _compare_and_set(sha256, blob["ref_count"], blob["ref_count"] + 1):
+                if staging is not None:
+                    storage.delete([staging])
+                if moved is not None and moved != blob["storage_path"]:
+                    # Lost a race to the same content stored with another encoding
+                    storage.delete([moved])
+                # Blobs stored before compression have no stored_size
+                return StoredBlob(blob["storage_path"], True, blob.get("encoding"),
+                                  blob.get("stored_size") or blob.get("size"))
+            continue
+
+        path = blob_path(sha256, encoding)
+        if staging is not None:
+            storage.move(staging, path)
+            staging, moved = None, path
+        try:
+            execute(table('blobs').insert({
+                "sha256": sha256,
+                "storage_path": path,
+                "size": size,
+                "encoding": encoding,
+                "stored_size": stored_size,
+                "ref_count": 1,
+            }))
+            return StoredBlob(path, False, encoding, stored_size)
+        except APIError as e:
+            # The same content was registered concurrently; take a reference instead
+            if e.code != UNIQUE_VIOLATION:
+                raise
+    raise RuntimeError(f"Could not acquire blob {sha256}: too much contention")
+
+
+def release_blob(sha256):
+    """Drop one reference. Blobs reaching zero are removed by collect_garbage."""
+    for _ in range(MAX_RETRIES):
+        blob = _get_blob(sha256)
+        if blob is None or blob["ref_count"] <= 0:
+            return
+        if _compare_and_set(sha256, blob["ref_count"], blob["ref_count"] - 1):
+            return
+    raise RuntimeError(f"Could not release blob {sha256}: too much contention")
+
+
+def collect_garbage(limit=100):
+    """Delete up to limit unreferenced blobs. Returns the number removed.
+
+    A blob is first tombstoned (0 -> GC_TOMBSTONE) so a concurrent upload of the
+    same content cannot take a reference while its object is being deleted.
+    """
+    storage = get_storage()
+    candidates = execute(table('blobs').select('sha256, storage_path').eq('ref_count', 0).limit(limit))
+    claimed = [blob for blob in candidates.data or [] if _compare_and_set(blob["sha256"], 0, GC_TOMBSTONE)]
+    if not claimed:
+        return 0
+    # One storage request and one metadata request for the whole batch
+    storage.delete([blob["storage_path"] for blob in claimed])
+    execute(table('blobs').delete().in_('sha256', [blob["sha256"] for blob in claimed]))
+    return len(claimed)
+
+
+def reconcile_references(after=None, limit=100, suspects=None):
+    """Recount the files rows of up to limit blobs (in sha256 order, after after) and repair ref_count.
+
+    A purge deletes a files row before releasing its blob, so a crash in
+    between leaves ref_count one too high and the blob is never collected.
+    Uploads take their reference just before inserting their row, so a count
+    found too high is only lowered once an earlier sweep saw the same gap
+    (suspects maps sha256 to (ref_count, rows) and is updated in place);
+    a count found too low is raised at once. Every repair is a compare-and-set.
+
+    Returns (sha256 to continue after, or None once the end is reached, rows repaired).
+    """
+    suspects = {} if suspects is None else suspects
+    query = table('blobs').select('sha256, ref_count').gte('ref_count', 0)
+    if after is not None:
+        query = query.gt('sha256', after)
+    blobs = execute(query.order('sha256').limit(limit)).data or []
+
+    # Soft-deleted rows still hold their reference until they are purged
+    rows = {}
+    for batch in chunked([blob["sha256"] for blob in blobs]):
+        for row in execute(table('files').select('checksum').in_('checksum', batch)).data or []:
+            rows[row["checksum"]] = rows.get(row["checksum"], 0) + 1
+
+    repaired = 0
+    for blob in blobs:
+        sha256, stored = blob["sha256"], blob["ref_count"]
+        actual = rows.get(sha256, 0)
+        seen = suspects.pop(sha256, None)
+        if actual > stored or (actual < stored and seen == (stored, actual)):
+            repaired += _compare_and_set(sha256, stored, actual)
+        elif actual < stored:
+            suspects[sha256] = (stored, actual)
+    return (blobs[-1]["sha256"] if len(blobs) == limit else None), repaired
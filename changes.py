@@ -0,0 +1,155 @@
+# changes.py
+"""Per-user change feed for sync clients.
+
+Every create, update, move and delete of a file or folder appends a row to
+the changes table, written by a trigger on files and folders (see models.py)
+in the same transaction as the change itself. Rows carry a global sequence
+number, so "what changed since cursor" is one range scan on (user_id, seq):
+polling an account with nothing new reads no rows at all.
+
+A page collapses repeated changes to the same item and returns each item's
+current row, or a tombstone once the item is deleted. Clients should take a
+cursor (GET /changes with no cursor) before their initial full listing, then
+follow next_cursor from there.
+
+Sequence numbers are allocated before commit, so a change can become visible
+after a later one has already been read. The cursor therefore only moves
+past changes older than CHANGE_SETTLE_SECONDS; younger ones are returned
+again on the next poll, which is harmless since each entry is the item's
+latest state. Changes older than CHANGE_RETENTION_DAYS are pruned by the
+purge worker, and a cursor issued before then is rejected so the client
+knows to resync from a full listing.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from data_access import execute, table
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+import sql_reads
+
+CHANGE_RETENTION_DAYS = float(os.getenv("CHANGE_RETENTION_DAYS", 30))
+CHANGE_SETTLE_SECONDS = float(os.getenv("CHANGE_SETTLE_SECONDS", 2))
+
+CHANGE_COLUMNS = 'seq, item_type, item_id, op, changed_at'
+ITEM_COLUMNS = {
+    'file': 'id, file_name, folder_id, file_size, checksum, uploaded_at, updated_at, deleted_at',
+    'folder': 'id, folder_name, parent_id, created_at, updated_at, deleted_at',
+}
+TABLES = {'file': 'files', 'folder': 'folders'}
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def retention_cutoff():
+    return datetime.utcnow() - timedelta(days=CHANGE_RETENTION_DAYS)
+
+
+def _cursor(seq):
+    # Issued-at lags by the settle window: every change after seq is newer than it
+    return encode_cursor({"s": seq, "t": int(time.time() - CHANGE_SETTLE_SECONDS)})
+
+
+def _read_cursor(cursor):
+    position = decode_cursor(cursor)
+    try:
+        seq, issued_at = int(position["s"]), float(position["t"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if issued_at < time.time() - CHANGE_RETENTION_DAYS * 86400:
+        raise CursorExpired("Cursor has expired, resync from a full listing")
+    return seq
+
+
+def _parse_time(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _fetch_changes(user_id, after, limit):
+    if sql_reads.enabled():
+        return sql_reads.list_changes(user_id, after, limit)
+    return execute(
+        table('changes').select(CHANGE_COLUMNS).eq('user_id', user_id).gt('seq', after).order('seq').limit(limit)
+    ).data or []
+
+
+def head(user_id):
+    """A cursor positioned after the user's latest change."""
+    if sql_reads.enabled():
+        rows = sql_reads.list_changes(user_id, None, 1, newest_first=True)
+    else:
+        rows = execute(
+            table('changes').select('seq').eq('user_id', user_id).order('seq', desc=True).limit(1)
+        ).data or []
+    return _cursor(rows[0]['seq'] if rows else 0)
+
+
+def _current_rows(user_id, changes):
+    """Current rows of the changed items that weren't last seen being deleted, by (type, id)."""
+    rows = {}
+    for item_type, table_name in TABLES.items():
+        ids = sorted({c['item_id'] for c in changes if c['item_type'] == item_type and c['op'] != 'delete'})
+        if not ids:
+            continue
+        found = execute(
+            table(table_name).select(ITEM_COLUMNS[item_type]).eq('user_id', user_id).in_('id', ids)
+        ).data or []
+        rows.update({(item_type, row['id']): row for row in found})
+    return rows
+
+
+def list_changes(user_id, cursor, limit=DEFAULT_PAGE_SIZE):
+    """Return (changes, next_cursor, has_more) for one page after cursor.
+
+    Raises ValueError for a malformed cursor and CursorExpired for one older
+    than the retention window.
+    """
+    after = _read_cursor(cursor)
+    page = _fetch_changes(user_id, after, limit)
+
+    # Keep only each item's last change in this page, still reported as a
+    # create if the item was created within it
+    latest = {}
+    for change in page:
+        key = (change['item_type'], change['item_id'])
+        previous = latest.pop(key, None)
+        if previous is not None and previous['op'] == 'create' and change['op'] != 'delete':
+            change = {**change, 'op': 'create'}
+        latest[key] = change
+    rows = _current_rows(user_id, latest.values())
+
+    changes = []
+    for key, change in latest.items():
+        row = rows.get(key)
+        deleted = row is None or row.get('deleted_at') is not None
+        changes.append({
+            "type": change['item_type'],
+            "id": change['item_id'],
+            "op": 'delete' if deleted else change['op'],
+            "changed_at": change['changed_at'],
+            "item": None if deleted else {k: v for k, v in row.items() if k != 'deleted_at'},
+        })
+
+    settled = datetime.utcnow() - timedelta(seconds=CHANGE_SETTLE_SECONDS)
+    next_seq = after
+    for change in page:
+        if _parse_time(change['changed_at']) > settled:
+            break
+        next_seq = change['seq']
+    # A full page of unsettled changes would otherwise be fetched again at once
+    has_more = len(page) == limit and next_seq > after
+    return changes, _cursor(next_seq), has_more
+
+
+def prune(batch_size):
+    """Delete one batch of changes older than the retention window. Returns how many."""
+    rows = execute(
+        table('changes').select('seq').lt('changed_at', retention_cutoff().isoformat()).order('seq').limit(batch_size)
+    ).data or []
+    if not rows:
+        return 0
+    execute(table('changes').delete().lte('seq', rows[-1]['seq']).lt('changed_at', retention_cutoff().isoformat()))
+    return len(rows)
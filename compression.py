@@ -0,0 +1,143 @@
+# compression.py
+"""Transparent gzip of compressible uploads at rest.
+
+Text-like uploads (txt, csv, svg, or a text content type) have a prefix of
+up to COMPRESSION_SAMPLE_SIZE bytes sampled; if a quick compression of it
+saves enough, the whole upload is gzipped chunk by chunk on its way to
+storage, so memory stays at one chunk plus the sample. The checksum and
+file_size always describe the original bytes, and the blob and files rows
+record the encoding and stored_size.
+
+Downloads of a gzipped blob are passed through as Content-Encoding: gzip
+when the client accepts it, and decompressed as they stream otherwise.
+A public URL would serve the gzip bytes with no Content-Encoding, so none is
+recorded for a compressed blob; its file_url is the download endpoint.
+"""
+import os
+import threading
+import zlib
+from itertools import chain
+import metrics
+
+COMPRESSION = os.getenv("COMPRESSION", "gzip")  # 'gzip', or 'off' to store every upload as sent
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+COMPRESSION_SAMPLE_SIZE = int(os.getenv("COMPRESSION_SAMPLE_SIZE", 64 * 1024))
+# Compress only when the sample shrinks to at most this share of its size
+COMPRESSION_MAX_RATIO = float(os.getenv("COMPRESSION_MAX_RATIO", 0.9))
+
+GZIP = 'gzip'
+COMPRESSIBLE_EXTENSIONS = {'txt', 'csv', 'svg'}
+COMPRESSIBLE_TYPES = {'image/svg+xml', 'application/json', 'application/xml'}
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+saved_bytes = metrics.Counter("cloudnest_compression_saved_bytes_total",
+                              "Bytes not stored, or not sent, because the file was kept gzipped.", ("kind",))
+metrics.REGISTRY.append(saved_bytes)
+
+# Savings seen by this worker
+_stats = {
+    "uploads_sampled": 0,
+    "uploads_compressed": 0,
+    "bytes_original": 0,
+    "bytes_stored": 0,
+    "downloads_passed_through": 0,
+    "bytes_sent_saved": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def compressible(filename, content_type=None):
+    """Whether an upload's type is worth sampling at all."""
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    return extension in COMPRESSIBLE_EXTENSIONS or mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def _worth_compressing(sample):
+    # Level 1 is enough to tell text from data that's already compressed
+    return bool(sample) and len(zlib.compress(sample, 1)) <= len(sample) * COMPRESSION_MAX_RATIO
+
+
+class GzipStream:
+    """Gzip chunks on the way through; size is the number of bytes produced."""
+
+    def __init__(self, chunks, level=COMPRESSION_LEVEL):
+        self.chunks = chunks
+        self.level = level
+        self.size = 0
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        for chunk in self.chunks:
+            data = compressor.compress(chunk)
+            if data:
+                self.size += len(data)
+                yield data
+        data = compressor.flush()
+        self.size += len(data)
+        yield data
+
+
+def encode(chunks, filename=None, content_type=None):
+    """Return (encoding, stream) to store for an upload.
+
+    encoding is None when the upload is stored as sent. Only the sampled
+    prefix is read here; the rest is read as the returned stream is.
+    """
+    if COMPRESSION != GZIP or not compressible(filename, content_type):
+        return None, chunks
+    chunks = iter(chunks)
+    sample, sampled = [], 0
+    for chunk in chunks:
+        sample.append(chunk)
+        sampled += len(chunk)
+        if sampled >= COMPRESSION_SAMPLE_SIZE:
+            break
+    stream = chain(sample, chunks)
+    worth_it = _worth_compressing(b''.join(sample)[:COMPRESSION_SAMPLE_SIZE])
+    with _stats_lock:
+        _stats["uploads_sampled"] += 1
+    if not worth_it:
+        return None, stream
+    return GZIP, GzipStream(stream)
+
+
+def decode(chunks, encoding):
+    """Yield the original bytes of a stored object's chunks."""
+    if encoding != GZIP:
+        yield from chunks
+        return
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def record_stored(size, stored_size):
+    """Count a newly stored compressed blob."""
+    with _stats_lock:
+        _stats["uploads_compressed"] += 1
+        _stats["bytes_original"] += size
+        _stats["bytes_stored"] += stored_size
+    saved_bytes.inc(size - stored_size, kind="stored")
+
+
+def record_sent(size, sent_size):
+    """Count a download sent gzipped instead of decompressed."""
+    with _stats_lock:
+        _stats["downloads_passed_through"] += 1
+        _stats["bytes_sent_saved"] += size - sent_size
+    saved_bytes.inc(size - sent_size, kind="transferred")
+
+
+def stats():
+    with _stats_lock:
+        report = dict(_stats)
+    report["enabled"] = COMPRESSION == GZIP
+    report["bytes_stored_saved"] = report["bytes_original"] - report["bytes_stored"]
+    report["ratio"] = report["bytes_stored"] / report["bytes_original"] if report["bytes_original"] else None
+    return report
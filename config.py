@@ -0,0 +1,25 @@
+# config.py
+"""Application settings, read from the environment (and .env) once.
+
+create_app() loads Config into app.config. Modules that need a setting
+outside a request import it from here instead of loading .env themselves.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Config:
+    SUPABASE_URL = os.getenv("SUPABASE_URL")
+    SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
+
+    # Optional: direct SQL reads (sql_reads.py) and Flask-Migrate
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Run the purge loop inside each web worker
+    PURGE_WORKER = os.getenv("PURGE_WORKER") == "1"
@@ -0,0 +1,116 @@
+# data_access.py
+import contextvars
+import threading
+from postgrest.exceptions import APIError
+from supabase_client import get_supabase, with_retries
+
+UNIQUE_VIOLATION = "23505"
+# Values per in_() filter; each one goes into the request URL
+IN_FILTER_SIZE = 200
+
+class RoundTripCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+# Holds a shared counter object, so work handed to other threads with
+# contextvars.copy_context() still counts towards the originating request
+_round_trips = contextvars.ContextVar("round_trips", default=None)
+
+
+def reset_round_trips():
+    _round_trips.set(RoundTripCounter())
+
+
+def round_trips():
+    """PostgREST requests made in the current request (or thread) so far."""
+    counter = _round_trips.get()
+    return counter.count if counter else 0
+
+
+def count_round_trip():
+    """Record one metadata round trip made outside execute() (e.g. direct SQL)."""
+    counter = _round_trips.get()
+    if counter is None:
+        reset_round_trips()
+        counter = _round_trips.get()
+    counter.increment()
+
+
+def execute(query):
+    """Run a PostgREST query builder, counting it as one round trip.
+
+    Reads are retried with jittered backoff on connection errors; writes only
+    when the request never reached the server.
+    """
+    count_round_trip()
+    return with_retries(getattr(query, 'http_method', 'POST'), query.execute)
+
+
+def table(name):
+    return get_supabase().table(name)
+
+
+def chunked(values, size=None):
+    """Split values into lists short enough for one in_() filter."""
+    values, size = list(values), size or IN_FILTER_SIZE
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def quote(value):
+    # Values inside an or=(...) filter are quoted so commas and parentheses are literal
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def find_conflicting_user(username, email):
+    """Return which of 'username' / 'email' are already taken, in one projected query."""
+    result = execute(
+        table('users').select('username, email').or_(f"username.eq.{quote(username)},email.eq.{quote(email)}")
+    )
+    taken = set()
+    for row in result.data or []:
+        if row.get('username') == username:
+            taken.add('username')
+        if row.get('email') == email:
+            taken.add('email')
+    return taken
+
+
+def create_user(username, email, password_hash):
+    """Insert a user, relying on the unique constraints instead of checking first.
+
+    Returns (user, taken). On a conflict user is None and taken names the
+    duplicate fields, which costs one extra query only on that path.
+    """
+    try:
+        result = execute(table('users').insert({
+            "username": username,
+            "email": email,
+            "password": password_hash
+        }))
+    except APIError as e:
+        if e.code != UNIQUE_VIOLATION:
+            raise
+        return None, find_conflicting_user(username, email) or {'username'}
+    return result.data[0], set()
+
+
+def insert_many(table_name, rows):
+    """Insert rows in a single request and return the created rows."""
+    if not rows:
+        return []
+    return execute(table(table_name).insert(list(rows))).data or []
+
+
+def update_many(table_name, values, ids, key='id'):
+    """Apply the same update to every row whose key is in ids, in one request."""
+    ids = list(ids)
+    if not ids:
+        return []
+    return execute(table(table_name).update(values).in_(key, ids)).data or []
@@ -0,0 +1,147 @@
+# export.py
+"""Streaming ZIP export of a folder tree.
+
+Entries are written one object at a time into a small buffer that is handed
+to the client as soon as it has bytes in it, so memory stays at about one
+storage chunk whatever the folder size. The output can't seek, so zipfile
+writes each entry's sizes and CRC in a data descriptor after its data.
+"""
+import zipfile
+from collections import namedtuple
+from datetime import datetime
+from blobs import blob_path
+from compression import decode
+from data_access import chunked, execute, table
+from namespace import get_folder_row, subtree_ids
+from storage import ObjectNotFound, get_storage
+
+# Text formats shrink well; everything else we accept is already compressed
+DEFLATE_EXTENSIONS = {'txt', 'csv', 'svg'}
+EXPORT_BATCH_SIZE = 1000
+
+# checksum is None for directory entries; encoding is how the blob is stored
+Entry = namedtuple('Entry', 'name checksum size modified encoding', defaults=(None,))
+
+
+class _Sink:
+    """Write-only, unseekable file object that collects what zipfile writes."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compression_for(name):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return zipfile.ZIP_DEFLATED if extension in DEFLATE_EXTENSIONS else zipfile.ZIP_STORED
+
+
+def _zip_time(value):
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        moment = datetime.utcnow()
+    # ZIP timestamps start in 1980
+    return max(moment.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _unique(name, taken):
+    if name not in taken:
+        taken.add(name)
+        return name
+    stem, dot, extension = name.rpartition('.') if '.' in name.rsplit('/', 1)[-1] else (name, '', '')
+    counter = 1
+    while f"{stem} ({counter}){dot}{extension}" in taken:
+        counter += 1
+    name = f"{stem} ({counter}){dot}{extension}"
+    taken.add(name)
+    return name
+
+
+def folder_entries(user_id, folder_id):
+    """List the archive entries for a folder and everything beneath it.
+
+    Only metadata is read here, so a missing folder is reported before any
+    of the response is sent. Raises namespace.NotFound.
+    """
+    root = get_folder_row(user_id, folder_id, 'id, folder_name')
+    ids = subtree_ids(user_id, root['id'])
+    by_id = {}
+    for batch in chunked(ids):
+        folders = execute(
+            table('folders').select('id, parent_id, folder_name').eq('user_id', user_id).in_('id', batch)
+        ).data or []
+        by_id.update((folder['id'], folder) for folder in folders)
+
+    taken, paths = set(), {}
+
+    def path_of(current):
+        if current not in paths:
+            folder = by_id[current]
+            parent = '' if current == root['id'] else path_of(folder['parent_id'])
+            paths[current] = _unique(f"{parent}{folder['folder_name']}", taken) + '/'
+        return paths[current]
+
+    entries = [Entry(path_of(current), None, 0, None) for current in ids]
+
+    for batch in chunked(ids):
+        after = 0
+        while True:
+            files = execute(
+                table('files').select('id, file_name, folder_id, checksum, encoding, file_size, uploaded_at')
+                .eq('user_id', user_id).in_('folder_id', batch).is_('deleted_at', 'null')
+                .gt('id', after).order('id').limit(EXPORT_BATCH_SIZE)
+            ).data or []
+            for file in files:
+                if file.get('checksum'):
+                    name = _unique(path_of(file['folder_id']) + file['file_name'], taken)
+                    entries.append(Entry(name, file['checksum'], int(file['file_size'] or 0), file.get('uploaded_at'),
+                                         file.get('encoding')))
+            if len(files) < EXPORT_BATCH_SIZE:
+                break
+            after = files[-1]['id']
+    return root, entries
+
+
+def stream_zip(entries):
+    """Yield a ZIP archive of entries, reading each object only as it is written."""
+    storage = get_storage()
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for entry in entries:
+            if entry.checksum is None:
+                archive.writestr(zipfile.ZipInfo(entry.name), b'')
+                continue
+
+            chunks = decode(storage.open(blob_path(entry.checksum, entry.encoding)), entry.encoding)
+            try:
+                first = next(chunks, b'')
+            except ObjectNotFound:
+                # Purged after the listing was taken
+                continue
+
+            info = zipfile.ZipInfo(entry.name, _zip_time(entry.modified))
+            info.compress_type = compression_for(entry.name)
+            info.file_size = entry.size
+            with archive.open(info, 'w', force_zip64=entry.size >= zipfile.ZIP64_LIMIT) as destination:
+                destination.write(first)
+                for chunk in chunks:
+                    data = sink.drain()
+                    if data:
+                        yield data
+                    destination.write(chunk)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
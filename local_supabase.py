@@ -0,0 +1,466 @@
+# local_supabase.py
+"""A local stand-in for the parts of Supabase this service uses.
+
+Serves a PostgREST subset (/rest/v1/<table>) backed by in-memory tables and
+the storage object API (/storage/v1/object/...) backed by a directory, so the
+app, its tests and benchmarks can run without a live Supabase project.
+
+    python local_supabase.py --port 54321 --latency 20
+
+then point SUPABASE_URL at http://127.0.0.1:54321 (any JWT-shaped
+SUPABASE_KEY is accepted).
+"""
+import argparse
+import itertools
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.serving import make_server
+
+# Columns that must be unique per table; the first one is the primary key.
+# Tables keyed on "id" get an auto-incrementing id when none is supplied.
+UNIQUE_COLUMNS = {
+    "users": ["id", "username", "email"],
+    "blobs": ["sha256"],
+    "user_usage": ["user_id"],
+    "folder_usage": ["folder_id"],
+    "changes": ["seq"],
+}
+CHUNK_SIZE = 64 * 1024
+
+
+def _adjust_usage(tables, row, sign):
+    if row is None or row.get('deleted_at') is not None:
+        return
+    size = int(row.get('file_size') or 0)
+    targets = [('user_usage', 'user_id', row.get('user_id'), {})]
+    if row.get('folder_id') is not None:
+        targets.append(('folder_usage', 'folder_id', row['folder_id'], {"user_id": row.get('user_id')}))
+    for name, key, value, extra in targets:
+        rows = tables.setdefault(name, [])
+        usage = next((r for r in rows if r.get(key) == value), None)
+        if usage is None:
+            usage = {key: value, **extra, "bytes_used": 0, "file_count": 0}
+            rows.append(usage)
+        usage["bytes_used"] += sign * size
+        usage["file_count"] += sign
+
+
+def _file_usage_trigger(tables, old, new):
+    """Mirror of the apply_file_usage trigger in models.py."""
+    _adjust_usage(tables, old, -1)
+    _adjust_usage(tables, new, 1)
+
+
+_change_seq = itertools.count(1)
+
+
+def _change_op(old, new, parent_column):
+    if old is None:
+        return 'create'
+    if new is None:
+        return None if old.get('deleted_at') is not None else 'delete'
+    was_live, is_live = old.get('deleted_at') is None, new.get('deleted_at') is None
+    if was_live and not is_live:
+        return 'delete'
+    if is_live and not was_live:
+        return 'create'
+    if not is_live or old == new:
+        return None
+    return 'move' if old.get(parent_column) != new.get(parent_column) else 'update'
+
+
+def _change_log_trigger(item_type, parent_column):
+    """Mirror of the record_change trigger in models.py."""
+    def trigger(tables, old, new):
+        op = _change_op(old, new, parent_column)
+        if op is None:
+            return
+        row = new if new is not None else old
+        tables.setdefault('changes', []).append({
+            "seq": next(_change_seq),
+            "user_id": row.get('user_id'),
+            "item_type": item_type,
+            "item_id": row.get('id'),
+            "op": op,
+            "changed_at": datetime.utcnow().isoformat(),
+        })
+    return trigger
+
+
+# Row triggers, called as trigger(tables, old_row, new_row) inside the write lock
+TRIGGERS = {
+    "files": (_file_usage_trigger, _change_log_trigger('file', 'folder_id')),
+    "folders": (_change_log_trigger('folder', 'parent_id'),),
+}
+
+
+def _split_top_level(expr):
+    """Split a PostgREST logical expression on commas outside parentheses and quotes."""
+    parts, depth, quoted, current = [], 0, False, ''
+    for i, char in enumerate(expr):
+        if char == '"' and (i == 0 or expr[i - 1] != '\\'):
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+def _coerce(value, like):
+    """Convert a filter value to the type of the stored value it is compared with."""
+    if like is None or isinstance(like, str):
+        return value
+    if isinstance(like, bool):
+        return value.lower() == 'true'
+    try:
+        return type(like)(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _like(pattern, value, case_sensitive):
+    # PostgREST accepts * for %; a backslash makes the next character literal
+    regex, chars = '', iter(pattern)
+    for char in chars:
+        if char == '\\':
+            regex += re.escape(next(chars, '\\'))
+        elif char in '%*':
+            regex += '.*'
+        elif char == '_':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+    return re.fullmatch(regex, value, re.DOTALL if case_sensitive else re.DOTALL | re.IGNORECASE) is not None
+
+
+def _compare(op, row_value, raw):
+    if op == 'is':
+        raw = raw.lower()
+        if raw == 'null':
+            return row_value is None
+        return row_value is (raw == 'true')
+    if op == 'in':
+        values = [_unquote(v) for v in _split_top_level(raw.strip('()'))]
+        return row_value is not None and row_value in [_coerce(v, row_value) for v in values]
+    if row_value is None:
+        return False
+    value = _coerce(_unquote(raw), row_value)
+    if op == 'eq':
+        return row_value == value
+    if op == 'neq':
+        return row_value != value
+    if op == 'like':
+        return _like(value, str(row_value), True)
+    if op == 'ilike':
+        return _like(value, str(row_value), False)
+    try:
+        if op == 'gt':
+            return row_value > value
+        if op == 'gte':
+            return row_value >= value
+        if op == 'lt':
+            return row_value < value
+        if op == 'lte':
+            return row_value <= value
+    except TypeError:
+        return str(row_value) > str(value) if op in ('gt', 'gte') else str(row_value) < str(value)
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _column_filter(column, expr):
+    """Build a predicate for ?column=op.value (optionally not.op.value)."""
+    negate = expr.startswith('not.')
+    if negate:
+        expr = expr[len('not.'):]
+    op, _, raw = expr.partition('.')
+    return lambda row: _compare(op, row.get(column), raw) != negate
+
+
+def _logical_filter(kind, expr):
+    """Build a predicate for or=(...) / and=(...), including nested and()/or()."""
+    predicates = []
+    for part in _split_top_level(expr.strip()[1:-1]):
+        if part.startswith(('and(', 'or(', 'not.and(', 'not.or(')):
+            negate = part.startswith('not.')
+            inner_kind, _, inner = part[len('not.') if negate else 0:].partition('(')
+            inner_predicate = _logical_filter(inner_kind, '(' + inner)
+            predicates.append(lambda row, p=inner_predicate, n=negate: p(row) != n)
+        else:
+            column, _, column_expr = part.partition('.')
+            predicates.append(_column_filter(column, column_expr))
+    if kind == 'or':
+        return lambda row: any(p(row) for p in predicates)
+    return lambda row: all(p(row) for p in predicates)
+
+
+def _project(row, select):
+    if not select or select == '*':
+        return dict(row)
+    columns = [c.strip() for c in select.split(',') if c.strip()]
+    return {c: row.get(c) for c in columns}
+
+
+def _prefer(name):
+    for item in request.headers.get('Prefer', '').split(','):
+        key, _, value = item.strip().partition('=')
+        if key == name:
+            return value
+    return None
+
+
+def create_app(storage_root=None, latency=0.0):
+    """Build the stand-in WSGI app. latency (seconds) is added to every request."""
+    app = Flask(__name__)
+    tables = {}
+    sequences = {}
+    lock = threading.Lock()
+    storage_root = storage_root or tempfile.mkdtemp(prefix='local_supabase_')
+    app.config['TABLES'] = tables
+    app.config['STORAGE_ROOT'] = storage_root
+
+    def conflict(column, value):
+        return jsonify({
+            "code": "23505",
+            "message": "duplicate key value violates unique constraint",
+            "details": f"Key ({column})=({value}) already exists.",
+            "hint": None,
+        }), 409
+
+    def fire(name, old, new):
+        for trigger in TRIGGERS.get(name, ()):
+            trigger(tables, old, new)
+
+    @app.before_request
+    def simulate_latency():
+        if latency:
+            time.sleep(latency)
+
+    def matching_rows(name):
+        predicates = []
+        for key, value in request.args.items(multi=True):
+            if key in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            if key in ('or', 'and'):
+                predicates.append(_logical_filter(key, value))
+            else:
+                predicates.append(_column_filter(key, value))
+        return [row for row in tables.setdefault(name, []) if all(p(row) for p in predicates)]
+
+    def respond(rows, status=200, total=None):
+        select = request.args.get('select')
+        if _prefer('return') == 'minimal':
+            response = Response(status=201 if status == 201 else 204)
+        else:
+            response = Response(json.dumps([_project(r, select) for r in rows], default=str),
+                                status=status, mimetype='application/json')
+        if _prefer('count'):
+            count = len(rows) if total is None else total
+            start = int(request.args.get('offset', 0))
+            end = start + len(rows) - 1
+            response.headers['Content-Range'] = f"{start}-{end}/{count}" if rows else f"*/{count}"
+        return response
+
+    @app.route('/rest/v1/<name>', methods=['GET', 'HEAD'])
+    def select_rows(name):
+        with lock:
+            rows = matching_rows(name)
+            for part in reversed((request.args.get('order') or '').split(',')):
+                if not part:
+                    continue
+                column, _, direction = part.partition('.')
+                descending = direction.startswith('desc')
+                rows.sort(key=lambda r: (r.get(column) is None, r.get(column)) if not descending
+                          else (r.get(column) is not None, r.get(column)), reverse=descending)
+            total = len(rows)
+            offset = int(request.args.get('offset', 0))
+            limit = request.args.get('limit')
+            rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+            return respond([dict(r) for r in rows], total=total)
+
+    @app.route('/rest/v1/<name>', methods=['POST'])
+    def insert_rows(name):
+        payload = request.get_json()
+        payload = payload if isinstance(payload, list) else [payload]
+        unique = UNIQUE_COLUMNS.get(name, ["id"])
+        merge = _prefer('resolution')
+        on_conflict = request.args.get('on_conflict') or unique[0]
+        with lock:
+            rows = tables.setdefault(name, [])
+            sequence = sequences.setdefault(name, itertools.count(1))
+            created = []
+            for values in payload:
+                values = dict(values)
+                if unique[0] == 'id' and values.get('id') is None:
+                    values['id'] = next(sequence)
+                existing = next((r for r in rows if r.get(on_conflict) == values.get(on_conflict)), None)
+                if existing is not None and merge == 'merge-duplicates':
+                    old = dict(existing)
+                    existing.update(values)
+                    fire(name, old, existing)
+                    created.append(dict(existing))
+                    continue
+                if existing is not None and merge == 'ignore-duplicates':
+                    continue
+                for column in unique:
+                    if values.get(column) is not None and any(r.get(column) == values[column] for r in rows):
+                        return conflict(column, values[column])
+                rows.append(values)
+                fire(name, None, values)
+                created.append(dict(values))
+            return respond(created, status=201)
+
+    @app.route('/rest/v1/<name>', methods=['PATCH'])
+    def update_rows(name):
+        values = request.get_json()
+        with lock:
+            rows = matching_rows(name)
+            for row in rows:
+                old = dict(row)
+                row.update(values)
+                fire(name, old, row)
+            return respond([dict(r) for r in rows])
+
+    @app.route('/rest/v1/<name>', methods=['DELETE'])
+    def delete_rows(name):
+        with lock:
+            rows = matching_rows(name)
+            ids = {id(r) for r in rows}
+            tables[name] = [r for r in tables.get(name, []) if id(r) not in ids]
+            for row in rows:
+                fire(name, row, None)
+            return respond(rows)
+
+    def object_path(bucket, key):
+        path = os.path.abspath(os.path.join(storage_root, bucket, key))
+        if not path.startswith(os.path.abspath(storage_root) + os.sep):
+            raise ValueError(key)
+        return path
+
+    def storage_error(status, message):
+        return jsonify({"statusCode": str(status), "error": message, "message": message}), status
+
+    @app.route('/storage/v1/object/<bucket>/<path:key>', methods=['POST', 'PUT'])
+    def put_object(bucket, key):
+        path = object_path(bucket, key)
+        if os.path.exists(path) and request.method == 'POST' and request.headers.get('x-upsert') != 'true':
+            return storage_error(400, "The resource already exists")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        source = next(iter(request.files.values())).stream if request.files else request.stream
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+        except OSError:
+            # The client aborted the upload part way through
+            os.remove(tmp_path)
+            return storage_error(400, "Upload interrupted")
+        os.replace(tmp_path, path)
+        return jsonify({"Key": f"{bucket}/{key}", "Id": str(uuid.uuid4())})
+
+    @app.route('/storage/v1/object/<bucket>/<path:key>', methods=['GET'])
+    @app.route('/storage/v1/object/public/<bucket>/<path:key>', methods=['GET'])
+    @app.route('/storage/v1/object/authenticated/<bucket>/<path:key>', methods=['GET'])
+    def get_object(bucket, key):
+        path = object_path(bucket, key)
+        if not os.path.isfile(path):
+            return storage_error(404, "Object not found")
+
+        # Honours Range like Supabase storage does
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        return send_file(path, mimetype=content_type, conditional=True, etag=False)
+
+    @app.route('/storage/v1/object/<bucket>', methods=['DELETE'])
+    def delete_objects(bucket):
+        removed = []
+        for key in (request.get_json() or {}).get('prefixes', []):
+            path = object_path(bucket, key)
+            if os.path.isfile(path):
+                os.remove(path)
+                removed.append({"name": key, "bucket_id": bucket})
+        return jsonify(removed)
+
+    @app.route('/storage/v1/object/list/<bucket>', methods=['POST'])
+    def list_objects(bucket):
+        body = request.get_json() or {}
+        prefix = body.get('prefix') or ''
+        directory = object_path(bucket, prefix) if prefix else os.path.join(storage_root, bucket)
+        if not os.path.isdir(directory):
+            return jsonify([])
+        search = body.get('search') or ''
+        entries = []
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if search and search not in entry.name or entry.name.endswith('.part'):
+                continue
+            if entry.is_dir():
+                entries.append({"name": entry.name, "id": None, "metadata": None})
+            else:
+                stat = entry.stat()
+                entries.append({
+                    "name": entry.name,
+                    "id": entry.name,
+                    "updated_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime)),
+                    "metadata": {"size": stat.st_size, "mimetype": mimetypes.guess_type(entry.name)[0]},
+                })
+        offset = int(body.get('offset', 0))
+        return jsonify(entries[offset:offset + int(body.get('limit', 100))])
+
+    @app.route('/storage/v1/object/move', methods=['POST'])
+    def move_object():
+        body = request.get_json()
+        source = object_path(body['bucketId'], body['sourceKey'])
+        destination = object_path(body['bucketId'], body['destinationKey'])
+        if not os.path.isfile(source):
+            return storage_error(404, "Object not found")
+        if os.path.exists(destination):
+            return storage_error(400, "The resource already exists")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(source, destination)
+        return jsonify({"message": "Successfully moved"})
+
+    return app
+
+
+def serve(host='127.0.0.1', port=0, storage_root=None, latency=0.0):
+    """Start the stand-in on a background thread. Returns (server, base_url)."""
+    server = make_server(host, port, create_app(storage_root, latency), threaded=True)
+    threading.Thread(target=server.serve_forever, name='local-supabase', daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Supabase stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--storage-root', default=None)
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds added to every request")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, create_app(args.storage_root, args.latency / 1000), threaded=True)
+    print(f"Local Supabase listening on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
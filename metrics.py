@@ -0,0 +1,194 @@
+# metrics.py
+"""Per-worker request metrics in the Prometheus text format.
+
+Stage timings, per-request round trips and bytes transferred are kept in
+fixed-bucket histograms and counters guarded by one lock each, so recording
+costs a bisect and an addition. Like the cache stats, values are per
+worker: each gunicorn worker keeps and serves its own.
+
+Slow requests can optionally be profiled: with PROFILE_SLOW_REQUESTS set to
+a sampling rate (0-1), that share of requests has its thread's stack sampled
+every PROFILE_INTERVAL seconds, and the collapsed stacks of any that take
+longer than SLOW_REQUEST_SECONDS are written to PROFILE_DIR.
+"""
+import bisect
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 2))
+PROFILE_SLOW_REQUESTS = float(os.getenv("PROFILE_SLOW_REQUESTS", 0))  # share of requests sampled, 0 disables
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getcwd(), 'profiles'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 12, 20, 50)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+request_seconds = Histogram("cloudnest_request_seconds", "Request latency.", ("endpoint", "method", "status"))
+stage_seconds = Histogram("cloudnest_stage_seconds", "Time spent in each stage of a request.", ("endpoint", "stage"))
+round_trips = Histogram("cloudnest_request_round_trips", "PostgREST round trips per request.", ("endpoint",),
+                        buckets=COUNT_BUCKETS)
+storage_requests = Counter("cloudnest_storage_requests_total", "Requests made to the storage backend.", ("op",))
+bytes_transferred = Counter("cloudnest_bytes_total", "File bytes received from and sent to clients.",
+                            ("endpoint", "direction"))
+slow_requests = Counter("cloudnest_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.", ("endpoint",))
+
+REGISTRY = [request_seconds, stage_seconds, round_trips, storage_requests, bytes_transferred, slow_requests]
+
+# Endpoint of the request being served, used to label stage timings
+_endpoint = contextvars.ContextVar("metrics_endpoint", default="")
+
+
+def set_endpoint(endpoint):
+    _endpoint.set(endpoint or "")
+
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, endpoint=_endpoint.get(), stage=stage)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def count_bytes(direction, amount):
+    if amount:
+        bytes_transferred.inc(amount, endpoint=_endpoint.get(), direction=direction)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class StackSampler:
+    """Samples one thread's stack on a background thread until stopped."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def start_profile():
+    """Begin sampling the calling thread if this request is picked; returns the sampler or None."""
+    if PROFILE_SLOW_REQUESTS and random.random() < PROFILE_SLOW_REQUESTS:
+        return StackSampler(threading.get_ident())
+    return None
+
+
+def finish_request(endpoint, method, status, seconds, trips, sampler=None):
+    """Record a finished request, writing its profile if it was sampled and slow."""
+    request_seconds.observe(seconds, endpoint=endpoint, method=method, status=status)
+    round_trips.observe(trips, endpoint=endpoint)
+    stacks = sampler.stop() if sampler is not None else None
+    if seconds < SLOW_REQUEST_SECONDS:
+        return
+    slow_requests.inc(endpoint=endpoint)
+    if stacks:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{os.getpid()}-{endpoint or 'unknown'}.folded")
+        with open(path, 'w') as f:
+            # Collapsed-stack format, ready for flamegraph.pl or speedscope
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
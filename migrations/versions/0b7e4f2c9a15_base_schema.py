@@ -0,0 +1,85 @@
+"""base schema
+
+The users, files, folders and blobs tables as the app used them before
+Alembic was introduced: files with checksum and a nullable deleted_at,
+folders with parent_id and their listing indexes, and the content-addressed
+blobs table.
+
+Every statement is IF NOT EXISTS, so this creates the schema on an empty
+database and brings one that already has the original tables up to date.
+
+Revision ID: 0b7e4f2c9a15
+Revises:
+Create Date: 2026-10-17 16:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e4f2c9a15'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(100) NOT NULL UNIQUE,
+            email VARCHAR(120) NOT NULL UNIQUE,
+            password_hash VARCHAR(128) NOT NULL
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS folders (
+            id SERIAL PRIMARY KEY,
+            folder_name VARCHAR NOT NULL,
+            user_id VARCHAR NOT NULL,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            id SERIAL PRIMARY KEY,
+            file_name VARCHAR NOT NULL,
+            user_id VARCHAR NOT NULL,
+            file_size TEXT,
+            storage_path TEXT,
+            folder_id INTEGER,
+            uploaded_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+    """)
+
+    # Added for content addressing, nested folders and soft delete
+    op.execute("ALTER TABLE files ADD COLUMN IF NOT EXISTS checksum VARCHAR(64)")
+    op.execute("ALTER TABLE folders ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES folders (id)")
+    # deleted_at used to default to now(), which would mark every new row deleted
+    op.execute("ALTER TABLE files ALTER COLUMN deleted_at DROP DEFAULT")
+    op.execute("ALTER TABLE folders ALTER COLUMN deleted_at DROP DEFAULT")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_folders_user_id_id ON folders (user_id, id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_folders_user_id_parent_id ON folders (user_id, parent_id)")
+
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 VARCHAR(64) PRIMARY KEY,
+            storage_path TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT now()
+        )
+    """)
+
+
+def downgrade():
+    # Only what this revision added to the original tables is removed
+    op.execute("DROP TABLE IF EXISTS blobs")
+    op.execute("DROP INDEX IF EXISTS ix_folders_user_id_parent_id")
+    op.execute("DROP INDEX IF EXISTS ix_folders_user_id_id")
+    op.execute("ALTER TABLE folders DROP COLUMN IF EXISTS parent_id")
+    op.execute("ALTER TABLE files DROP COLUMN IF EXISTS checksum")
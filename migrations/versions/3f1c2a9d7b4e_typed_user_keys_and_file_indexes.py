@@ -0,0 +1,81 @@
+"""typed user keys and file indexes
+
+files.user_id and folders.user_id (and the usage counters keyed on them)
+were text while users.id is an integer, and nothing on files was indexed.
+This types them as integers with foreign keys and adds the indexes the
+listing, recent-uploads and purge queries read through.
+
+Revision ID: 3f1c2a9d7b4e
+Revises: 5a9d3e1b7c40
+Create Date: 2026-10-17 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b4e'
+down_revision = '5a9d3e1b7c40'
+branch_labels = None
+depends_on = None
+
+USER_KEYED_TABLES = ('files', 'folders', 'user_usage', 'folder_usage')
+LIVE = sa.text('deleted_at IS NULL')
+DELETED = sa.text('deleted_at IS NOT NULL')
+
+ADJUST_USAGE = """
+CREATE OR REPLACE FUNCTION adjust_usage(p_user_id {user_type}, p_folder_id integer, p_bytes bigint, p_files integer)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO user_usage (user_id, bytes_used, file_count) VALUES (p_user_id, p_bytes, p_files)
+    ON CONFLICT (user_id) DO UPDATE SET bytes_used = user_usage.bytes_used + EXCLUDED.bytes_used,
+                                        file_count = user_usage.file_count + EXCLUDED.file_count;
+    IF p_folder_id IS NOT NULL THEN
+        INSERT INTO folder_usage (folder_id, user_id, bytes_used, file_count) VALUES (p_folder_id, p_user_id, p_bytes, p_files)
+        ON CONFLICT (folder_id) DO UPDATE SET bytes_used = folder_usage.bytes_used + EXCLUDED.bytes_used,
+                                              file_count = folder_usage.file_count + EXCLUDED.file_count;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade():
+    # The usage trigger calls adjust_usage by signature, so swap it with the column types
+    op.execute("DROP FUNCTION IF EXISTS adjust_usage(text, integer, bigint, integer)")
+    for table_name in USER_KEYED_TABLES:
+        op.alter_column(table_name, 'user_id', type_=sa.Integer(), existing_nullable=False,
+                        postgresql_using='user_id::integer')
+    op.execute(ADJUST_USAGE.format(user_type='integer'))
+
+    for table_name in USER_KEYED_TABLES:
+        op.create_foreign_key(f'fk_{table_name}_user_id_users', table_name, 'users',
+                              ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('fk_files_folder_id_folders', 'files', 'folders', ['folder_id'], ['id'])
+
+    op.create_index('ix_files_user_id_folder_id_id', 'files', ['user_id', 'folder_id', 'id'],
+                    postgresql_where=LIVE)
+    op.create_index('ix_files_user_id_uploaded_at', 'files',
+                    ['user_id', sa.text('uploaded_at DESC'), sa.text('id DESC')], postgresql_where=LIVE)
+    op.create_index('ix_files_folder_id', 'files', ['folder_id'])
+    op.create_index('ix_files_deleted_at', 'files', ['deleted_at'], postgresql_where=DELETED)
+    op.create_index('ix_folders_deleted_at', 'folders', ['deleted_at'], postgresql_where=DELETED)
+
+
+def downgrade():
+    op.drop_index('ix_folders_deleted_at', table_name='folders')
+    op.drop_index('ix_files_deleted_at', table_name='files')
+    op.drop_index('ix_files_folder_id', table_name='files')
+    op.drop_index('ix_files_user_id_uploaded_at', table_name='files')
+    op.drop_index('ix_files_user_id_folder_id_id', table_name='files')
+
+    op.drop_constraint('fk_files_folder_id_folders', 'files', type_='foreignkey')
+    for table_name in USER_KEYED_TABLES:
+        op.drop_constraint(f'fk_{table_name}_user_id_users', table_name, type_='foreignkey')
+
+    op.execute("DROP FUNCTION IF EXISTS adjust_usage(integer, integer, bigint, integer)")
+    for table_name in USER_KEYED_TABLES:
+        op.alter_column(table_name, 'user_id', type_=sa.String(), existing_nullable=False,
+                        postgresql_using='user_id::text')
+    op.execute(ADJUST_USAGE.format(user_type='text'))
@@ -0,0 +1,109 @@
+"""usage counters
+
+files.file_size becomes a BIGINT byte count (empty or missing sizes become
+0). Adds user_usage and folder_usage, fills them from the live files, and
+installs the files trigger that keeps them current from then on.
+
+Revision ID: 5a9d3e1b7c40
+Revises: 0b7e4f2c9a15
+Create Date: 2026-10-17 16:35:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9d3e1b7c40'
+down_revision = '0b7e4f2c9a15'
+branch_labels = None
+depends_on = None
+
+FILE_USAGE_TRIGGER = """
+CREATE OR REPLACE FUNCTION adjust_usage(p_user_id text, p_folder_id integer, p_bytes bigint, p_files integer)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO user_usage (user_id, bytes_used, file_count) VALUES (p_user_id, p_bytes, p_files)
+    ON CONFLICT (user_id) DO UPDATE SET bytes_used = user_usage.bytes_used + EXCLUDED.bytes_used,
+                                        file_count = user_usage.file_count + EXCLUDED.file_count;
+    IF p_folder_id IS NOT NULL THEN
+        INSERT INTO folder_usage (folder_id, user_id, bytes_used, file_count) VALUES (p_folder_id, p_user_id, p_bytes, p_files)
+        ON CONFLICT (folder_id) DO UPDATE SET bytes_used = folder_usage.bytes_used + EXCLUDED.bytes_used,
+                                              file_count = folder_usage.file_count + EXCLUDED.file_count;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_file_usage() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id
+       AND OLD.folder_id IS NOT DISTINCT FROM NEW.folder_id
+       AND OLD.file_size IS NOT DISTINCT FROM NEW.file_size
+       AND (OLD.deleted_at IS NULL) = (NEW.deleted_at IS NULL) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        IF OLD.deleted_at IS NULL THEN
+            PERFORM adjust_usage(OLD.user_id, OLD.folder_id, -OLD.file_size, -1);
+        END IF;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        IF NEW.deleted_at IS NULL THEN
+            PERFORM adjust_usage(NEW.user_id, NEW.folder_id, NEW.file_size, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER files_usage AFTER INSERT OR UPDATE OR DELETE ON files
+FOR EACH ROW EXECUTE FUNCTION apply_file_usage();
+"""
+
+
+def upgrade():
+    op.alter_column('files', 'file_size', type_=sa.BigInteger(), existing_type=sa.Text(),
+                    postgresql_using="COALESCE(NULLIF(trim(file_size), '')::bigint, 0)")
+    op.execute("UPDATE files SET file_size = 0 WHERE file_size IS NULL")
+    op.alter_column('files', 'file_size', existing_type=sa.BigInteger(), nullable=False, server_default='0')
+
+    op.create_table(
+        'user_usage',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('bytes_used', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('file_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'folder_usage',
+        sa.Column('folder_id', sa.Integer(), sa.ForeignKey('folders.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('bytes_used', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('file_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+    # Writes to files wait until the trigger is in place, so none are missed
+    # between the backfill and the first trigger-maintained change
+    op.execute("LOCK TABLE files IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("""
+        INSERT INTO user_usage (user_id, bytes_used, file_count)
+        SELECT user_id, SUM(file_size), COUNT(*) FROM files WHERE deleted_at IS NULL GROUP BY user_id
+    """)
+    op.execute("""
+        INSERT INTO folder_usage (folder_id, user_id, bytes_used, file_count)
+        SELECT f.folder_id, MIN(f.user_id), SUM(f.file_size), COUNT(*)
+        FROM files f JOIN folders d ON d.id = f.folder_id
+        WHERE f.deleted_at IS NULL GROUP BY f.folder_id
+    """)
+    op.execute(FILE_USAGE_TRIGGER)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS files_usage ON files")
+    op.execute("DROP FUNCTION IF EXISTS apply_file_usage()")
+    op.execute("DROP FUNCTION IF EXISTS adjust_usage(text, integer, bigint, integer)")
+    op.drop_table('folder_usage')
+    op.drop_table('user_usage')
+    op.alter_column('files', 'file_size', existing_type=sa.BigInteger(), nullable=True, server_default=None)
+    op.alter_column('files', 'file_size', type_=sa.Text(), existing_type=sa.BigInteger(),
+                    postgresql_using='file_size::text')
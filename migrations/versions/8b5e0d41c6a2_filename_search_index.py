@@ -0,0 +1,35 @@
+"""filename search index
+
+Trigram GIN index on (user_id, file_name) over live files, for prefix and
+substring search scoped to one user. btree_gin lets the integer user_id
+share the GIN index with the trigrams.
+
+Revision ID: 8b5e0d41c6a2
+Revises: 3f1c2a9d7b4e
+Create Date: 2026-10-17 17:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b5e0d41c6a2'
+down_revision = '3f1c2a9d7b4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # Built without blocking uploads, which needs to run outside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_files_user_id_file_name_trgm', 'files', ['user_id', 'file_name'],
+                        postgresql_using='gin', postgresql_ops={'file_name': 'gin_trgm_ops'},
+                        postgresql_where=sa.text('deleted_at IS NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_user_id_file_name_trgm', table_name='files', postgresql_concurrently=True)
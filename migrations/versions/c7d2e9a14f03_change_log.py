@@ -0,0 +1,82 @@
+"""change log
+
+Adds the changes table behind the change feed (changes.py) and the trigger
+that appends to it on every insert, update and delete of files and folders.
+Existing items get no history: clients start from a fresh cursor and a full
+listing.
+
+Revision ID: c7d2e9a14f03
+Revises: 8b5e0d41c6a2
+Create Date: 2026-10-17 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e9a14f03'
+down_revision = '8b5e0d41c6a2'
+branch_labels = None
+depends_on = None
+
+RECORD_CHANGE = """
+CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+DECLARE
+    parent_column text := CASE TG_TABLE_NAME WHEN 'files' THEN 'folder_id' ELSE 'parent_id' END;
+    change_op text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        change_op := 'create';
+    ELSIF TG_OP = 'DELETE' THEN
+        IF OLD.deleted_at IS NOT NULL THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO changes (user_id, item_type, item_id, op)
+        VALUES (OLD.user_id, rtrim(TG_TABLE_NAME, 's'), OLD.id, 'delete');
+        RETURN NULL;
+    ELSIF OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL THEN
+        change_op := 'delete';
+    ELSIF OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL THEN
+        change_op := 'create';
+    ELSIF NEW.deleted_at IS NOT NULL OR OLD IS NOT DISTINCT FROM NEW THEN
+        RETURN NULL;
+    ELSIF to_jsonb(OLD) ->> parent_column IS DISTINCT FROM to_jsonb(NEW) ->> parent_column THEN
+        change_op := 'move';
+    ELSE
+        change_op := 'update';
+    END IF;
+    INSERT INTO changes (user_id, item_type, item_id, op)
+    VALUES (NEW.user_id, rtrim(TG_TABLE_NAME, 's'), NEW.id, change_op);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade():
+    op.create_table(
+        'changes',
+        sa.Column('seq', sa.BigInteger(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_type', sa.String(length=10), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_changes_user_id_seq', 'changes', ['user_id', 'seq'])
+    op.create_index('ix_changes_changed_at', 'changes', ['changed_at'])
+
+    op.execute(RECORD_CHANGE)
+    for table_name in ('files', 'folders'):
+        op.execute(f"CREATE TRIGGER {table_name}_change_log AFTER INSERT OR UPDATE OR DELETE ON {table_name} "
+                   f"FOR EACH ROW EXECUTE FUNCTION record_change()")
+
+
+def downgrade():
+    for table_name in ('files', 'folders'):
+        op.execute(f"DROP TRIGGER IF EXISTS {table_name}_change_log ON {table_name}")
+    op.execute("DROP FUNCTION IF EXISTS record_change()")
+    op.drop_index('ix_changes_changed_at', table_name='changes')
+    op.drop_index('ix_changes_user_id_seq', table_name='changes')
+    op.drop_table('changes')
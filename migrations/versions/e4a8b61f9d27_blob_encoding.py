@@ -0,0 +1,31 @@
+"""blob encoding
+
+Records how each blob is stored (encoding, stored_size) on blobs and,
+copied at upload, on files. Existing rows stay NULL: stored as sent.
+
+Revision ID: e4a8b61f9d27
+Revises: c7d2e9a14f03
+Create Date: 2026-10-17 19:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a8b61f9d27'
+down_revision = 'c7d2e9a14f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table_name in ('blobs', 'files'):
+        op.add_column(table_name, sa.Column('encoding', sa.String(length=10), nullable=True))
+        op.add_column(table_name, sa.Column('stored_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    for table_name in ('files', 'blobs'):
+        op.drop_column(table_name, 'stored_size')
+        op.drop_column(table_name, 'encoding')
@@ -1,24 +1,14 @@
 # models.py
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy, func
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, func
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# Bound to the app in create_app() (app.py) when DATABASE_URL is set
+db = SQLAlchemy()
 
-app = Flask(__name__)
-
-# Configure PostgreSQL URI from the .env file
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize SQLAlchemy
-db = SQLAlchemy(app)
-
-# Initialize Flask-Migrate for database migrations
-migrate = Migrate(app, db)
+# Flask-Migrate for database migrations
+migrate = Migrate()
 
 # Define the User model using SQLAlchemy
 class User(db.Model):
@@ -40,26 +30,211 @@ class User(db.Model):
     def __repr__(self):
         return f"<User {self.username}, {self.email}>"
 
+# Partial indexes cover only live rows, which is what every listing reads
+LIVE = db.text('deleted_at IS NULL')
+DELETED = db.text('deleted_at IS NOT NULL')
+
+
 class File(db.Model):
     __tablename__ = 'files'
+    __table_args__ = (
+        # Keyset listing of a user's files, per folder
+        db.Index('ix_files_user_id_folder_id_id', 'user_id', 'folder_id', 'id',
+                 postgresql_where=LIVE, sqlite_where=LIVE),
+        # Recent uploads, newest first
+        db.Index('ix_files_user_id_uploaded_at', 'user_id', db.desc('uploaded_at'), db.desc('id'),
+                 postgresql_where=LIVE, sqlite_where=LIVE),
+        # Subtree deletes, exports and the purge worker's "folder still has files" check
+        db.Index('ix_files_folder_id', 'folder_id'),
+        # The purge worker's scan for soft-deleted rows
+        db.Index('ix_files_deleted_at', 'deleted_at', postgresql_where=DELETED, sqlite_where=DELETED),
+        # Per-user filename search: trigram GIN serves both prefix and substring ILIKE
+        db.Index('ix_files_user_id_file_name_trgm', 'user_id', 'file_name', postgresql_using='gin',
+                 postgresql_ops={'file_name': 'gin_trgm_ops'}, postgresql_where=LIVE, sqlite_where=LIVE),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     file_name = db.Column(db.String, nullable=False)
-    user_id = db.Column(db.String, nullable=False)
-    file_size = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False, default=0)  # bytes
+    checksum = db.Column(db.String(64))
     storage_path = db.Column(db.Text)
-    folder_id = db.Column(db.Integer)
+    # Copied from the blob so downloads need no second lookup; file_size stays the original size
+    encoding = db.Column(db.String(10), nullable=True)  # None, or 'gzip' when stored compressed
+    stored_size = db.Column(db.BigInteger, nullable=True)  # bytes in storage
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
     uploaded_at = db.Column(db.DateTime, default=func.now())
     updated_at = db.Column(db.DateTime, onupdate= func.now())
-    deleted_at = db.Column(db.DateTime, default=func.now())
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
 
 class Folder(db.Model):
     __tablename__ = 'folders'
+    __table_args__ = (
+        # Keyset pagination of a user's folders
+        db.Index('ix_folders_user_id_id', 'user_id', 'id'),
+        # Child listing, sibling name checks and subtree walks
+        db.Index('ix_folders_user_id_parent_id', 'user_id', 'parent_id'),
+        db.Index('ix_folders_deleted_at', 'deleted_at', postgresql_where=DELETED, sqlite_where=DELETED),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     folder_name = db.Column(db.String, nullable=False)
-    user_id = db.Column(db.String, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    parent_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)  # None for top-level folders
     created_at = db.Column(db.DateTime, default=func.now())
     updated_at = db.Column(db.DateTime, onupdate= func.now())
-    deleted_at = db.Column(db.DateTime, default=func.now())
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+
+class Change(db.Model):
+    __tablename__ = 'changes'
+    __table_args__ = (
+        # "What changed since seq" for one user is a range scan
+        db.Index('ix_changes_user_id_seq', 'user_id', 'seq'),
+        # The purge worker's scan for changes past retention
+        db.Index('ix_changes_changed_at', 'changed_at'),
+    )
+
+    # One row per create/update/move/delete of a file or folder, written by
+    # the change log trigger below; seq orders every change across all users
+    seq = db.Column(db.BigInteger, primary_key=True)
+    # No foreign key: deleting a user cascades to their files, whose delete
+    # triggers would then log changes for a user that no longer exists
+    user_id = db.Column(db.Integer, nullable=False)
+    item_type = db.Column(db.String(10), nullable=False)  # 'file' or 'folder'
+    item_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'create', 'update', 'move' or 'delete'
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+
+    # Content-addressed object shared by every files row with the same checksum
+    sha256 = db.Column(db.String(64), primary_key=True)
+    storage_path = db.Column(db.Text, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    encoding = db.Column(db.String(10), nullable=True)  # see compression.py
+    stored_size = db.Column(db.BigInteger, nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=func.now())
+
+
+class UserUsage(db.Model):
+    __tablename__ = 'user_usage'
+
+    # Bytes and count of a user's live files, kept current by the files triggers below
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    bytes_used = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class FolderUsage(db.Model):
+    __tablename__ = 'folder_usage'
+
+    # Same totals for the files directly inside one folder
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    bytes_used = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Usage counters move in the same transaction as the files row: an insert adds
+# the file, a delete subtracts it, and an update (soft delete, move, resize)
+# subtracts the old row and adds the new one. Soft-deleted files don't count.
+FILE_USAGE_TRIGGER = DDL("""
+CREATE OR REPLACE FUNCTION adjust_usage(p_user_id integer, p_folder_id integer, p_bytes bigint, p_files integer)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO user_usage (user_id, bytes_used, file_count) VALUES (p_user_id, p_bytes, p_files)
+    ON CONFLICT (user_id) DO UPDATE SET bytes_used = user_usage.bytes_used + EXCLUDED.bytes_used,
+                                        file_count = user_usage.file_count + EXCLUDED.file_count;
+    IF p_folder_id IS NOT NULL THEN
+        INSERT INTO folder_usage (folder_id, user_id, bytes_used, file_count) VALUES (p_folder_id, p_user_id, p_bytes, p_files)
+        ON CONFLICT (folder_id) DO UPDATE SET bytes_used = folder_usage.bytes_used + EXCLUDED.bytes_used,
+                                              file_count = folder_usage.file_count + EXCLUDED.file_count;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_file_usage() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id
+       AND OLD.folder_id IS NOT DISTINCT FROM NEW.folder_id
+       AND OLD.file_size IS NOT DISTINCT FROM NEW.file_size
+       AND (OLD.deleted_at IS NULL) = (NEW.deleted_at IS NULL) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        IF OLD.deleted_at IS NULL THEN
+            PERFORM adjust_usage(OLD.user_id, OLD.folder_id, -OLD.file_size, -1);
+        END IF;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        IF NEW.deleted_at IS NULL THEN
+            PERFORM adjust_usage(NEW.user_id, NEW.folder_id, NEW.file_size, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER files_usage AFTER INSERT OR UPDATE OR DELETE ON files
+FOR EACH ROW EXECUTE FUNCTION apply_file_usage();
+""")
+
+# Every change to a file or folder is logged for the change feed (changes.py).
+# Soft delete logs a delete and restoring logs a create; purging an already
+# soft-deleted row and updating a deleted one log nothing.
+CHANGE_LOG_TRIGGER = DDL("""
+CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+DECLARE
+    parent_column text := CASE TG_TABLE_NAME WHEN 'files' THEN 'folder_id' ELSE 'parent_id' END;
+    change_op text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        change_op := 'create';
+    ELSIF TG_OP = 'DELETE' THEN
+        IF OLD.deleted_at IS NOT NULL THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO changes (user_id, item_type, item_id, op)
+        VALUES (OLD.user_id, rtrim(TG_TABLE_NAME, 's'), OLD.id, 'delete');
+        RETURN NULL;
+    ELSIF OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL THEN
+        change_op := 'delete';
+    ELSIF OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL THEN
+        change_op := 'create';
+    ELSIF NEW.deleted_at IS NOT NULL OR OLD IS NOT DISTINCT FROM NEW THEN
+        RETURN NULL;
+    ELSIF to_jsonb(OLD) ->> parent_column IS DISTINCT FROM to_jsonb(NEW) ->> parent_column THEN
+        change_op := 'move';
+    ELSE
+        change_op := 'update';
+    END IF;
+    INSERT INTO changes (user_id, item_type, item_id, op)
+    VALUES (NEW.user_id, rtrim(TG_TABLE_NAME, 's'), NEW.id, change_op);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER files_change_log AFTER INSERT OR UPDATE OR DELETE ON files
+FOR EACH ROW EXECUTE FUNCTION record_change();
+
+CREATE TRIGGER folders_change_log AFTER INSERT OR UPDATE OR DELETE ON folders
+FOR EACH ROW EXECUTE FUNCTION record_change();
+""")
+
+# The trigram search index needs these before the files table is created
+SEARCH_EXTENSIONS = DDL("""
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+""")
+
+event.listen(db.metadata, 'before_create', SEARCH_EXTENSIONS.execute_if(dialect='postgresql'))
+
+# Runs once every table exists
+event.listen(db.metadata, 'after_create', FILE_USAGE_TRIGGER.execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'after_create', CHANGE_LOG_TRIGGER.execute_if(dialect='postgresql'))
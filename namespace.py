@@ -0,0 +1,151 @@
+# namespace.py
+"""Virtual folder tree.
+
+Folders are rows with a parent_id and files point at immutable blob keys, so
+renaming or moving a file, a folder or a whole subtree only updates one
+metadata row; no bytes move in storage.
+"""
+from datetime import datetime
+from data_access import chunked, execute, table
+
+# Guards the ancestor walk against corrupt (cyclic) trees
+MAX_FOLDER_DEPTH = 64
+
+# Pass as parent_id / folder_id to leave it unchanged; None means the root
+KEEP = object()
+
+
+class NamespaceError(Exception):
+    pass
+
+
+class NotFound(NamespaceError):
+    pass
+
+
+class NameConflict(NamespaceError):
+    pass
+
+
+class InvalidMove(NamespaceError):
+    pass
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _live(query):
+    return query.is_('deleted_at', 'null')
+
+
+def _in_parent(query, parent_id):
+    return query.is_('parent_id', 'null') if parent_id is None else query.eq('parent_id', parent_id)
+
+
+def _folder_id(value):
+    return None if value is None else int(value)
+
+
+def get_folder_row(user_id, folder_id, columns='id, parent_id, folder_name'):
+    result = execute(_live(table('folders').select(columns).eq('id', folder_id).eq('user_id', user_id)))
+    if not result.data:
+        raise NotFound("Folder not found")
+    return result.data[0]
+
+
+def _check_name_free(user_id, parent_id, name, exclude_id=None):
+    query = _in_parent(_live(table('folders').select('id').eq('user_id', user_id).eq('folder_name', name)), parent_id)
+    if exclude_id is not None:
+        query = query.neq('id', exclude_id)
+    if execute(query.limit(1)).data:
+        raise NameConflict("A folder with that name already exists here")
+
+
+def _check_not_inside(user_id, folder_id, parent_id):
+    """Walk up from parent_id and refuse to make a folder its own ancestor."""
+    current = parent_id
+    for _ in range(MAX_FOLDER_DEPTH):
+        if current is None:
+            return
+        if current == folder_id:
+            raise InvalidMove("A folder cannot be moved into itself or one of its subfolders")
+        current = get_folder_row(user_id, current, 'id, parent_id')['parent_id']
+    raise InvalidMove("Folder tree is too deep")
+
+
+def create_folder(user_id, name, parent_id=None):
+    parent_id = _folder_id(parent_id)
+    if parent_id is not None:
+        get_folder_row(user_id, parent_id, 'id')
+    _check_name_free(user_id, parent_id, name)
+    now = _now()
+    return execute(table('folders').insert({
+        "folder_name": name,
+        "user_id": user_id,
+        "parent_id": parent_id,
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None,
+    })).data[0]
+
+
+def update_folder(user_id, folder_id, name=None, parent_id=KEEP):
+    """Rename and/or move a folder (with everything beneath it) in one update."""
+    folder_id = int(folder_id)
+    folder = get_folder_row(user_id, folder_id)
+    values = {}
+    target = folder['parent_id']
+    if parent_id is not KEEP:
+        target = _folder_id(parent_id)
+        _check_not_inside(user_id, folder_id, target)
+        values["parent_id"] = target
+    if name is not None:
+        values["folder_name"] = name
+    if not values:
+        return folder
+    _check_name_free(user_id, target, name or folder['folder_name'], exclude_id=folder_id)
+
+    values["updated_at"] = _now()
+    updated = execute(
+        _live(table('folders').update(values).eq('id', folder_id).eq('user_id', user_id))
+    ).data
+    if not updated:
+        raise NotFound("Folder not found")
+    return updated[0]
+
+
+def update_file(user_id, file_id, name=None, folder_id=KEEP):
+    """Rename a file and/or move it to another folder (None for the root)."""
+    values = {}
+    if folder_id is not KEEP:
+        folder_id = _folder_id(folder_id)
+        if folder_id is not None:
+            get_folder_row(user_id, folder_id, 'id')
+        values["folder_id"] = folder_id
+    if name is not None:
+        values["file_name"] = name
+    if not values:
+        raise InvalidMove("Nothing to update")
+
+    values["updated_at"] = _now()
+    updated = execute(
+        _live(table('files').update(values).eq('id', file_id).eq('user_id', user_id))
+    ).data
+    if not updated:
+        raise NotFound("File not found")
+    return updated[0]
+
+
+def subtree_ids(user_id, folder_id):
+    """Ids of a folder and every live folder beneath it, one query per level."""
+    ids = level = [int(folder_id)]
+    for _ in range(MAX_FOLDER_DEPTH):
+        rows = []
+        for batch in chunked(level):
+            rows += execute(_live(table('folders').select('id').eq('user_id', user_id).in_('parent_id', batch))).data or []
+        level = [row['id'] for row in rows]
+        if not level:
+            break
+        ids = ids + level
+    return ids
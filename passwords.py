@@ -0,0 +1,90 @@
+# passwords.py
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+# Any werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", os.cpu_count() or 1))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", PASSWORD_POOL_SIZE * 4))
+PASSWORD_TIMEOUT = float(os.getenv("PASSWORD_TIMEOUT", 10))
+
+
+class PoolSaturated(Exception):
+    """The pool can't take or finish the job in time; the caller should retry later."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _get_pool():
+    # Created on first use so each gunicorn worker builds its own after fork
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _run(fn, *args):
+    """Run fn in the hashing pool, failing fast when too much work is queued."""
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= PASSWORD_QUEUE_LIMIT:
+            raise PoolSaturated("Password hashing pool is saturated")
+        _in_flight += 1
+    try:
+        future = _get_pool().submit(fn, *args)
+        try:
+            return future.result(timeout=PASSWORD_TIMEOUT)
+        except FutureTimeoutError as e:
+            # Dropped if it never started; the caller is told to retry either way
+            future.cancel()
+            raise PoolSaturated("Password hashing timed out") from e
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def hash_password(password, method=None):
+    return _run(_hash, password, method or PASSWORD_HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    return _run(_verify, pwhash, password)
+
+
+def _full_method(method):
+    """Spell out the defaults werkzeug fills in, e.g. "scrypt" -> "scrypt:32768:8:1"."""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return f"scrypt:{2 ** 15}:8:1"
+    if name == 'pbkdf2' and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def needs_rehash(pwhash):
+    """True if pwhash was made with a different method or work factor than configured."""
+    return pwhash.split('$', 1)[0] != _full_method(PASSWORD_HASH_METHOD)
+
+
+def queue_depth():
+    """Hashing jobs currently running or queued in this worker."""
+    return _in_flight
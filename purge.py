@@ -0,0 +1,205 @@
+# purge.py
+"""Background purge of soft-deleted files and folders, and of change-log rows
+past their retention window.
+
+Run standalone with `python purge.py`, or inside a web worker by setting
+PURGE_WORKER=1 (see start_purge_worker).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from blobs import release_blob, collect_garbage, reconcile_references
+import changes
+from data_access import chunked, execute, table
+from namespace import subtree_ids
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 100))
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", 4))
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", 30))
+PURGE_DELAY = float(os.getenv("PURGE_DELAY", 0))  # seconds a deleted item stays restorable
+# Blobs whose references are recounted per run; the sweep resumes where it left off
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 1000))
+
+# Progress of the purge loop running in this process
+progress = {
+    "files_purged": 0,
+    "folders_purged": 0,
+    "blobs_collected": 0,
+    "changes_pruned": 0,
+    "references_repaired": 0,
+    "last_run_at": None,
+    "last_error": None,
+    "running": False,
+}
+_progress_lock = threading.Lock()
+# Where the reference recount continues, and the over-counted blobs it is watching
+_reconcile = {"after": None, "suspects": {}}
+
+
+def _cutoff():
+    return (datetime.utcnow() - timedelta(seconds=PURGE_DELAY)).isoformat()
+
+
+def soft_delete_folder(user_id, folder_id):
+    """Mark a folder, its subfolders and their files deleted.
+
+    Returns False if the folder was not found.
+    """
+    now = datetime.utcnow().isoformat()
+    ids = subtree_ids(user_id, folder_id)
+    folders = execute(
+        table('folders').update({"deleted_at": now}).eq('id', folder_id).eq('user_id', user_id).is_('deleted_at', 'null')
+    ).data
+    if not folders:
+        return False
+    for batch in chunked(ids[1:]):
+        execute(table('folders').update({"deleted_at": now}).in_('id', batch).is_('deleted_at', 'null'))
+    for batch in chunked(ids):
+        execute(table('files').update({"deleted_at": now}).in_('folder_id', batch).is_('deleted_at', 'null'))
+    return True
+
+
+def soft_delete_file(user_id, file_id):
+    """Mark a single file deleted. Returns False if the file was not found."""
+    now = datetime.utcnow().isoformat()
+    files = execute(
+        table('files').update({"deleted_at": now}).eq('id', file_id).eq('user_id', user_id).is_('deleted_at', 'null')
+    ).data
+    return bool(files)
+
+
+def _purge_file(row):
+    # The row goes first: if we crash before the release the blob keeps a stale
+    # reference, which reconcile_references repairs, instead of being freed twice
+    deleted = execute(table('files').delete().eq('id', row['id'])).data
+    if deleted and row.get('checksum'):
+        release_blob(row['checksum'])
+    return bool(deleted)
+
+
+def purge_files(batch_size=PURGE_BATCH_SIZE, concurrency=PURGE_CONCURRENCY):
+    """Purge one batch of soft-deleted files. Returns how many were removed."""
+    rows = execute(
+        table('files').select('id, checksum').lt('deleted_at', _cutoff()).order('id').limit(batch_size)
+    ).data or []
+    if not rows:
+        return 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(executor.map(_purge_file, rows))
+
+
+def purge_folders(batch_size=PURGE_BATCH_SIZE):
+    """Remove soft-deleted folder rows once none of their files or subfolders remain.
+
+    Walks newest first, so subfolders are usually gone before their parents
+    come up in the same pass.
+    """
+    purged, before = 0, None
+    while True:
+        query = table('folders').select('id').lt('deleted_at', _cutoff())
+        if before is not None:
+            query = query.lt('id', before)
+        folders = execute(query.order('id', desc=True).limit(batch_size)).data or []
+        if not folders:
+            return purged
+        ids = [folder['id'] for folder in folders]
+        for batch in chunked(ids):
+            remaining = execute(table('files').select('folder_id').in_('folder_id', batch)).data or []
+            children = execute(table('folders').select('parent_id').in_('parent_id', batch)).data or []
+            busy = {row['folder_id'] for row in remaining} | {row['parent_id'] for row in children}
+            empty = [folder_id for folder_id in batch if folder_id not in busy]
+            if empty:
+                execute(table('folders').delete().in_('id', empty))
+            purged += len(empty)
+        before = ids[-1]
+
+
+def run_once(batch_size=PURGE_BATCH_SIZE, concurrency=PURGE_CONCURRENCY):
+    """Drain everything currently purgeable, one batch at a time.
+
+    All state lives in the rows themselves, so a crash part way through just
+    leaves work for the next run. Each run also recounts the references of
+    one batch of blobs, which repairs those a crash left over-counted.
+    """
+    totals = {"files_purged": 0, "folders_purged": 0, "blobs_collected": 0, "changes_pruned": 0,
+              "references_repaired": 0}
+    while True:
+        files = purge_files(batch_size, concurrency)
+        folders = purge_folders(batch_size)
+        blobs = collect_garbage(batch_size)
+        pruned = changes.prune(batch_size)
+        totals["files_purged"] += files
+        totals["folders_purged"] += folders
+        totals["blobs_collected"] += blobs
+        totals["changes_pruned"] += pruned
+        with _progress_lock:
+            progress["files_purged"] += files
+            progress["folders_purged"] += folders
+            progress["blobs_collected"] += blobs
+            progress["changes_pruned"] += pruned
+        if files < batch_size and folders < batch_size and blobs < batch_size and pruned < batch_size:
+            break
+
+    _reconcile["after"], repaired = reconcile_references(_reconcile["after"], RECONCILE_BATCH_SIZE,
+                                                         _reconcile["suspects"])
+    totals["references_repaired"] = repaired
+    with _progress_lock:
+        progress["references_repaired"] += repaired
+    return totals
+
+
+def pending():
+    """Items still waiting to be purged, across all processes."""
+    def count(query):
+        return execute(query).count or 0
+    return {
+        "files": count(table('files').select('id', count='exact').not_.is_('deleted_at', 'null').limit(1)),
+        "folders": count(table('folders').select('id', count='exact').not_.is_('deleted_at', 'null').limit(1)),
+        "blobs": count(table('blobs').select('sha256', count='exact').eq('ref_count', 0).limit(1)),
+    }
+
+
+def status():
+    with _progress_lock:
+        worker = dict(progress)
+    return {"pending": pending(), "worker": worker}
+
+
+def _loop(interval):
+    while True:
+        with _progress_lock:
+            progress["running"] = True
+        try:
+            run_once()
+            error = None
+        except Exception as e:
+            error = str(e)
+        with _progress_lock:
+            progress["running"] = False
+            progress["last_run_at"] = datetime.utcnow().isoformat()
+            progress["last_error"] = error
+        time.sleep(interval)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_purge_worker(interval=PURGE_INTERVAL):
+    """Start the purge loop on a daemon thread in this process (once).
+
+    Threads don't survive fork, so a worker forked from a process that
+    already started one gets its own.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop, args=(interval,), name="purge-worker", daemon=True)
+            _worker.start()
+        return _worker
+
+
+if __name__ == "__main__":
+    _loop(PURGE_INTERVAL)
@@ -0,0 +1,101 @@
+# revocation.py
+import hashlib
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+REVOCATION_BACKEND = os.getenv("REVOCATION_BACKEND", "sqlite")
+REVOCATION_DB = os.getenv("REVOCATION_DB", os.path.join(os.getcwd(), 'revoked_tokens.db'))
+PURGE_INTERVAL = 60  # seconds between sweeps of expired entries
+
+
+def token_id(decoded, token):
+    """The id a token is revoked under: its jti, or a hash for tokens issued without one."""
+    return decoded.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+class MemoryRevocationStore:
+    """Revoked ids for a single process. Entries are dropped once their exp passes."""
+
+    def __init__(self):
+        self._revoked = {}
+        self._expiry = []  # heap of (exp, jti)
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            self._revoked[jti] = exp
+            heapq.heappush(self._expiry, (exp, jti))
+            self._purge(time.time())
+
+    def is_revoked(self, jti):
+        exp = self._revoked.get(jti)
+        return exp is not None and exp > time.time()
+
+    def _purge(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            exp, jti = heapq.heappop(self._expiry)
+            if self._revoked.get(jti) == exp:
+                del self._revoked[jti]
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.time())
+            return len(self._revoked)
+
+
+class SQLiteRevocationStore:
+    """Revoked ids in a SQLite file shared by every worker on the host.
+
+    Lookups are primary-key reads; expired rows are swept at most once per
+    PURGE_INTERVAL so the table only holds tokens that are still live.
+    """
+
+    def __init__(self, path=REVOCATION_DB):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, exp REAL NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def revoke(self, jti, exp):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO revoked_tokens (jti, exp) VALUES (?, ?)", (jti, exp))
+        now = time.time()
+        if now - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = now
+            conn.execute("DELETE FROM revoked_tokens WHERE exp <= ?", (now,))
+
+    def is_revoked(self, jti):
+        row = self._connection().execute(
+            "SELECT 1 FROM revoked_tokens WHERE jti = ? AND exp > ?", (jti, time.time())
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM revoked_tokens WHERE exp > ?", (time.time(),)).fetchone()[0]
+
+
+_store = None
+
+
+def get_revocation_store():
+    """Return the store selected by REVOCATION_BACKEND ('sqlite' or 'memory')."""
+    global _store
+    if _store is None:
+        if REVOCATION_BACKEND == "memory":
+            _store = MemoryRevocationStore()
+        else:
+            _store = SQLiteRevocationStore()
+    return _store
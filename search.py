@@ -0,0 +1,82 @@
+# search.py
+"""Filename search over a user's live files.
+
+Backed by a trigram GIN index on (user_id, file_name) (see models.py), so
+both prefix and substring ILIKE queries are index scans scoped to one user
+and stay flat as the files table grows. Postgres maintains the index in the
+same transaction as every upload, rename and delete; there is nothing to
+rebuild.
+
+Results are ranked in tiers - exact name, then names starting with the
+query, then names merely containing it - and ordered by name within a tier.
+Each tier is one keyset query, so the cursor carries (tier, name, id).
+"""
+from data_access import quote, execute, table
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+
+SEARCH_COLUMNS = 'id, file_name, folder_id, file_size, uploaded_at, updated_at'
+# Shorter substrings match nearly everything and can't use trigrams well
+MIN_SUBSTRING_LENGTH = 3
+MAX_QUERY_LENGTH = 255
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+MODES = {
+    'prefix': (EXACT, PREFIX),
+    'substring': (EXACT, PREFIX, SUBSTRING),
+}
+
+
+def _escape(value):
+    # LIKE wildcards in the query are literal; PostgREST would read * as %,
+    # and there is no escape for it, so it is dropped
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '')
+
+
+def _tier_query(user_id, tier, term, folder_id=None):
+    query = table('files').select(SEARCH_COLUMNS).eq('user_id', user_id).is_('deleted_at', 'null')
+    if folder_id is not None:
+        query = query.eq('folder_id', folder_id)
+    if tier == EXACT:
+        return query.ilike('file_name', term)
+    if tier == PREFIX:
+        return query.ilike('file_name', f"{term}%").not_.ilike('file_name', term)
+    return query.ilike('file_name', f"%{term}%").not_.ilike('file_name', f"{term}%")
+
+
+def search_files(user_id, q, mode='substring', cursor=None, limit=DEFAULT_PAGE_SIZE, folder_id=None):
+    """Return (files, next_cursor) for one ranked page of matching file names.
+
+    Raises ValueError for an empty or overlong query, an unknown mode or a
+    malformed cursor.
+    """
+    q = (q or '').strip()
+    if not q or len(q) > MAX_QUERY_LENGTH:
+        raise ValueError("Search query must be between 1 and 255 characters")
+    if mode not in MODES:
+        raise ValueError("mode must be 'prefix' or 'substring'")
+    tiers = MODES[mode if len(q) >= MIN_SUBSTRING_LENGTH else 'prefix']
+    term = _escape(q)
+    if not term:
+        raise ValueError("Search query must contain more than wildcards")
+
+    position = decode_cursor(cursor) if cursor else {"t": tiers[0]}
+    results = []
+    for tier in tiers:
+        if tier < position["t"]:
+            continue
+        query = _tier_query(user_id, tier, term, folder_id)
+        if tier == position["t"] and "n" in position:
+            name, after = position["n"], position["i"]
+            query = query.or_(f"file_name.gt.{quote(name)},and(file_name.eq.{quote(name)},id.gt.{int(after)})")
+        # One extra row tells us whether this tier has more
+        rows = execute(query.order('file_name').order('id').limit(limit - len(results) + 1)).data or []
+        results.extend((tier, row) for row in rows)
+        if len(results) > limit:
+            break
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        tier, last = results[-1]
+        next_cursor = encode_cursor({"t": tier, "n": last['file_name'], "i": last['id']})
+    return [dict(row, rank=tier) for tier, row in results], next_cursor
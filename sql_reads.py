@@ -0,0 +1,126 @@
+# sql_reads.py
+"""Direct, pooled SQL for the hottest metadata reads.
+
+With METADATA_READS=sql and DATABASE_URL set, user checks, folder listings,
+download lookups, usage reads and change-feed polls skip the PostgREST HTTP
+hop and run as single indexed queries over a SQLAlchemy connection pool. Writes, and every
+other read, still go through PostgREST. Rows come back shaped like PostgREST
+rows (timestamps as ISO strings) so callers don't care which path served them.
+
+`python benchmarks/metadata_reads.py` compares the two paths.
+"""
+import os
+import threading
+from datetime import date, datetime
+from sqlalchemy import create_engine, text
+from config import Config
+from data_access import count_round_trip
+
+METADATA_READS = os.getenv("METADATA_READS", "rest")  # 'rest' or 'sql'
+DATABASE_URL = Config.SQLALCHEMY_DATABASE_URI
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", 5))
+SQL_MAX_OVERFLOW = int(os.getenv("SQL_MAX_OVERFLOW", 10))
+SQL_POOL_TIMEOUT = float(os.getenv("SQL_POOL_TIMEOUT", 5))
+SQL_POOL_RECYCLE = int(os.getenv("SQL_POOL_RECYCLE", 1800))
+SQL_STATEMENT_TIMEOUT = float(os.getenv("SQL_STATEMENT_TIMEOUT", 10))
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def enabled():
+    return METADATA_READS == "sql" and bool(DATABASE_URL)
+
+
+def _url(url):
+    # Supabase hands out postgres:// URLs, which SQLAlchemy 2 no longer accepts
+    return "postgresql://" + url[len("postgres://"):] if url.startswith("postgres://") else url
+
+
+def get_engine(url=None):
+    """The pooled engine for this process, rebuilt after a fork so workers never share sockets."""
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            url = _url(url or DATABASE_URL)
+            connect_args = {}
+            if url.startswith("postgresql"):
+                connect_args["options"] = f"-c statement_timeout={int(SQL_STATEMENT_TIMEOUT * 1000)}"
+            _engine = create_engine(
+                url,
+                pool_size=SQL_POOL_SIZE,
+                max_overflow=SQL_MAX_OVERFLOW,
+                pool_timeout=SQL_POOL_TIMEOUT,
+                pool_recycle=SQL_POOL_RECYCLE,
+                pool_pre_ping=True,
+                connect_args=connect_args,
+            )
+            _engine_pid = os.getpid()
+        return _engine
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def fetch_all(sql, **params):
+    """Run one read and return its rows as plain dicts, counted as one round trip."""
+    count_round_trip()
+    with get_engine().connect() as conn:
+        return [{key: _value(value) for key, value in row.items()}
+                for row in conn.execute(text(sql), params).mappings()]
+
+
+def fetch_one(sql, **params):
+    rows = fetch_all(sql, **params)
+    return rows[0] if rows else None
+
+
+def user_exists(user_id):
+    return fetch_one("SELECT id FROM users WHERE id = :user_id", user_id=user_id) is not None
+
+
+def list_folders(user_id, columns, after=None, limit=50, parent=None):
+    """One keyset page of live folders; parent is None, 'root' or a folder id."""
+    where = ["user_id = :user_id", "deleted_at IS NULL"]
+    params = {"user_id": user_id, "limit": limit}
+    if parent == 'root':
+        where.append("parent_id IS NULL")
+    elif parent is not None:
+        where.append("parent_id = :parent_id")
+        params["parent_id"] = int(parent)
+    if after is not None:
+        where.append("id > :after")
+        params["after"] = after
+    return fetch_all(f"SELECT {columns} FROM folders WHERE {' AND '.join(where)} ORDER BY id LIMIT :limit", **params)
+
+
+def get_folder(user_id, folder_id, columns):
+    return fetch_one(
+        f"SELECT {columns} FROM folders WHERE id = :folder_id AND user_id = :user_id AND deleted_at IS NULL",
+        folder_id=folder_id, user_id=user_id,
+    )
+
+
+def get_file(user_id, file_id, columns):
+    return fetch_one(
+        f"SELECT {columns} FROM files WHERE id = :file_id AND user_id = :user_id AND deleted_at IS NULL",
+        file_id=file_id, user_id=user_id,
+    )
+
+
+def get_usage_row(user_id):
+    return fetch_one("SELECT bytes_used, file_count FROM user_usage WHERE user_id = :user_id", user_id=user_id)
+
+
+def list_changes(user_id, after, limit, newest_first=False):
+    """One page of the user's change log after seq `after`, or the newest changes first."""
+    if newest_first:
+        return fetch_all("SELECT seq FROM changes WHERE user_id = :user_id ORDER BY seq DESC LIMIT :limit",
+                         user_id=user_id, limit=limit)
+    return fetch_all(
+        "SELECT seq, item_type, item_id, op, changed_at FROM changes"
+        " WHERE user_id = :user_id AND seq > :after ORDER BY seq LIMIT :limit",
+        user_id=user_id, after=after, limit=limit,
+    )
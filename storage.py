@@ -0,0 +1,279 @@
+# storage.py
+import os
+import uuid
+import metrics
+from supabase_client import get_supabase, http_client, with_retries
+
+STORAGE_BUCKET = 'uploaded_files'
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.getcwd(), 'storage'))
+CHUNK_SIZE = 64 * 1024
+LIST_LIMIT = 10000
+
+
+class StorageError(Exception):
+    pass
+
+
+class ObjectNotFound(StorageError):
+    pass
+
+
+class StorageBackend:
+    """Interface shared by every storage backend; paths are bucket-relative keys."""
+
+    def upload(self, path, chunks, content_type="application/octet-stream"):
+        """Store the bytes from an iterable of chunks, replacing any existing object."""
+        raise NotImplementedError
+
+    def open(self, path, chunk_size=CHUNK_SIZE, start=0):
+        """Yield the object's bytes from offset start. Raises ObjectNotFound."""
+        raise NotImplementedError
+
+    def list(self, prefix):
+        """Return [{"name", "size"}] for the objects directly under prefix."""
+        raise NotImplementedError
+
+    def exists(self, path):
+        raise NotImplementedError
+
+    def move(self, source, destination):
+        raise NotImplementedError
+
+    def delete(self, paths):
+        """Remove objects, ignoring any that are already gone."""
+        raise NotImplementedError
+
+    def public_url(self, path):
+        """A URL clients can fetch the object from directly, or None to serve it through the API."""
+        raise NotImplementedError
+
+    def local_path(self, path):
+        """A file on this host holding the object, for zero-copy serving, or None."""
+        return None
+
+
+class SupabaseStorage(StorageBackend):
+    """Objects in a Supabase storage bucket, transferred as streams over pooled connections."""
+
+    def __init__(self, bucket=STORAGE_BUCKET):
+        self.bucket = bucket
+
+    def _object_url(self, path):
+        return f"/storage/v1/object/{self.bucket}/{path}"
+
+    def _bucket(self):
+        return get_supabase().storage.from_(self.bucket)
+
+    def upload(self, path, chunks, content_type="application/octet-stream"):
+        """Upload from an iterable of chunks using chunked transfer encoding.
+
+        Only one chunk is held in memory at a time. Exceptions raised by the
+        iterable (e.g. a size limit) abort the request.
+        """
+        # Not retried: the chunk iterator cannot be replayed
+        metrics.storage_requests.inc(op="upload")
+        headers = {"Content-Type": content_type, "x-upsert": "true"}
+        response = http_client().post(self._object_url(path), content=chunks, headers=headers)
+        if response.status_code != 200:
+            raise StorageError(f"Failed to upload {path}: {response.status_code} {response.text}")
+
+    def open(self, path, chunk_size=CHUNK_SIZE, start=0):
+        """Yield the object's bytes from offset start in chunks as they arrive."""
+        headers = {"Range": f"bytes={start}-"} if start else {}
+        metrics.storage_requests.inc(op="download")
+        # Opening the response is retried; once bytes have been yielded it is not
+        response = with_retries("GET", lambda: http_client().send(
+            http_client().build_request("GET", self._object_url(path), headers=headers), stream=True
+        ))
+        try:
+            if response.status_code in (400, 404):
+                raise ObjectNotFound(path)
+            if response.status_code == 416:
+                return
+            if response.status_code not in (200, 206) or (start and response.status_code != 206):
+                raise StorageError(f"Failed to download {path}: {response.status_code}")
+            yield from response.iter_bytes(chunk_size)
+        finally:
+            response.close()
+
+    def list(self, prefix):
+        metrics.storage_requests.inc(op="list")
+        entries = self._bucket().list(prefix.rstrip('/'), {"limit": LIST_LIMIT})
+        return [
+            {"name": entry["name"], "size": (entry.get("metadata") or {}).get("size", 0)}
+            for entry in entries
+            if entry.get("id")  # folders have no id
+        ]
+
+    def exists(self, path):
+        directory, _, name = path.rpartition('/')
+        metrics.storage_requests.inc(op="list")
+        entries = self._bucket().list(directory, {"limit": LIST_LIMIT, "search": name})
+        return any(entry["name"] == name and entry.get("id") for entry in entries)
+
+    def move(self, source, destination):
+        """Rename an object without transferring its bytes.
+
+        If destination already exists the source is dropped instead; callers only
+        move content-addressed objects, so both hold the same bytes.
+        """
+        metrics.storage_requests.inc(op="move")
+        try:
+            self._bucket().move(source, destination)
+        except Exception as e:
+            if not self.exists(destination):
+                raise StorageError(f"Failed to move {source} to {destination}: {str(e)}")
+            self.delete([source])
+
+    def delete(self, paths):
+        if paths:
+            metrics.storage_requests.inc(op="delete")
+            self._bucket().remove(list(paths))
+
+    def public_url(self, path):
+        return self._bucket().get_public_url(path)
+
+
+class LocalStorage(StorageBackend):
+    """Objects kept as plain files under a root directory.
+
+    Used for single-host deployments and as a stand-in for Supabase in tests.
+    Writes go to a temporary file that is renamed into place, so a dropped
+    upload never leaves a partial object behind.
+    """
+
+    def __init__(self, root=LOCAL_STORAGE_DIR):
+        self.root = root
+
+    def _path(self, path):
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(os.path.abspath(self.root) + os.sep):
+            raise StorageError(f"Invalid object path: {path}")
+        return full_path
+
+    def upload(self, path, chunks, content_type="application/octet-stream"):
+        full_path = self._path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def open(self, path, chunk_size=CHUNK_SIZE, start=0):
+        full_path = self._path(path)
+        try:
+            f = open(full_path, 'rb')
+        except FileNotFoundError:
+            raise ObjectNotFound(path)
+        with f:
+            f.seek(start)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def list(self, prefix):
+        full_path = self._path(prefix.rstrip('/'))
+        if not os.path.isdir(full_path):
+            return []
+        return [
+            {"name": entry.name, "size": entry.stat().st_size}
+            for entry in os.scandir(full_path)
+            if entry.is_file() and not entry.name.endswith('.tmp')
+        ]
+
+    def exists(self, path):
+        return os.path.isfile(self._path(path))
+
+    def move(self, source, destination):
+        destination_path = self._path(destination)
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        try:
+            os.replace(self._path(source), destination_path)
+        except FileNotFoundError:
+            raise ObjectNotFound(source)
+
+    def delete(self, paths):
+        for path in paths:
+            try:
+                os.remove(self._path(path))
+            except FileNotFoundError:
+                pass
+
+    def public_url(self, path):
+        # A path on this host means nothing to clients (and shouldn't be shown to them)
+        return None
+
+    def local_path(self, path):
+        full_path = self._path(path)
+        return full_path if os.path.isfile(full_path) else None
+
+
+class ObjectReader:
+    """Seekable, lazily opened view of a stored object.
+
+    werkzeug's range handling seeks to the first requested byte before
+    iterating, so only that part of the object is fetched from storage.
+    """
+
+    def __init__(self, storage, path, chunk_size=CHUNK_SIZE):
+        self.storage = storage
+        self.path = path
+        self.chunk_size = chunk_size
+        self.position = 0
+        self._chunks = None
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence != os.SEEK_SET:
+            raise ValueError("Only absolute seeks are supported")
+        self.close()
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._chunks is None:
+            self._chunks = self.storage.open(self.path, self.chunk_size, start=self.position)
+        chunk = next(self._chunks)
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+
+
+_storage = None
+
+
+def get_storage():
+    """Return the storage backend selected by STORAGE_BACKEND.
+
+    Remote backends sit behind the on-disk hot-object cache unless
+    STORAGE_CACHE_SIZE is 0.
+    """
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage()
+        else:
+            from storage_cache import STORAGE_CACHE_SIZE, CachedStorage
+            backend = SupabaseStorage()
+            _storage = CachedStorage(backend) if STORAGE_CACHE_SIZE else backend
+    return _storage
@@ -0,0 +1,325 @@
+# storage_cache.py
+"""Size-bounded on-disk LRU cache in front of a remote storage backend.
+
+Only content-addressed blobs are cached: their keys never change content, so
+entries need no invalidation beyond deletes. Concurrent misses for one
+object in a worker share a single fetch, which runs in its own thread at
+the backend's pace and is streamed to every reader from the file it is
+writing, so a slow client holds up nobody else. Objects found to be too
+big to keep are remembered and fetched directly from then on. Workers
+sharing the directory may each fetch once, and files are renamed into place
+so nobody sees a partial object. The byte bound is enforced per worker.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from storage import CHUNK_SIZE, StorageBackend
+
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(os.getcwd(), 'storage_cache'))
+STORAGE_CACHE_SIZE = int(os.getenv("STORAGE_CACHE_SIZE", 1024 * 1024 * 1024))  # bytes, 0 disables
+# Objects bigger than this share of the cache are streamed without being kept
+STORAGE_CACHE_MAX_ENTRY = float(os.getenv("STORAGE_CACHE_MAX_ENTRY", 0.25))
+CACHEABLE_PREFIXES = ("blobs/",)
+# How long a reader waits on a fetch that has stopped making progress before fetching itself
+FLIGHT_WAIT = float(os.getenv("STORAGE_CACHE_FLIGHT_WAIT", 30))
+STALE_TMP_AGE = 3600
+# How many objects too big to cache are remembered
+OVERSIZE_MEMORY = 4096
+
+FILLING, CACHED, ABANDONED = 'filling', 'cached', 'abandoned'
+
+
+class _Flight:
+    """One fetch into the cache; written is how many bytes of tmp_path readers may read."""
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.written = 0
+        self.state = FILLING
+        self.changed = threading.Condition()
+
+
+class CachedStorage(StorageBackend):
+    def __init__(self, backend, root=STORAGE_CACHE_DIR, max_bytes=STORAGE_CACHE_SIZE):
+        self.backend = backend
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * STORAGE_CACHE_MAX_ENTRY)
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._bytes = 0
+        self._flights = {}
+        self._oversize = OrderedDict()  # paths known to exceed max_entry_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.bytes_evicted = 0
+        self._load()
+
+    def _cache_path(self, path):
+        return os.path.join(self.root, *path.split('/'))
+
+    def _cacheable(self, path):
+        return path.startswith(CACHEABLE_PREFIXES) and '..' not in path.split('/')
+
+    def _load(self):
+        """Index what a previous run left on disk, oldest first."""
+        found = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                stat = os.stat(full_path)
+                if name.endswith('.tmp'):
+                    # Another worker may still be filling it; only sweep leftovers from crashes
+                    if stat.st_mtime < time.time() - STALE_TMP_AGE:
+                        os.remove(full_path)
+                    continue
+                found.append((stat.st_mtime, os.path.relpath(full_path, self.root).replace(os.sep, '/'), stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        # Caller holds the lock (or is the constructor)
+        while self._bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            self.bytes_evicted += size
+            try:
+                os.remove(self._cache_path(path))
+            except FileNotFoundError:
+                pass
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _lookup(self, path):
+        """Return the cached file for path and mark it recently used, or None."""
+        full_path = self._cache_path(path)
+        try:
+            size = os.path.getsize(full_path)
+        except OSError:
+            with self._lock:
+                if path in self._entries:
+                    self._bytes -= self._entries.pop(path)
+            return None
+        with self._lock:
+            if path not in self._entries:
+                # Filled by another worker sharing the directory
+                self._bytes += size
+                self._entries[path] = size
+                self._evict()
+            self._entries.move_to_end(path)
+        return full_path
+
+    def _open_cached(self, path):
+        full_path = self._lookup(path)
+        if full_path is None:
+            return None
+        try:
+            return open(full_path, 'rb')
+        except FileNotFoundError:
+            # Evicted between the lookup and the open
+            return None
+
+    def _read(self, f, chunk_size, start):
+        with f:
+            f.seek(start)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _remember_oversize(self, path):
+        with self._lock:
+            self._oversize[path] = True
+            self._oversize.move_to_end(path)
+            if len(self._oversize) > OVERSIZE_MEMORY:
+                self._oversize.popitem(last=False)
+
+    def _start_flight(self, path):
+        """Create the fill's temporary file; caller holds the lock. Returns (flight, file) or None."""
+        full_path = self._cache_path(path)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            f = open(tmp_path, 'wb')
+        except OSError:
+            return None
+        flight = self._flights[path] = _Flight(tmp_path)
+        return flight, f
+
+    def _fill(self, path, chunk_size, flight, f):
+        """Fetch the object into the cache at the backend's pace, however fast it is being read."""
+        state = ABANDONED
+        try:
+            with f:
+                chunks = self.backend.open(path, chunk_size)
+                try:
+                    for chunk in chunks:
+                        if flight.written + len(chunk) > self.max_entry_bytes:
+                            self._remember_oversize(path)
+                            break
+                        f.write(chunk)
+                        f.flush()
+                        with flight.changed:
+                            flight.written += len(chunk)
+                            flight.changed.notify_all()
+                    else:
+                        state = CACHED
+                finally:
+                    chunks.close()
+            if state == CACHED:
+                os.replace(flight.tmp_path, self._cache_path(path))
+        except Exception:
+            # Readers fetch whatever they still need themselves, and see the error there
+            state = ABANDONED
+        finally:
+            with flight.changed:
+                if state != CACHED and os.path.exists(flight.tmp_path):
+                    os.remove(flight.tmp_path)
+                flight.state = state
+                flight.changed.notify_all()
+            with self._lock:
+                if state == CACHED:
+                    self._bytes += flight.written - self._entries.pop(path, 0)
+                    self._entries[path] = flight.written
+                    self._evict()
+                del self._flights[path]
+
+    def _follow(self, path, chunk_size, flight):
+        """Stream the object from the flight's file as it grows.
+
+        If the fill is abandoned, or makes no progress for FLIGHT_WAIT, the
+        rest is fetched from the backend.
+        """
+        with flight.changed:
+            # Once the fill has ended its temporary file is gone
+            f = open(flight.tmp_path, 'rb') if flight.state == FILLING else None
+            state = flight.state
+        if f is None:
+            cached = self._open_cached(path) if state == CACHED else None
+            if cached is not None:
+                yield from self._read(cached, chunk_size, 0)
+            else:
+                yield from self.backend.open(path, chunk_size)
+            return
+
+        position = 0
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                with flight.changed:
+                    flight.changed.wait_for(lambda: flight.written > position or flight.state != FILLING, FLIGHT_WAIT)
+                    written, state = flight.written, flight.state
+                if written > position:
+                    continue
+                if state == CACHED:
+                    return
+                break
+        yield from self.backend.open(path, chunk_size, position)
+
+    def open(self, path, chunk_size=CHUNK_SIZE, start=0):
+        if not self._cacheable(path):
+            yield from self.backend.open(path, chunk_size, start)
+            return
+
+        cached = self._open_cached(path)
+        if cached is not None:
+            self._count('hits')
+            yield from self._read(cached, chunk_size, start)
+            return
+
+        self._count('misses')
+        if start:
+            # A seek into an uncached object fetches just that range
+            yield from self.backend.open(path, chunk_size, start)
+            return
+
+        started = None
+        with self._lock:
+            flight = self._flights.get(path)
+            if flight is None and path not in self._oversize:
+                started = self._start_flight(path)
+        if flight is None and started is None:
+            # Too big to keep (or the cache can't be written), so there is nothing to share
+            self._count('bypassed')
+            yield from self.backend.open(path, chunk_size)
+            return
+        if started is not None:
+            flight, f = started
+            threading.Thread(target=self._fill, args=(path, chunk_size, flight, f),
+                             name="storage-cache-fill", daemon=True).start()
+        else:
+            self._count('coalesced')
+        yield from self._follow(path, chunk_size, flight)
+
+    def local_path(self, path):
+        if not self._cacheable(path):
+            return self.backend.local_path(path)
+        full_path = self._lookup(path)
+        if full_path is not None:
+            self._count('hits')
+        return full_path
+
+    def _forget(self, paths):
+        with self._lock:
+            for path in paths:
+                self._oversize.pop(path, None)
+                if path in self._entries:
+                    self._bytes -= self._entries.pop(path)
+        for path in paths:
+            if self._cacheable(path):
+                try:
+                    os.remove(self._cache_path(path))
+                except FileNotFoundError:
+                    pass
+
+    def upload(self, path, chunks, content_type="application/octet-stream"):
+        self.backend.upload(path, chunks, content_type)
+
+    def list(self, prefix):
+        return self.backend.list(prefix)
+
+    def exists(self, path):
+        return self.backend.exists(path)
+
+    def move(self, source, destination):
+        self.backend.move(source, destination)
+        self._forget([source, destination])
+
+    def delete(self, paths):
+        paths = list(paths)
+        self.backend.delete(paths)
+        self._forget(paths)
+
+    def public_url(self, path):
+        return self.backend.public_url(path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "coalesced": self.coalesced,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "bytes_evicted": self.bytes_evicted,
+            }
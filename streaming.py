@@ -0,0 +1,124 @@
+# streaming.py
+import hashlib
+import time
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, NeedData, Epilogue
+
+CHUNK_SIZE = 64 * 1024  # 64KB read size when pulling the request body
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(Exception):
+    pass
+
+
+class HashingStream:
+    """Pass chunks through while counting bytes and computing a SHA-256.
+
+    Raises UploadTooLarge as soon as more than max_size bytes have been seen,
+    so the transfer is aborted without reading the rest of the body.
+    receive_seconds is the time spent waiting on the source, which tells
+    reading the client's body apart from sending to storage.
+    """
+
+    def __init__(self, chunks, max_size=None):
+        self.chunks = chunks
+        self.max_size = max_size
+        self.size = 0
+        self.receive_seconds = 0.0
+        self._sha256 = hashlib.sha256()
+
+    def __iter__(self):
+        chunks = iter(self.chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            self.receive_seconds += time.perf_counter() - start
+            if chunk is None:
+                return
+            self.size += len(chunk)
+            if self.max_size is not None and self.size > self.max_size:
+                raise UploadTooLarge(f"Upload exceeds {self.max_size} bytes")
+            self._sha256.update(chunk)
+            yield chunk
+
+    @property
+    def checksum(self):
+        return self._sha256.hexdigest()
+
+
+def iter_chunks(stream, chunk_size=CHUNK_SIZE):
+    """Read a file-like object in fixed size chunks."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _multipart_events(stream, boundary, chunk_size):
+    decoder = MultipartDecoder(boundary)
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                yield event
+                if isinstance(event, Epilogue):
+                    return
+                event = decoder.next_event()
+            if not data:
+                return
+    except ValueError as e:
+        raise MalformedUpload(str(e))
+
+
+def iter_multipart_files(stream, content_type, chunk_size=CHUNK_SIZE):
+    """Incrementally parse a multipart body, yielding one tuple per file part.
+
+    Yields (field_name, filename, content_type, chunks). The chunks iterator
+    reads straight from the stream, so it must be consumed before moving on to
+    the next part; anything left unread is skipped.
+    """
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get("boundary")
+    if not mimetype.startswith("multipart/") or not boundary:
+        raise MalformedUpload("Missing multipart boundary")
+
+    events = _multipart_events(stream, boundary.encode(), chunk_size)
+
+    def file_chunks():
+        for event in events:
+            if isinstance(event, Data):
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    return
+
+    for event in events:
+        if isinstance(event, File):
+            part_type = event.headers.get("Content-Type", "application/octet-stream")
+            yield event.name, event.filename, part_type, file_chunks()
+
+
+def open_upload_stream(request, field_name="file"):
+    """Return (filename, content_type, chunks) for the uploaded file, or None.
+
+    Multipart bodies are parsed as they arrive. Any other body is treated as the
+    raw file content, named by the X-File-Name header or ?filename= argument.
+    """
+    content_type = request.headers.get("Content-Type", "")
+    if content_type.startswith("multipart/"):
+        for name, filename, part_type, chunks in iter_multipart_files(request.stream, content_type):
+            if name == field_name:
+                return filename, part_type, chunks
+        return None
+
+    filename = request.headers.get("X-File-Name") or request.args.get("filename")
+    if filename is None:
+        return None
+    return filename, content_type or "application/octet-stream", iter_chunks(request.stream)
@@ -1,12 +1,162 @@
 # supabase_client.py
-from supabase import create_client
 import os
-from dotenv import load_dotenv
+import random
+import threading
+import time
+import httpx
+from supabase import Client, ClientOptions
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient as PostgrestSession
+from storage3 import SyncStorageClient
+from storage3.utils import SyncClient as StorageSession
+from config import Config
 
-load_dotenv() 
+SUPABASE_URL = Config.SUPABASE_URL
+SUPABASE_KEY = Config.SUPABASE_KEY
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Connection pool and timeout settings, shared by PostgREST, storage and the raw HTTP clients
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", 20))
+SUPABASE_KEEPALIVE = int(os.getenv("SUPABASE_KEEPALIVE", 10))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", 30))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", 5))
+METADATA_TIMEOUT = float(os.getenv("SUPABASE_METADATA_TIMEOUT", 10))
+STORAGE_TIMEOUT = float(os.getenv("SUPABASE_STORAGE_TIMEOUT", 300))
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Retry settings for idempotent calls
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", 3))
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+# Errors raised before the request reached the server, so even a POST is safe to resend
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=SUPABASE_POOL_SIZE,
+        max_keepalive_connections=SUPABASE_KEEPALIVE,
+        keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+    )
+
+
+def operation_timeout(read_timeout):
+    return httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def should_retry(method, error=None, status_code=None):
+    if error is not None:
+        return isinstance(error, NOT_SENT_ERRORS) or (
+            method in IDEMPOTENT_METHODS and isinstance(error, httpx.TransportError)
+        )
+    return method in IDEMPOTENT_METHODS and status_code in RETRY_STATUSES
+
+
+def with_retries(method, fn):
+    """Call fn(), retrying with jittered backoff when should_retry allows it."""
+    for attempt in range(SUPABASE_RETRIES + 1):
+        try:
+            return fn()
+        except httpx.HTTPError as e:
+            if attempt == SUPABASE_RETRIES or not should_retry(method, error=e):
+                raise
+        time.sleep(backoff_delay(attempt))
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return PostgrestSession(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=SUPABASE_HTTP2,
+            limits=pool_limits(),
+        )
+
+
+class PooledStorageClient(SyncStorageClient):
+    def _create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return StorageSession(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=bool(verify),
+            proxy=proxy,
+            follow_redirects=True,
+            http2=SUPABASE_HTTP2,
+            limits=pool_limits(),
+        )
+
+
+class PooledSupabaseClient(Client):
+    """supabase-py client whose PostgREST and storage sessions use tuned keep-alive pools."""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=METADATA_TIMEOUT, verify=True, proxy=None):
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout, verify=verify, proxy=proxy)
+
+    @staticmethod
+    def _init_storage_client(storage_url, headers, storage_client_timeout=STORAGE_TIMEOUT, verify=True, proxy=None):
+        return PooledStorageClient(storage_url, headers, storage_client_timeout, verify, proxy)
+
+
+def create_pooled_client(url=SUPABASE_URL, key=SUPABASE_KEY):
+    options = ClientOptions(
+        postgrest_client_timeout=operation_timeout(METADATA_TIMEOUT),
+        storage_client_timeout=STORAGE_TIMEOUT,
+    )
+    return PooledSupabaseClient.create(url, key, options)
+
+
+def _auth_headers():
+    return {"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY}
+
+
+_supabase = None
+_supabase_pid = None
+_http_client = None
+_http_client_pid = None
+_http_lock = threading.Lock()
+
+
+def get_supabase():
+    """The pooled supabase-py client for this process, created on first use.
+
+    Nothing connects at import, and a forked worker builds its own client
+    instead of sharing the parent's sockets.
+    """
+    global _supabase, _supabase_pid
+    with _http_lock:
+        if _supabase is None or _supabase_pid != os.getpid():
+            _supabase = create_pooled_client()
+            _supabase_pid = os.getpid()
+        return _supabase
+
+
+def http_client():
+    """A pooled keep-alive httpx.Client for raw REST calls (e.g. streamed storage transfers).
+
+    Rebuilt if the process has forked, so workers never share sockets.
+    """
+    global _http_client, _http_client_pid
+    with _http_lock:
+        if _http_client is None or _http_client_pid != os.getpid():
+            _http_client = httpx.Client(
+                base_url=SUPABASE_URL,
+                headers=_auth_headers(),
+                timeout=operation_timeout(STORAGE_TIMEOUT),
+                limits=pool_limits(),
+                http2=SUPABASE_HTTP2,
+            )
+            _http_client_pid = os.getpid()
+        return _http_client
 
@@ -0,0 +1,82 @@
+"""Shared fixtures: the app wired to an in-process local_supabase stand-in.
+
+Settings are read from the environment when modules are imported, so the
+stand-in is started and the environment filled in here, before any test
+module imports the app.
+"""
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import local_supabase  # noqa: E402
+
+WORKDIR = tempfile.mkdtemp(prefix="cloudnest_tests_")
+SERVER, SUPABASE_URL = local_supabase.serve(storage_root=os.path.join(WORKDIR, "supabase"))
+os.environ.update(
+    SUPABASE_URL=SUPABASE_URL,
+    SUPABASE_KEY="eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.local",
+    JWT_SECRET_KEY="test-secret",
+    JWT_ALGORITHM="HS256",
+    STORAGE_BACKEND="local",
+    LOCAL_STORAGE_DIR=os.path.join(WORKDIR, "storage"),
+    REVOCATION_DB=os.path.join(WORKDIR, "revocation.db"),
+    UPLOAD_RATE="0",
+    # Cheap hashes keep registration and login fast
+    PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+)
+os.environ.pop("DATABASE_URL", None)
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _stand_in():
+    yield
+    SERVER.shutdown()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Register and log in a fresh user, returning their Authorization headers.
+
+    One authenticated request is made first, so the user check is already
+    cached when a test starts counting round trips.
+    """
+    def make():
+        n = next(_users)
+        credentials = {"email": f"user{n}@example.com", "password": "secret-password"}
+        response = client.post("/register", json={"username": f"user{n}", "confirm_password": credentials["password"],
+                                                  **credentials})
+        assert response.status_code == 201, response.json
+        token = client.post("/login", json=credentials).json["token"]
+        headers = {"Authorization": token}
+        assert client.get("/usage", headers=headers).status_code == 200
+        return headers
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+def round_trips(response):
+    return int(response.headers["X-Round-Trips"])
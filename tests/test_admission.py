@@ -0,0 +1,65 @@
+"""Upload admission control: per-user rates and per-worker capacity."""
+import threading
+import pytest
+import admission
+
+
+def upload(client, headers, content=b"x" * 100):
+    return client.post("/upload_file", data=content,
+                       headers={**headers, "X-File-Name": "a.pdf", "Content-Type": "application/pdf"})
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def configure(**kwargs):
+        uploads = admission.Admission(**{"rate": 0, **kwargs})
+        monkeypatch.setattr(admission, "uploads", uploads)
+        return uploads
+    return configure
+
+
+def test_user_over_their_rate_gets_429(client, make_user, limits):
+    uploads = limits(rate=0.5, burst=2)
+    user, other = make_user(), make_user()
+    assert upload(client, user).status_code == 200
+    assert upload(client, user).status_code == 200
+    response = upload(client, user)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    # Buckets are per user
+    assert upload(client, other).status_code == 200
+    assert uploads.stats()["rejected"]["rate"] == 1
+
+
+def test_full_worker_gets_503(client, user, limits):
+    uploads = limits(max_uploads=1)
+    ticket = uploads.admit("someone-else", 0)
+    response = upload(client, user)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(admission.UPLOAD_RETRY_AFTER)
+    ticket.release()
+    assert upload(client, user).status_code == 200
+    assert uploads.stats()["uploads_in_flight"] == 0
+
+
+def test_byte_budget(client, user, limits):
+    uploads = limits(byte_budget=1000)
+    with uploads.admit("someone-else", 950):
+        assert upload(client, user).status_code == 503
+        assert uploads.stats()["rejected"]["bytes"] == 1
+    # Alone, an upload bigger than the whole budget still runs
+    assert upload(client, user, b"x" * 2000).status_code == 200
+
+
+def test_waits_briefly_for_capacity(limits):
+    uploads = limits(max_uploads=1, wait=5)
+    ticket = uploads.admit("first", 0)
+    threading.Timer(0.05, ticket.release).start()
+    with uploads.admit("second", 0):
+        assert uploads.stats()["uploads_in_flight"] == 1
+
+    uploads.wait = 0.05
+    with uploads.admit("first", 0):
+        with pytest.raises(admission.Rejected) as e:
+            uploads.admit("second", 0)
+    assert e.value.status == 503
@@ -0,0 +1,61 @@
+"""Token and user caching, logout and revocation."""
+import time
+import pytest
+import auth_cache
+import revocation
+from conftest import round_trips
+
+
+def test_logout_drops_the_cached_token(client, user):
+    token = user["Authorization"]
+    assert auth_cache.token_cache.get(token) is not None
+
+    response = client.post("/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert auth_cache.token_cache.get(token) is None
+    response = client.get("/usage", headers=user)
+    assert response.status_code == 401
+    assert response.json["error"] == "Token has been revoked"
+
+
+def test_invalidated_user_is_looked_up_again(client, user):
+    user_id, _ = auth_cache.token_cache.get(user["Authorization"])
+    assert round_trips(client.get("/folders", headers=user)) == 1
+
+    auth_cache.invalidate_user(user_id)
+    assert auth_cache.get_cached_user(user_id) is None
+    # The users lookup comes back for one request, then is cached again
+    assert round_trips(client.get("/folders", headers=user)) == 2
+    assert round_trips(client.get("/folders", headers=user)) == 1
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return revocation.MemoryRevocationStore()
+    return revocation.SQLiteRevocationStore(str(tmp_path / "revoked.db"))
+
+
+def test_revocations_expire_with_the_token(store, monkeypatch):
+    now = time.time()
+    store.revoke("live", now + 60)
+    store.revoke("expiring", now + 1)
+    assert store.is_revoked("live") and store.is_revoked("expiring")
+    assert len(store) == 2
+
+    monkeypatch.setattr(revocation.time, "time", lambda: now + 2)
+    assert not store.is_revoked("expiring")
+    assert store.is_revoked("live")
+    assert len(store) == 1
+
+
+def test_expired_revocations_are_swept(store, monkeypatch):
+    now = time.time()
+    store.revoke("old", now + 1)
+    monkeypatch.setattr(revocation.time, "time", lambda: now + revocation.PURGE_INTERVAL + 2)
+    # Any later revoke sweeps the expired entries out of storage
+    store.revoke("new", now + revocation.PURGE_INTERVAL + 60)
+    if isinstance(store, revocation.MemoryRevocationStore):
+        assert "old" not in store._revoked
+    else:
+        assert store._connection().execute("SELECT jti FROM revoked_tokens").fetchall() == [("new",)]
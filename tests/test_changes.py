@@ -0,0 +1,51 @@
+"""The change feed: GET /changes cursors, settling and expiry."""
+import time
+import pytest
+import changes
+from pagination import encode_cursor
+
+DAY = 86400
+
+
+def poll(client, headers, cursor):
+    return client.get("/changes", query_string={"cursor": cursor}, headers=headers)
+
+
+def test_changes_after_the_head_cursor(client, user, monkeypatch):
+    monkeypatch.setattr(changes, "CHANGE_SETTLE_SECONDS", 0)
+    cursor = client.get("/changes", headers=user).json["next_cursor"]
+    folder = client.post("/create-folder", json={"folder_name": "docs"}, headers=user).json["folder"]
+    assert client.patch(f"/folders/{folder['id']}", json={"new_name": "papers"}, headers=user).status_code == 200
+
+    page = poll(client, user, cursor).json
+    # Create and rename collapse into one create with the current row
+    assert [(c["type"], c["id"], c["op"]) for c in page["changes"]] == [("folder", folder["id"], "create")]
+    assert page["changes"][0]["item"]["folder_name"] == "papers"
+
+    client.delete(f"/folders/{folder['id']}", headers=user)
+    page = poll(client, user, page["next_cursor"]).json
+    assert [(c["op"], c["item"]) for c in page["changes"]] == [("delete", None)]
+    assert poll(client, user, page["next_cursor"]).json["changes"] == []
+
+
+def test_unsettled_changes_are_returned_again(client, user):
+    cursor = client.get("/changes", headers=user).json["next_cursor"]
+    client.post("/create-folder", json={"folder_name": "docs"}, headers=user)
+    first = poll(client, user, cursor).json
+    assert len(first["changes"]) == 1
+    # Too recent to move the cursor past, since an earlier sequence number may not be visible yet
+    assert len(poll(client, user, first["next_cursor"]).json["changes"]) == 1
+
+
+@pytest.mark.parametrize("age, status", [
+    (changes.CHANGE_RETENTION_DAYS * DAY - 60, 200),
+    (changes.CHANGE_RETENTION_DAYS * DAY + 60, 410),
+])
+def test_cursors_expire_with_retention(client, user, age, status):
+    response = poll(client, user, encode_cursor({"s": 0, "t": time.time() - age}))
+    assert response.status_code == status
+
+
+@pytest.mark.parametrize("cursor", ["garbage", encode_cursor({"s": "abc", "t": time.time()}), encode_cursor({"s": 0})])
+def test_malformed_cursors(client, user, cursor):
+    assert poll(client, user, cursor).status_code == 400
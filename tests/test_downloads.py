@@ -0,0 +1,75 @@
+"""Conditional and ranged GET /files/<id>/download."""
+import pytest
+
+
+def upload(client, headers, content, name="a.pdf", content_type="application/pdf"):
+    response = client.post("/upload_file", data=content,
+                           headers={**headers, "X-File-Name": name, "Content-Type": content_type})
+    assert response.status_code == 200
+    return f"/files/{response.json['id']}/download"
+
+
+@pytest.fixture
+def content():
+    return bytes(range(256)) * 4
+
+
+def test_full_download_advertises_ranges(client, user, content):
+    url = upload(client, user, content)
+    response = client.get(url, headers=user)
+    assert response.status_code == 200
+    assert response.data == content
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert set(response.headers["Cache-Control"].split(", ")) == {"private", "no-cache"}
+
+
+@pytest.mark.parametrize("header, status, body", [
+    ("bytes=0-9", 206, slice(0, 10)),
+    ("bytes=1000-", 206, slice(1000, None)),
+    ("bytes=-24", 206, slice(-24, None)),
+    ("bytes=5000-6000", 416, None),
+])
+def test_ranges(client, user, content, header, status, body):
+    url = upload(client, user, content)
+    response = client.get(url, headers={**user, "Range": header})
+    assert response.status_code == status
+    if body is not None:
+        assert response.data == content[body]
+    else:
+        assert response.headers["Content-Range"] == f"bytes */{len(content)}"
+
+
+def test_if_none_match(client, user, content):
+    url = upload(client, user, content)
+    etag = client.get(url, headers=user).headers["ETag"]
+    response = client.get(url, headers={**user, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert client.get(url, headers={**user, "If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_stale_if_range_sends_the_whole_file(client, user, content):
+    url = upload(client, user, content)
+    etag = client.get(url, headers=user).headers["ETag"]
+    assert client.get(url, headers={**user, "Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    response = client.get(url, headers={**user, "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == content
+
+
+def test_compressed_file_decoded_on_the_fly(client, user):
+    content = b"date,value\n" + b"2024-01-01,1\n" * 5000
+    url = upload(client, user, content, "data.csv", "text/csv")
+    # Offsets into the original aren't known without inflating, so ranges are ignored
+    response = client.get(url, headers={**user, "Range": "bytes=0-9"})
+    assert response.status_code == 200
+    assert response.data == content
+    assert response.headers["Accept-Ranges"] == "none"
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={**user, "If-None-Match": etag}).status_code == 304
+    # The gzip representation has its own validator
+    gzipped = client.get(url, headers={**user, "Accept-Encoding": "gzip"})
+    assert gzipped.headers["ETag"] != etag
+    assert client.get(url, headers={**user, "Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 200
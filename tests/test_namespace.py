@@ -0,0 +1,57 @@
+"""Creating, renaming and moving files and folders."""
+import pytest
+
+
+def create_folder(client, headers, name, parent_id=None):
+    return client.post("/create-folder", json={"folder_name": name, "parent_id": parent_id}, headers=headers)
+
+
+def upload(client, headers, name="a.pdf"):
+    response = client.post("/upload_file", data=b"content",
+                           headers={**headers, "X-File-Name": name, "Content-Type": "application/pdf"})
+    return response
+
+
+@pytest.mark.parametrize("parent_id, status", [("abc", 400), (999999, 404)])
+def test_create_folder_with_a_bad_parent(client, user, parent_id, status):
+    response = create_folder(client, user, "docs", parent_id)
+    assert response.status_code == status
+    assert response.is_json
+
+
+def test_create_folder_matches_patch_status_codes(client, user):
+    assert create_folder(client, user, "docs").status_code == 201
+    assert create_folder(client, user, "docs").status_code == 409
+
+
+def test_nested_folders_and_moves(client, make_user):
+    user, other = make_user(), make_user()
+    parent = create_folder(client, user, "parent").json["folder"]["id"]
+    child = create_folder(client, user, "child", parent).json["folder"]["id"]
+    assert client.get(f"/folders?parent={parent}", headers=user).json["folders"][0]["id"] == child
+    # A folder can't go inside its own subtree, or into someone else's folder
+    assert client.patch(f"/folders/{parent}", json={"parent_id": child}, headers=user).status_code == 400
+    foreign = create_folder(client, other, "theirs").json["folder"]["id"]
+    assert create_folder(client, user, "sneaky", foreign).status_code == 404
+
+
+def test_rename_keeps_to_the_allowed_extensions(client, user):
+    file_id = upload(client, user).json["id"]
+    response = client.patch(f"/files/{file_id}", json={"file_name": "evil.exe"}, headers=user)
+    assert response.status_code == 400
+    response = client.patch(f"/files/{file_id}", json={"file_name": "notes.txt"}, headers=user)
+    assert response.status_code == 200
+    assert response.json["file"]["file_name"] == "notes.txt"
+
+
+def test_upload_file_keeps_to_the_allowed_extensions(client, user):
+    assert upload(client, user, "evil.exe").status_code == 400
+
+
+def test_listing_by_parent(client, user):
+    parent = create_folder(client, user, "parent").json["folder"]["id"]
+    create_folder(client, user, "child", parent)
+    response = client.get("/folders?parent=abc", headers=user)
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid parent id"
+    assert [f["folder_name"] for f in client.get("/folders?parent=root", headers=user).json["folders"]] == ["parent"]
@@ -0,0 +1,131 @@
+"""PostgREST round trips per endpoint, as reported in X-Round-Trips."""
+import io
+import pytest
+import data_access
+from conftest import round_trips
+
+
+def create_folder(client, headers, name, parent_id=None):
+    response = client.post("/create-folder", json={"folder_name": name, "parent_id": parent_id}, headers=headers)
+    assert response.status_code == 201, response.json
+    return response.json["folder"]["id"]
+
+
+def upload_batch(client, headers, names, folder_id=None):
+    data = {"file": [(io.BytesIO(name.encode()), name) for name in names]}
+    if folder_id is not None:
+        data["folder_id"] = str(folder_id)
+    return client.post("/upload", data=data, headers=headers, content_type="multipart/form-data")
+
+
+def test_register_is_one_insert(client):
+    body = {"username": "roundtrip", "email": "roundtrip@example.com",
+            "password": "secret-password", "confirm_password": "secret-password"}
+    response = client.post("/register", json=body)
+    assert response.status_code == 201
+    assert round_trips(response) == 1
+
+    # Only a conflict pays for the lookup that names the taken field
+    response = client.post("/register", json=body)
+    assert response.status_code == 409
+    assert round_trips(response) == 2
+
+
+def test_login_is_one_lookup(client):
+    response = client.post("/login", json={"email": "roundtrip-missing@example.com", "password": "x"})
+    assert response.status_code == 404
+    assert round_trips(response) == 1
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/folders", 1),
+    ("/folders?include_counts=1", 2),
+    ("/usage", 1),
+    ("/changes", 1),
+])
+def test_reads(client, user, path, expected):
+    create_folder(client, user, "docs")
+    response = client.get(path, headers=user)
+    assert response.status_code == 200
+    assert round_trips(response) == expected
+
+
+def test_folder_and_file_items(client, user):
+    folder_id = create_folder(client, user, "docs")
+    response = client.get(f"/folders/{folder_id}", headers=user)
+    assert response.status_code == 200
+    assert round_trips(response) == 1
+
+    response = client.post("/upload_file", data=b"x" * 100,
+                           headers={**user, "X-File-Name": "a.pdf", "Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    # Quota, blob lookup, blob insert and the files row
+    assert round_trips(response) == 4
+    file_id = response.json["id"]
+
+    response = client.get(f"/files/{file_id}/download", headers=user)
+    assert response.status_code == 200
+    assert round_trips(response) == 1
+
+    response = client.patch(f"/files/{file_id}", json={"file_name": "b.pdf"}, headers=user)
+    assert response.status_code == 200
+    assert round_trips(response) == 1
+
+    response = client.delete(f"/files/{file_id}", headers=user)
+    assert response.status_code == 202
+    assert round_trips(response) == 1
+
+
+def test_batch_upload_inserts_rows_in_bulk(client, user):
+    folder_id = create_folder(client, user, "docs")
+    one = upload_batch(client, user, ["a0.pdf"], folder_id)
+    three = upload_batch(client, user, ["b0.pdf", "b1.pdf", "b2.pdf"], folder_id)
+    assert one.status_code == three.status_code == 200
+    # Each extra file costs only its blob lookup and insert
+    assert round_trips(three) - round_trips(one) == 2 * 2
+
+
+def test_batch_upload_into_another_users_folder(client, make_user):
+    owner, other = make_user(), make_user()
+    folder_id = create_folder(client, owner, "private")
+    response = upload_batch(client, other, ["a.pdf"], folder_id)
+    assert response.status_code == 404
+    # Quota and folder checks only: nothing was stored
+    assert round_trips(response) == 2
+    assert client.get("/folders?include_counts=1", headers=owner).json["folders"][0]["file_count"] == 0
+
+    assert upload_batch(client, other, ["a.pdf"], "abc").status_code == 400
+
+
+@pytest.mark.parametrize("method", ["get", "delete"])
+def test_folder_id_must_be_numeric(client, user, method):
+    response = getattr(client, method)("/folders/abc", headers=user)
+    assert response.status_code == 400
+    assert round_trips(response) == 0
+
+
+def test_export_is_scoped_to_the_owner(client, make_user):
+    owner, other = make_user(), make_user()
+    folder_id = create_folder(client, owner, "docs")
+    assert upload_batch(client, owner, ["a.txt"], folder_id).status_code == 200
+
+    response = client.get(f"/folders/{folder_id}/export", headers=owner)
+    assert response.status_code == 200
+    # Folder row, subtree walk, folder names and files
+    assert round_trips(response) == 4
+    assert client.get(f"/folders/{folder_id}/export", headers=other).status_code == 404
+
+
+def test_subtree_ids_are_sent_in_chunks(client, user, monkeypatch):
+    monkeypatch.setattr(data_access, "IN_FILTER_SIZE", 2)
+    root = create_folder(client, user, "root")
+    children = [create_folder(client, user, f"child{n}", root) for n in range(5)]
+    for child in children:
+        assert upload_batch(client, user, [f"in{child}.pdf"], child).status_code == 200
+
+    response = client.delete(f"/folders/{root}", headers=user)
+    assert response.status_code == 202
+    # Subtree walk 1 + 3, the root 1, its 5 subfolders in 3 and their 6 ids' files in 3
+    assert round_trips(response) == 11
+    assert client.get("/usage", headers=user).json["file_count"] == 0
+    assert client.get("/folders", headers=user).json["folders"] == []
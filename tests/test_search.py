@@ -0,0 +1,73 @@
+"""Ranked filename search: GET /files/search."""
+import pytest
+
+
+def upload(client, headers, name):
+    response = client.post("/upload_file", data=name.encode(),
+                           headers={**headers, "X-File-Name": name, "Content-Type": "application/pdf"})
+    assert response.status_code == 200
+    return response.json
+
+
+def search(client, headers, **args):
+    response = client.get("/files/search", query_string=args, headers=headers)
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def names(result):
+    return [(f["file_name"], f["rank"]) for f in result["files"]]
+
+
+@pytest.fixture
+def files(client, user):
+    for name in ("notes.pdf", "annual_report.pdf", "report.pdf", "Report-2024.pdf"):
+        upload(client, user, name)
+
+
+def test_exact_then_prefix_then_substring(client, user, files):
+    assert names(search(client, user, q="report.pdf")) == [("report.pdf", 0), ("annual_report.pdf", 2)]
+    # Case-insensitive, ordered by name within a tier
+    assert names(search(client, user, q="REPORT")) == [
+        ("Report-2024.pdf", 1), ("report.pdf", 1), ("annual_report.pdf", 2),
+    ]
+
+
+def test_prefix_mode_and_short_queries_skip_substrings(client, user, files):
+    assert names(search(client, user, q="report", mode="prefix")) == [("Report-2024.pdf", 1), ("report.pdf", 1)]
+    assert names(search(client, user, q="no")) == [("notes.pdf", 1)]
+    assert search(client, user, q="ot")["files"] == []
+
+
+def test_cursor_walks_across_tiers(client, user, files):
+    seen, cursor = [], None
+    while True:
+        page = search(client, user, q="report", limit=1, **({"cursor": cursor} if cursor else {}))
+        seen += names(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [("Report-2024.pdf", 1), ("report.pdf", 1), ("annual_report.pdf", 2)]
+
+
+def test_wildcards_are_literal(client, user):
+    upload(client, user, "100_percent.pdf")
+    upload(client, user, "1000.pdf")
+    assert names(search(client, user, q="100_")) == [("100_percent.pdf", 1)]
+    assert search(client, user, q="%")["files"] == []
+
+
+def test_results_are_scoped(client, make_user):
+    owner, other = make_user(), make_user()
+    folder_id = client.post("/create-folder", json={"folder_name": "docs"}, headers=owner).json["folder"]["id"]
+    upload(client, owner, "report.pdf")
+    draft = upload(client, owner, "report-draft.pdf")
+    assert client.patch(f"/files/{draft['id']}", json={"folder_id": folder_id}, headers=owner).status_code == 200
+    assert search(client, other, q="report")["files"] == []
+    assert names(search(client, owner, q="report", folder_id=folder_id)) == [("report-draft.pdf", 1)]
+
+
+@pytest.mark.parametrize("args", [{}, {"q": "   "}, {"q": "x" * 256}, {"q": "report", "mode": "fuzzy"},
+                                  {"q": "report", "cursor": "garbage"}, {"q": "report", "limit": "ten"}])
+def test_invalid_searches(client, user, args):
+    assert client.get("/files/search", query_string=args, headers=user).status_code == 400
@@ -0,0 +1,116 @@
+"""The on-disk LRU in front of remote storage: eviction and shared fills."""
+import threading
+import time
+import pytest
+from storage import CHUNK_SIZE, LocalStorage
+from storage_cache import CachedStorage
+
+
+class RemoteStorage(LocalStorage):
+    """LocalStorage that counts fetches and can hold them before they send anything."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.opens = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def open(self, path, chunk_size=CHUNK_SIZE, start=0):
+        self.opens += 1
+        self.gate.wait()
+        yield from super().open(path, chunk_size, start)
+
+    def local_path(self, path):
+        return None
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return RemoteStorage(str(tmp_path / "remote"))
+
+
+@pytest.fixture
+def cache(backend, tmp_path):
+    # Objects over 25 bytes are too big to keep
+    return CachedStorage(backend, str(tmp_path / "cache"), max_bytes=100)
+
+
+def store(backend, name, size=20):
+    path = f"blobs/{name}"
+    backend.upload(path, [name.encode()[:1] * size])
+    return path
+
+
+def read(cache, path):
+    content = b"".join(cache.open(path))
+    # The fill finishes in its own thread
+    wait_for(lambda: not cache._flights)
+    return content
+
+
+def test_repeat_reads_are_served_from_disk(cache, backend):
+    path = store(backend, "a")
+    assert read(cache, path) == b"a" * 20
+    assert read(cache, path) == b"a" * 20
+    assert backend.opens == 1
+    assert cache.local_path(path) is not None
+    assert cache.stats()["hits"] == 2
+
+
+def test_least_recently_used_is_evicted(cache, backend):
+    paths = [store(backend, name) for name in "abcde"]
+    for path in paths:
+        read(cache, path)
+    assert cache.stats()["bytes"] == 100
+    # Touching a makes b the oldest
+    read(cache, paths[0])
+    read(cache, store(backend, "f"))
+
+    stats = cache.stats()
+    assert stats["bytes"] == 100
+    assert stats["evictions"] == 1 and stats["bytes_evicted"] == 20
+    assert cache.local_path(paths[1]) is None
+    assert cache.local_path(paths[0]) is not None
+
+
+def test_concurrent_misses_share_one_fetch(cache, backend):
+    path = store(backend, "a")
+    backend.gate.clear()
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(read(cache, path))) for _ in range(2)]
+    readers[0].start()
+    wait_for(lambda: path in cache._flights)
+    readers[1].start()
+    wait_for(lambda: cache.coalesced == 1)
+    backend.gate.set()
+    for reader in readers:
+        reader.join()
+
+    assert results == [b"a" * 20] * 2
+    assert backend.opens == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_oversize_objects_are_streamed_without_being_kept(cache, backend):
+    path = store(backend, "a", size=30)
+    assert read(cache, path) == b"a" * 30
+    assert cache.local_path(path) is None
+    # Once known to be too big, later reads skip the cache altogether
+    assert read(cache, path) == b"a" * 30
+    stats = cache.stats()
+    assert stats["bypassed"] == 1 and stats["bytes"] == 0
+
+
+def test_delete_drops_the_cached_copy(cache, backend):
+    path = store(backend, "a")
+    read(cache, path)
+    cache.delete([path])
+    assert cache.local_path(path) is None
+    assert cache.stats()["entries"] == 0
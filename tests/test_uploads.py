@@ -0,0 +1,124 @@
+"""Resumable multipart uploads: /uploads sessions, parts and completion."""
+import gzip
+import hashlib
+import pytest
+from conftest import round_trips
+from Resources.uploads import MIN_PART_SIZE
+
+
+def start(client, headers, **body):
+    return client.post("/uploads", json={"file_name": "report.pdf", **body}, headers=headers)
+
+
+def put_part(client, headers, upload_id, number, data):
+    return client.put(f"/uploads/{upload_id}/parts/{number}", data=data, headers=headers)
+
+
+@pytest.fixture
+def session(client, user):
+    response = start(client, user)
+    assert response.status_code == 201
+    return response.json["upload_id"]
+
+
+def test_parts_in_any_order_assemble_into_one_file(client, user, session):
+    parts = [b"a" * 1000, b"b" * 1000, b"c" * 10]
+    for number in (3, 1, 2):
+        response = put_part(client, user, session, number, parts[number - 1])
+        assert response.status_code == 200
+        assert response.json["checksum"] == hashlib.sha256(parts[number - 1]).hexdigest()
+
+    listed = client.get(f"/uploads/{session}", headers=user).json["parts"]
+    assert listed == [{"part_number": n, "size": len(parts[n - 1])} for n in (1, 2, 3)]
+
+    response = client.post(f"/uploads/{session}/complete", headers=user)
+    assert response.status_code == 200
+    content = b"".join(parts)
+    assert response.json["file_size"] == len(content)
+    assert response.json["checksum"] == hashlib.sha256(content).hexdigest()
+    assert client.get(f"/files/{response.json['id']}/download", headers=user).data == content
+    # The session is gone once completed
+    assert client.get(f"/uploads/{session}", headers=user).status_code == 404
+
+
+def test_complete_reports_missing_parts(client, user, session):
+    put_part(client, user, session, 1, b"x")
+    put_part(client, user, session, 3, b"x")
+    response = client.post(f"/uploads/{session}/complete", headers=user)
+    assert response.status_code == 400
+    assert response.json["missing_parts"] == [2]
+
+
+def test_empty_part_is_refused_before_it_is_stored(client, user, session):
+    response = put_part(client, user, session, 1, b"")
+    assert response.status_code == 400
+    assert client.get(f"/uploads/{session}", headers=user).json["parts"] == []
+    assert client.post(f"/uploads/{session}/complete", headers=user).status_code == 400
+
+
+def test_part_larger_than_part_size(client, user):
+    upload_id = start(client, user, part_size=MIN_PART_SIZE).json["upload_id"]
+    assert put_part(client, user, upload_id, 1, b"x" * (MIN_PART_SIZE + 1)).status_code == 400
+    assert put_part(client, user, upload_id, 1, b"x" * MIN_PART_SIZE).status_code == 200
+
+
+@pytest.mark.parametrize("body", [
+    {"part_size": "large"},
+    {"file_size": "1GB"},
+    {"part_size": MIN_PART_SIZE - 1},
+    {"folder_id": "abc"},
+    {"file_name": "script.exe"},
+])
+def test_invalid_sessions_are_refused(client, user, body):
+    response = start(client, user, **body)
+    assert response.status_code == 400
+    assert round_trips(response) == 0
+
+
+def test_session_folder_must_belong_to_the_user(client, make_user):
+    owner, other = make_user(), make_user()
+    folder_id = client.post("/create-folder", json={"folder_name": "docs"}, headers=owner).json["folder"]["id"]
+    assert start(client, other, folder_id=folder_id).status_code == 404
+
+    upload_id = start(client, owner, folder_id=folder_id).json["upload_id"]
+    put_part(client, owner, upload_id, 1, b"x" * 10)
+    assert client.post(f"/uploads/{upload_id}/complete", headers=owner).status_code == 200
+    folders = client.get("/folders?include_counts=1", headers=owner).json["folders"]
+    assert folders[0]["file_count"] == 1
+
+
+def test_sessions_are_private(client, make_user):
+    owner, other = make_user(), make_user()
+    upload_id = start(client, owner).json["upload_id"]
+    assert client.get(f"/uploads/{upload_id}", headers=other).status_code == 404
+    assert put_part(client, other, upload_id, 1, b"x").status_code == 404
+    assert client.post(f"/uploads/{upload_id}/complete", headers=other).status_code == 404
+
+
+def test_abort_discards_the_session(client, user, session):
+    put_part(client, user, session, 1, b"x")
+    assert client.delete(f"/uploads/{session}", headers=user).status_code == 200
+    assert client.get(f"/uploads/{session}", headers=user).status_code == 404
+
+
+def test_compressed_upload_links_to_the_download_endpoint(client, user):
+    content = b"date,value\n" + b"2024-01-01,1\n" * 5000
+    upload_id = start(client, user, file_name="data.csv", content_type="text/csv").json["upload_id"]
+    put_part(client, user, upload_id, 1, content)
+    response = client.post(f"/uploads/{upload_id}/complete", headers=user)
+    assert response.status_code == 200
+    assert response.json["stored_size"] < len(content)
+    # The public URL would serve the gzip bytes as they are
+    assert response.json["file_url"] == f"/files/{response.json['id']}/download"
+
+    download = client.get(response.json["file_url"], headers={**user, "Accept-Encoding": "gzip"})
+    assert download.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(download.data) == content
+    assert client.get(response.json["file_url"], headers=user).data == content
+
+
+def test_local_storage_paths_are_not_handed_out(client, user):
+    upload_id = start(client, user).json["upload_id"]
+    put_part(client, user, upload_id, 1, b"x" * 10)
+    response = client.post(f"/uploads/{upload_id}/complete", headers=user)
+    assert response.json["file_url"] == f"/files/{response.json['id']}/download"
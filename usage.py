@@ -0,0 +1,151 @@
+# usage.py
+"""Per-user and per-folder storage usage.
+
+user_usage and folder_usage are kept current by a trigger on files (see
+models.py), in the same transaction as every upload, delete and move, so
+reading usage or checking a quota is one primary-key lookup. reconcile()
+recomputes the totals from the files table and repairs any drift.
+
+Run `python usage.py [user_id ...]` to reconcile everyone or a few users.
+"""
+import os
+import sys
+from postgrest.exceptions import APIError
+from data_access import UNIQUE_VIOLATION, execute, table
+import sql_reads
+
+USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", 1024 * 1024 * 1024))  # 0 disables quotas
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 1000))
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _totals(row=None):
+    row = row or {}
+    return {"bytes_used": int(row.get("bytes_used") or 0), "file_count": int(row.get("file_count") or 0)}
+
+
+def get_usage(user_id):
+    if sql_reads.enabled():
+        return _totals(sql_reads.get_usage_row(user_id))
+    rows = execute(table('user_usage').select('bytes_used, file_count').eq('user_id', user_id)).data
+    return _totals(rows[0] if rows else None)
+
+
+def get_folder_usage(folder_ids):
+    """Usage of the files directly inside each folder, keyed by folder id."""
+    if not folder_ids:
+        return {}
+    rows = execute(
+        table('folder_usage').select('folder_id, bytes_used, file_count').in_('folder_id', list(folder_ids))
+    ).data or []
+    usage = {folder_id: _totals() for folder_id in folder_ids}
+    usage.update({row['folder_id']: _totals(row) for row in rows})
+    return usage
+
+
+def check_quota(user_id, incoming=None):
+    """Raise QuotaExceeded unless incoming more bytes fit in the user's quota.
+
+    Returns the bytes still available, or None when quotas are disabled, so
+    callers can also cap a stream whose length isn't known up front.
+    """
+    if not USER_QUOTA_BYTES:
+        return None
+    remaining = max(0, USER_QUOTA_BYTES - get_usage(user_id)["bytes_used"])
+    if remaining == 0 or (incoming is not None and incoming > remaining):
+        raise QuotaExceeded("Storage quota exceeded")
+    return remaining
+
+
+def _actual_usage(user_id):
+    """Scan the user's live files; returns (user totals, totals per folder)."""
+    user, folders = _totals(), {}
+    after = 0
+    while True:
+        rows = execute(
+            table('files').select('id, folder_id, file_size').eq('user_id', user_id).is_('deleted_at', 'null')
+            .gt('id', after).order('id').limit(RECONCILE_BATCH_SIZE)
+        ).data or []
+        for row in rows:
+            size = int(row.get('file_size') or 0)
+            user["bytes_used"] += size
+            user["file_count"] += 1
+            if row.get('folder_id') is not None:
+                folder = folders.setdefault(row['folder_id'], _totals())
+                folder["bytes_used"] += size
+                folder["file_count"] += 1
+        if len(rows) < RECONCILE_BATCH_SIZE:
+            return user, folders
+        after = rows[-1]['id']
+
+
+def _repair(table_name, key, key_value, stored, actual, extra=None):
+    """Write actual over stored, unless the row changed since it was read.
+
+    A concurrent upload moves the counters between our read and our write;
+    the compare-and-set then misses and the row is left for the next run.
+    """
+    if stored == actual:
+        return False
+    if stored is None:
+        if actual == _totals():
+            return False
+        try:
+            execute(table(table_name).insert({key: key_value, **(extra or {}), **actual}))
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+            return False
+        return True
+    updated = execute(
+        table(table_name).update(actual).eq(key, key_value)
+        .eq('bytes_used', stored["bytes_used"]).eq('file_count', stored["file_count"])
+    ).data
+    return bool(updated)
+
+
+def reconcile_user(user_id):
+    """Recompute one user's counters. Returns how many rows were repaired."""
+    # Read the counters before scanning files so the compare-and-set catches
+    # any upload that lands in between
+    stored_user = execute(table('user_usage').select('bytes_used, file_count').eq('user_id', user_id)).data
+    stored_folders = execute(
+        table('folder_usage').select('folder_id, bytes_used, file_count').eq('user_id', user_id)
+    ).data or []
+    actual_user, actual_folders = _actual_usage(user_id)
+
+    repaired = int(_repair('user_usage', 'user_id', user_id, _totals(stored_user[0]) if stored_user else None, actual_user))
+    stored_folders = {row['folder_id']: _totals(row) for row in stored_folders}
+    for folder_id in set(stored_folders) | set(actual_folders):
+        repaired += _repair('folder_usage', 'folder_id', folder_id, stored_folders.get(folder_id),
+                            actual_folders.get(folder_id, _totals()), extra={"user_id": user_id})
+    return repaired
+
+
+def reconcile(user_ids=None):
+    """Reconcile the given users, or every user when user_ids is None."""
+    report = {"users_checked": 0, "rows_repaired": 0}
+    if user_ids is None:
+        user_ids = _all_user_ids()
+    for user_id in user_ids:
+        report["users_checked"] += 1
+        report["rows_repaired"] += reconcile_user(user_id)
+    return report
+
+
+def _all_user_ids():
+    after = 0
+    while True:
+        rows = execute(table('users').select('id').gt('id', after).order('id').limit(RECONCILE_BATCH_SIZE)).data or []
+        for row in rows:
+            yield row['id']
+        if len(rows) < RECONCILE_BATCH_SIZE:
+            return
+        after = rows[-1]['id']
+
+
+if __name__ == "__main__":
+    print(reconcile(sys.argv[1:] or None))